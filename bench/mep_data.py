@@ -0,0 +1,113 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Synthetic MEP populations for the benchmark stand-ins.
+MEPs are spread over maintenance domains and associations like on a provider edge device:
+at most 50 remote MEPs per association and 20 associations per domain. Every 17th remote MEP
+reports a defect, so the checks also produce WARNING output.
+"""
+
+meps_per_ma = 50
+mas_per_md = 20
+
+
+def layout(count):
+	"""
+	Returns a list of (md, ma, local MEP, remote MEP) index tuples for count remote MEPs, starting at 1
+	"""
+	result = []
+	for i in range(count):
+		ma = i // meps_per_ma
+		md = ma // mas_per_md
+		result.append((md + 1, ma % mas_per_md + 1, 1000 + ma, i % meps_per_ma + 1))
+	return result
+
+
+def defective(i):
+	return i % 17 == 16
+
+
+def macAddress(i):
+	return '\x00\x1b\x21' + chr((i >> 16) & 0xff) + chr((i >> 8) & 0xff) + chr(i & 0xff)
+
+
+def dot1agTables(count):
+	"""
+	Returns the IEEE8021-CFM-MIB columns walked by the 8021ag driver, as a dictionary of
+	column name to a list of (index, type, value) rows. Types are 'int' and 'str'.
+	"""
+	tables = {}
+	meps = layout(count)
+	mds = sorted(set([md for (md, ma, local, rmep) in meps]))
+	mas = sorted(set([(md, ma) for (md, ma, local, rmep) in meps]))
+	tables['dot1agCfmMdName'] = [((md,), 'str', "MD%d" % md) for md in mds]
+	tables['dot1agCfmMdMdLevel'] = [((md,), 'int', md % 8) for md in mds]
+	tables['dot1agCfmMaNetName'] = [((md, ma), 'str', "MA%d_%d" % (md, ma)) for (md, ma) in mas]
+	tables['dot1agCfmMepDbRMepState'] = [(meps[i], 'int', defective(i) and 2 or 4) for i in range(count)]
+	tables['dot1agCfmMepDbMacAddress'] = [(meps[i], 'str', macAddress(i)) for i in range(count)]
+	tables['dot1agCfmMepDbRdi'] = [(meps[i], 'int', defective(i) and 1 or 2) for i in range(count)]
+	tables['dot1agCfmMepDbPortStatusTlv'] = [(meps[i], 'int', 2) for i in range(count)]
+	tables['dot1agCfmMepDbInterfaceStatusTlv'] = [(meps[i], 'int', 1) for i in range(count)]
+	return tables
+
+
+def cienaTables(count):
+	"""
+	Returns the WWP-LEOS-CFM-MIB columns walked by the ciena driver, in the format of dot1agTables.
+	Every association is a CFM service, remote MEPs are indexed by service and MEP.
+	"""
+	tables = {}
+	meps = layout(count)
+	services = sorted(set([(md, ma) for (md, ma, local, rmep) in meps]))
+	serviceIndex = dict([(services[i], i + 1) for i in range(len(services))])
+	def maid(md, ma):
+		name = "MD%d" % md
+		return '\x04' + chr(len(name)) + name + '\x02' + chr(len("MA%d" % ma)) + "MA%d" % ma
+	tables['wwpLeosCfmServiceCfmMAID'] = [((serviceIndex[s],), 'str', maid(*s)) for s in services]
+	tables['wwpLeosCfmServiceCfmMaintAssocName'] = [((serviceIndex[s],), 'str', "MA%d_%d" % s) for s in services]
+	tables['wwpLeosCfmServiceMdLevel'] = [((serviceIndex[s],), 'int', s[0] % 8) for s in services]
+	rows = [(serviceIndex[(md, ma)], rmep) for (md, ma, local, rmep) in meps]
+	tables['wwpLeosCfmRemoteMEPID'] = [(rows[i], 'int', rows[i][1]) for i in range(count)]
+	tables['wwpLeosCfmRemoteMEPFailureFlag'] = [(rows[i], 'int', 2) for i in range(count)]
+	tables['wwpLeosCfmRemoteMEPCCMErrorFlag'] = [(rows[i], 'int', 2) for i in range(count)]
+	tables['wwpLeosCfmRemoteMEPRDIErrorFlag'] = [(rows[i], 'int', defective(i) and 1 or 2) for i in range(count)]
+	tables['wwpLeosCfmRemoteMEPAdminState'] = [(rows[i], 'int', 2) for i in range(count)]
+	tables['wwpLeosCfmRemoteMEPOperState'] = [(rows[i], 'int', 2) for i in range(count)]
+	return tables
+
+
+def junosMEPs(count):
+	"""
+	Returns the remote MEPs served by the NETCONF stand-in as a list of dictionaries.
+	Remote MEP identifiers are unique on the device, every remote MEP has its own local MEP
+	and every association has its own SLA iterator profile.
+	"""
+	result = []
+	meps = layout(count)
+	for i in range(count):
+		(md, ma, local, rmep) = meps[i]
+		result.append({'id' : str(i + 1), 'md' : "MD%d" % md, 'ma' : "MA%d_%d" % (md, ma), 'level' : str(md % 8),
+				'local' : str(i % 8191 + 1), 'mac' : ':'.join(['%02x' % ord(c) for c in macAddress(i)]),
+				'state' : defective(i) and 'failed' or 'ok', 'rdi' : defective(i) and 'true' or 'false',
+				'iterator' : "dmm-%d-%d" % (md, ma), 'delay' : str(100 + i % 50), 'jitter' : str(i % 7)})
+	return result
@@ -0,0 +1,308 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+NETCONF over SSH stand-in for the benchmarks, answering the Junos RPCs used by check_cfm_state_juniper.py
+and juniper_dmm.py for synthetic remote MEPs from mep_data.py:
+get-cfm-interface, get-cfm-mep-database-information, get-config, get-configuration, get-cfm-iterator-statistics
+and get-system-uptime-information. Any username and password is accepted.
+Reply contents are not namespace qualified, like the replies the collectors are written against.
+Requires paramiko (installed with ncclient). Example: ./netconf_mock.py --meps 1000 --port 18300 --latency 5
+"""
+
+import time
+import socket
+import Queue
+import threading
+from optparse import OptionParser
+from xml.sax.saxutils import escape
+import xml.etree.cElementTree as ET
+
+import mep_data
+
+message_end = ']]>]]>'
+
+hello = ('<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>'
+	'<capability>urn:ietf:params:netconf:base:1.0</capability></capabilities>'
+	'<session-id>{0}</session-id></hello>')
+
+reply = ('<nc:rpc-reply xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0" '
+	'xmlns:junos="http://xml.juniper.net/junos/12.3R1/junos" message-id="{0}">{1}</nc:rpc-reply>')
+
+rpc_error = ('<nc:rpc-error><nc:error-type>protocol</nc:error-type><nc:error-tag>operation-not-supported</nc:error-tag>'
+	'<nc:error-severity>error</nc:error-severity><nc:error-message>{0}</nc:error-message></nc:rpc-error>')
+
+# Commit time reported for the configuration
+commit_seconds = 1380000000
+
+
+def localTag(tag):
+	return tag[tag.rfind('}')+1:]
+
+
+def childText(element, name):
+	for child in element:
+		if localTag(child.tag) == name: return (child.text or '').strip()
+	return None
+
+
+def element(name, text):
+	return "<{0}>{1}</{0}>".format(name, escape(text))
+
+
+class Device:
+	"""
+	Builds the replies of the synthetic device
+	"""
+	def __init__(self, meps):
+		self.meps = meps
+		self.index = dict([(mep['id'], mep) for mep in meps])
+
+	def cfmInterface(self, request):
+		return ('<cfm-interface-information><cfm-interface><cfm-remote-meps>' +
+			''.join(['<cfm-remote-mep>' + element('cfm-remote-mep-identifier', mep['id']) + '</cfm-remote-mep>' for mep in self.meps]) +
+			'</cfm-remote-meps></cfm-interface></cfm-interface-information>')
+
+	def mepDatabase(self, request):
+		mep = self.index.get(childText(request, 'remote-mep'))
+		if mep is None: return '<cfm-mep-database-information/>'
+		return ('<cfm-mep-database-information><cfm-mep-database>' +
+			element('cfm-maintenance-domain-name', mep['md']) + element('cfm-maintenance-association-name', mep['ma']) +
+			element('cfm-level', mep['level']) + element('cfm-local-mep-identifier', mep['local']) +
+			'<cfm-remote-mep-database-entry>' + element('cfm-remote-mep-identifier', mep['id']) +
+			element('cfm-remote-mep-mac-address', mep['mac']) + element('cfm-remote-mep-state', mep['state']) +
+			element('cfm-remote-mep-rdi', mep['rdi']) + element('cfm-remote-mep-port-status-tlv', '2') +
+			element('cfm-remote-mep-interface-status-tlv', '2') +
+			'</cfm-remote-mep-database-entry></cfm-mep-database></cfm-mep-database-information>')
+
+	def config(self, request):
+		domains = []
+		for mep in self.meps:
+			if len(domains) == 0 or domains[-1][0] != mep['md']: domains.append((mep['md'], mep['level'], []))
+			associations = domains[-1][2]
+			if len(associations) == 0 or associations[-1][0] != mep['ma']: associations.append((mep['ma'], []))
+			associations[-1][1].append(mep)
+		xml = '<data><configuration><protocols><oam><ethernet><connectivity-fault-management>'
+		for (md, level, associations) in domains:
+			xml += '<maintenance-domain>' + element('name', md) + element('level', level)
+			for (ma, meps) in associations:
+				xml += '<maintenance-association>' + element('name', ma)
+				for mep in meps:
+					xml += ('<mep>' + element('name', mep['local']) + '<remote-mep>' + element('name', mep['id']) +
+						'<sla-iterator-profile>' + element('name', mep['iterator']) + '</sla-iterator-profile></remote-mep></mep>')
+				xml += '</maintenance-association>'
+			xml += '</maintenance-domain>'
+		return xml + '</connectivity-fault-management></ethernet></oam></protocols></configuration></data>'
+
+	def configuration(self, request):
+		return ('<configuration junos:commit-seconds="{0}" junos:commit-user="bench">'
+			'<version>12.3R1</version></configuration>').format(commit_seconds)
+
+	def iteratorStatistics(self, request):
+		selection = {'iterator' : childText(request, 'sla-iterator'), 'md' : childText(request, 'maintenance-domain'),
+				'ma' : childText(request, 'maintenance-association'), 'local' : childText(request, 'local-mep'),
+				'id' : childText(request, 'remote-mep')}
+		xml = '<cfm-iterator-statistics-information>'
+		for mep in self.meps:
+			if len([key for key in selection if selection[key] is not None and selection[key] != mep[key]]) > 0: continue
+			xml += ('<cfm-iterator-statistics>' + element('cfm-iter-mep-summary', '') +
+				element('cfm-maintenance-domain-name', mep['md']) + element('cfm-maintenance-association-name', mep['ma']) +
+				element('cfm-mep-identifier', mep['local']) + element('cfm-remote-mep-identifier', mep['id']) +
+				element('cfm-iterator-name', mep['iterator']) + element('cfm-average-twoway-delay', mep['delay']) +
+				element('cfm-average-twoway-delay-variation', mep['jitter']) + '</cfm-iterator-statistics>')
+		return xml + '</cfm-iterator-statistics-information>'
+
+	def uptime(self, request):
+		return '<system-uptime-information><uptime-information><up-time>1 day</up-time></uptime-information></system-uptime-information>'
+
+	def answer(self, operation):
+		"""
+		Returns the reply contents of an RPC operation, or None when it is not supported
+		"""
+		handlers = {'get-cfm-interface' : self.cfmInterface,
+				'get-cfm-mep-database-information' : self.mepDatabase,
+				'get-config' : self.config,
+				'get-configuration' : self.configuration,
+				'get-cfm-iterator-statistics' : self.iteratorStatistics,
+				'get-system-uptime-information' : self.uptime,
+				'close-session' : lambda request: '<nc:ok/>'}
+		handler = handlers.get(localTag(operation.tag))
+		if handler is None: return None
+		return handler(operation)
+
+
+class Session(threading.Thread):
+	"""
+	NETCONF session on an SSH channel. Replies are sent by a reply thread latency seconds after their RPC
+	arrived, so RPCs pipelined by the client overlap their latency like on a real device.
+	"""
+	def __init__(self, server, channel, sessionId):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.server = server
+		self.channel = channel
+		self.sessionId = sessionId
+		self.replies = Queue.Queue()
+
+	def run(self):
+		buffer = ''
+		sender = threading.Thread(target=self.sendReplies)
+		sender.daemon = True
+		sender.start()
+		self.channel.sendall(hello.format(self.sessionId) + message_end)
+		try:
+			while True:
+				data = self.channel.recv(65536)
+				if len(data) == 0: break
+				buffer += data
+				while message_end in buffer:
+					(message, buffer) = buffer.split(message_end, 1)
+					if not self.handle(message): return
+		finally:
+			self.replies.put(None)
+			sender.join()
+			self.channel.close()
+
+	def sendReplies(self):
+		"""
+		Reply thread, sends the queued replies when they are due, in order of arrival of their RPCs
+		"""
+		while True:
+			entry = self.replies.get()
+			if entry is None: return
+			(due, text) = entry
+			delay = due - time.time()
+			if delay > 0: time.sleep(delay)
+			try:
+				self.channel.sendall(text)
+			except Exception:
+				return			# the client has gone away
+			self.server.count()
+
+	def handle(self, message):
+		"""
+		Queues the reply of an RPC message, returns False when the session is closed
+		"""
+		arrival = time.time()
+		root = ET.fromstring(message.strip())
+		if localTag(root.tag) != 'rpc': return True
+		operation = root[0]
+		contents = self.server.device.answer(operation)
+		if contents is None: contents = rpc_error.format(escape(localTag(operation.tag)))
+		self.replies.put((arrival + self.server.latency, reply.format(root.get('message-id', ''), contents) + message_end))
+		return localTag(operation.tag) != 'close-session'
+
+
+class NetconfServer:
+	"""
+	Accepts SSH connections and starts a NETCONF session for every netconf subsystem request
+	"""
+	def __init__(self, meps, latency, counter=None):
+		import paramiko
+		self.device = Device(meps)
+		self.latency = latency
+		self.counter = counter
+		self.rpcs = 0
+		self.lock = threading.Lock()
+		self.hostkey = paramiko.RSAKey.generate(2048)
+
+	def count(self):
+		with self.lock:
+			self.rpcs += 1
+			if self.counter is not None: self.counter.value = self.rpcs
+
+	def serve(self, port):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		sock.bind(('127.0.0.1', port))
+		sock.listen(100)
+		sessionId = 0
+		while True:
+			(client, address) = sock.accept()
+			sessionId += 1
+			threading.Thread(target=self.connection, args=(client, sessionId)).start()
+
+	def connection(self, client, sessionId):
+		import paramiko
+		server = self
+
+		class Interface(paramiko.ServerInterface):
+			def check_channel_request(self, kind, chanid):
+				return paramiko.OPEN_SUCCEEDED
+			def get_allowed_auths(self, username):
+				return 'password,publickey'
+			def check_auth_password(self, username, password):
+				return paramiko.AUTH_SUCCESSFUL
+			def check_auth_publickey(self, username, key):
+				return paramiko.AUTH_SUCCESSFUL
+			def check_channel_subsystem_request(self, channel, name):
+				if name != 'netconf': return False
+				Session(server, channel, sessionId).start()
+				return True
+
+		transport = paramiko.Transport(client)
+		transport.add_server_key(self.hostkey)
+		transport.start_server(server=Interface())
+
+
+def buildParser():
+	"""
+	Prepare parsing of command line options
+	"""
+	parser = OptionParser("usage: %prog [options]")
+
+	parser.add_option("--meps",
+			  dest="meps",
+			  default='100',
+			  help="number of remote MEPs, default = 100",
+			  metavar="COUNT")
+	parser.add_option("--port",
+			  dest="port",
+			  default='18300',
+			  help="TCP port to listen on, default = 18300",
+			  metavar="PORT")
+	parser.add_option("--latency",
+			  dest="latency",
+			  default='0',
+			  help="added response time in ms, default = 0",
+			  metavar="MS")
+	return parser
+
+
+def main():
+	"""
+	Main function for netconf_mock.py
+	"""
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+
+	server = NetconfServer(mep_data.junosMEPs(int(options.meps)), float(options.latency) / 1000.0)
+	print "Serving {0} remote MEPs on tcp/{1}".format(options.meps, options.port)
+	try:
+		server.serve(int(options.port))
+	except KeyboardInterrupt:
+		print "{0} RPCs".format(server.rpcs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Offline benchmark of the collectors. For every MEP count the SNMP agent and NETCONF stand-ins are started
+on localhost, every script is run once against them, and wall time, CPU time, peak RSS and the number of
+SNMP PDUs / varbinds or NETCONF RPCs are reported. Results can be saved as json and compared with an
+earlier run, the exit code is 1 when a script failed, or got slower or needed more requests than allowed by --tolerance.
+A script fails when it exits with another state than expected from the MEP data, or writes to stderr.
+Every run keeps its cache and host health state in a scratch directory of its own.
+Requires netsnmp, ncclient and lxml like the scripts themselves; the ciena script also needs snmptranslate
+with the WWP-LEOS-CFM-MIB. Example: ./run_bench.py --sizes 10,1000 --latency 1 --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import subprocess
+import multiprocessing
+from optparse import OptionParser
+
+import mep_data
+import snmp_agent
+import netconf_mock
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+icinga_dir = os.path.join(os.path.dirname(bench_dir), 'icinga')
+cacti_dir = os.path.join(os.path.dirname(bench_dir), 'cacti')
+
+# juniper_dmm.py reads its settings from module variables, the wrapper points them at the stand-in
+dmm_wrapper = """
+import sys
+sys.path.insert(0, {cacti!r})
+import juniper_dmm, netconf_broker
+juniper_dmm.netconf_auth = {auth!r}
+juniper_dmm.dmm_cache_ttl = 0
+juniper_dmm.cache_dir = {cache!r}
+juniper_dmm.health_dir = {health!r}
+netconf_broker.connectBroker = lambda host, path=None: None
+sys.argv = ['juniper_dmm.py', '127.0.0.1', 'query', 'delay']
+juniper_dmm.main()
+"""
+
+
+def startSNMPAgent(driver, meps, port, latency):
+	"""
+	Starts the SNMP agent stand-in in a child process, returns the process and its (pdus, varbinds) counters
+	"""
+	agent = snmp_agent.Agent(snmp_agent.buildTables(driver, meps), 'public', latency, 1472)
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sock.bind(('127.0.0.1', port))
+	counters = (multiprocessing.Value('l', 0), multiprocessing.Value('l', 0))
+	process = multiprocessing.Process(target=agent.serve, args=(sock, counters))
+	process.daemon = True
+	process.start()
+	sock.close()
+	return (process, counters)
+
+
+def startNetconfMock(meps, port, latency):
+	"""
+	Starts the NETCONF stand-in in a child process, returns the process and its RPC counter
+	"""
+	counter = multiprocessing.Value('l', 0)
+	server = netconf_mock.NetconfServer(mep_data.junosMEPs(meps), latency, counter)
+	process = multiprocessing.Process(target=server.serve, args=(port,))
+	process.daemon = True
+	process.start()
+	return (process, counter)
+
+
+def measure(command, expected=0):
+	"""
+	Runs command and returns its exit code, wall time, CPU time, peak RSS in kB, and whether it failed:
+	exited with another code than expected, or wrote to stderr. The last line on stderr is kept as error.
+	"""
+	errors = tempfile.TemporaryFile()
+	start = time.time()
+	process = subprocess.Popen(command, stdout=open(os.devnull, 'w'), stderr=errors)
+	(pid, status, usage) = os.wait4(process.pid, 0)
+	result = {'exit' : os.WEXITSTATUS(status), 'wall' : time.time() - start,
+		'cpu' : usage.ru_utime + usage.ru_stime, 'rss' : usage.ru_maxrss}
+	errors.seek(0)
+	lines = errors.read().strip().splitlines()
+	result['failed'] = result['exit'] != expected or len(lines) > 0
+	if len(lines) > 0: result['error'] = lines[-1]
+	return result
+
+
+def expectedState(meps):
+	"""
+	Returns the exit code of a check of all MEPs: WARNING when the data holds a defective MEP, otherwise OK
+	"""
+	return int(any([mep_data.defective(i) for i in range(meps)]))
+
+
+def stateOptions(workdir):
+	"""
+	Returns the options keeping the cache and host health state of a check in workdir
+	"""
+	return ['--cache-dir', os.path.join(workdir, 'cache'), '--health-dir', os.path.join(workdir, 'health')]
+
+
+def benchSNMP(options, driver, script, meps, latency):
+	(process, counters) = startSNMPAgent(driver, meps, int(options.snmp_port), latency)
+	workdir = tempfile.mkdtemp(prefix='bench-snmp-')
+	try:
+		time.sleep(0.2)
+		result = measure([options.python, os.path.join(icinga_dir, script), '-v', '2', '-c', 'public',
+				'-p', options.snmp_port, '-m', 'all'] + stateOptions(workdir) + ['127.0.0.1'], expectedState(meps))
+		result['requests'] = counters[0].value
+		result['varbinds'] = counters[1].value
+	finally:
+		process.terminate()
+		process.join()
+		subprocess.call(['rm', '-rf', workdir])
+	return result
+
+
+def benchNetconf(options, meps, latency, command, expected=0):
+	(process, counter) = startNetconfMock(meps, int(options.netconf_port), latency)
+	try:
+		time.sleep(0.5)
+		result = measure(command, expected)
+		result['requests'] = counter.value
+	finally:
+		process.terminate()
+		process.join()
+	return result
+
+
+def benchJuniper(options, meps, latency):
+	workdir = tempfile.mkdtemp(prefix='bench-juniper-')
+	try:
+		return benchNetconf(options, meps, latency, [options.python, os.path.join(icinga_dir, 'check_cfm_state_juniper.py'),
+					'-P', options.netconf_port, '-u', 'bench', '-p', 'bench', '-m', 'all'] + stateOptions(workdir) +
+					['127.0.0.1'], expectedState(meps))
+	finally:
+		subprocess.call(['rm', '-rf', workdir])
+
+
+def benchDMM(options, meps, latency):
+	workdir = tempfile.mkdtemp(prefix='bench-dmm-')
+	auth = os.path.join(workdir, 'netconf_auth')
+	with open(auth, 'w') as f:
+		f.write("127.0.0.1:bench:bench:{0}\n".format(options.netconf_port))
+	try:
+		wrapper = dmm_wrapper.format(cacti=cacti_dir, auth=auth, cache=workdir, health=os.path.join(workdir, 'health'))
+		return benchNetconf(options, meps, latency, [options.python, '-c', wrapper])
+	finally:
+		subprocess.call(['rm', '-rf', workdir])
+
+
+def cienaAvailable():
+	try:
+		snmp_agent.resolveColumn('wwpLeosCfmRemoteMEPID')
+	except ValueError:
+		return False
+	return True
+
+
+benchmarks = {	'8021ag' : lambda options, meps, latency: benchSNMP(options, '8021ag', 'check_cfm_state_8021ag.py', meps, latency),
+		'ciena' : lambda options, meps, latency: benchSNMP(options, 'ciena', 'check_cfm_state_ciena.py', meps, latency),
+		'juniper' : benchJuniper,
+		'dmm' : benchDMM}
+
+
+def regressions(results, baseline, tolerance):
+	"""
+	Returns a description of every result which is worse than the same result in baseline.
+	Runs which failed now or in the baseline are not compared, their timing is meaningless.
+	"""
+	found = []
+	for key in sorted(results):
+		if key not in baseline: continue
+		if results[key]['failed'] or baseline[key].get('failed', baseline[key]['exit'] != 0): continue
+		for field in ('wall', 'cpu', 'rss', 'requests'):
+			if results[key][field] > baseline[key][field] * (1 + tolerance) and results[key][field] - baseline[key][field] > 0.01:
+				found.append("{0} {1}: {2:.3f} > {3:.3f}".format(key, field, results[key][field], baseline[key][field]))
+	return found
+
+
+def buildParser():
+	"""
+	Prepare parsing of command line options
+	"""
+	parser = OptionParser("usage: %prog [options]")
+
+	parser.add_option("--sizes",
+			  dest="sizes",
+			  default='10,100,1000,10000',
+			  help="comma separated list of MEP counts, default = 10,100,1000,10000",
+			  metavar="LIST")
+	parser.add_option("--latency",
+			  dest="latency",
+			  default='0',
+			  help="added response time of the stand-ins in ms, default = 0",
+			  metavar="MS")
+	parser.add_option("--scripts",
+			  dest="scripts",
+			  default='8021ag,ciena,juniper,dmm',
+			  help="comma separated list of scripts to run: 8021ag, ciena, juniper and dmm, default = all",
+			  metavar="LIST")
+	parser.add_option("--python",
+			  dest="python",
+			  default=sys.executable,
+			  help="interpreter running the scripts, default = " + sys.executable,
+			  metavar="PYTHON")
+	parser.add_option("--snmp-port",
+			  dest="snmp_port",
+			  default='16161',
+			  help="UDP port of the SNMP agent stand-in, default = 16161",
+			  metavar="PORT")
+	parser.add_option("--netconf-port",
+			  dest="netconf_port",
+			  default='18300',
+			  help="TCP port of the NETCONF stand-in, default = 18300",
+			  metavar="PORT")
+	parser.add_option("--json",
+			  dest="json",
+			  default='',
+			  help="write the results to this file",
+			  metavar="FILE")
+	parser.add_option("--baseline",
+			  dest="baseline",
+			  default='',
+			  help="compare the results with this earlier --json file",
+			  metavar="FILE")
+	parser.add_option("--tolerance",
+			  dest="tolerance",
+			  default='0.2',
+			  help="allowed increase compared to the baseline, default = 0.2 (20%)",
+			  metavar="FRACTION")
+	return parser
+
+
+def main():
+	"""
+	Main function for run_bench.py
+	"""
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+
+	scripts = [script.strip() for script in options.scripts.split(',') if len(script.strip()) > 0]
+	for script in scripts:
+		if script not in benchmarks: parser.error("unknown script [" + script + "]")
+	if 'ciena' in scripts and not cienaAvailable():
+		print "Skipping ciena: snmptranslate can not resolve the WWP-LEOS-CFM-MIB columns"
+		scripts.remove('ciena')
+	latency = float(options.latency) / 1000.0
+
+	results = {}
+	print "{0:<10} {1:>6} {2:>5} {3:>9} {4:>9} {5:>9} {6:>9} {7:>9}".format(
+				'script', 'meps', 'exit', 'wall(s)', 'cpu(s)', 'rss(kB)', 'requests', 'varbinds')
+	for size in [int(size) for size in options.sizes.split(',')]:
+		for script in scripts:
+			result = benchmarks[script](options, size, latency)
+			results["{0}/{1}".format(script, size)] = result
+			print "{0:<10} {1:>6} {2:>5} {3:>9.3f} {4:>9.3f} {5:>9} {6:>9} {7:>9}".format(script, size, result['exit'],
+						result['wall'], result['cpu'], result['rss'], result['requests'], result.get('varbinds', '-'))
+			if result['failed']: print "FAILED {0}/{1}: {2}".format(script, size, result.get('error', 'unexpected exit code'))
+
+	if len(options.json) > 0:
+		with open(options.json, 'w') as f:
+			json.dump(results, f, indent=1, sort_keys=True)
+
+	if len(options.baseline) > 0:
+		with open(options.baseline, 'r') as f:
+			baseline = json.load(f)
+		found = regressions(results, baseline, float(options.tolerance))
+		for line in found:
+			print "REGRESSION " + line
+		if len(found) > 0: sys.exit(1)
+
+	if any([result['failed'] for result in results.values()]): sys.exit(1)
+
+if __name__ == "__main__":
+    main()
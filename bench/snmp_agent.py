@@ -0,0 +1,327 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+SNMP agent stand-in for the benchmarks, answering SNMPv1/v2c GET, GETNEXT and GETBULK requests
+for synthetic IEEE8021-CFM-MIB or WWP-LEOS-CFM-MIB tables from mep_data.py.
+Column names are resolved with snmptranslate when it is available, the IEEE8021-CFM-MIB columns are
+also known without it. GETBULK responses are truncated to whole rows fitting in --max-size bytes,
+like real agents do. Example: ./snmp_agent.py --driver 8021ag --meps 1000 --port 16161 --latency 2
+"""
+
+import sys
+import time
+import socket
+import struct
+import bisect
+import subprocess
+from optparse import OptionParser
+
+import mep_data
+
+# IEEE8021-CFM-MIB column OIDs, used when snmptranslate is not available
+dot1agColumns = {
+	'dot1agCfmMdName' : '1.3.111.2.802.1.1.8.1.5.2.1.3',
+	'dot1agCfmMdMdLevel' : '1.3.111.2.802.1.1.8.1.5.2.1.4',
+	'dot1agCfmMaNetName' : '1.3.111.2.802.1.1.8.1.6.1.1.3',
+	'dot1agCfmMepDbRMepState' : '1.3.111.2.802.1.1.8.1.7.3.1.2',
+	'dot1agCfmMepDbMacAddress' : '1.3.111.2.802.1.1.8.1.7.3.1.4',
+	'dot1agCfmMepDbRdi' : '1.3.111.2.802.1.1.8.1.7.3.1.5',
+	'dot1agCfmMepDbPortStatusTlv' : '1.3.111.2.802.1.1.8.1.7.3.1.6',
+	'dot1agCfmMepDbInterfaceStatusTlv' : '1.3.111.2.802.1.1.8.1.7.3.1.7'}
+
+# BER tags
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OBJECT_IDENTIFIER = 0x06
+SEQUENCE = 0x30
+NO_SUCH_OBJECT = 0x80
+END_OF_MIB_VIEW = 0x82
+
+GET = 0xa0
+GETNEXT = 0xa1
+RESPONSE = 0xa2
+GETBULK = 0xa5
+
+
+def encodeLength(length):
+	if length < 0x80:
+		return chr(length)
+	data = ''
+	while length > 0:
+		data = chr(length & 0xff) + data
+		length >>= 8
+	return chr(0x80 | len(data)) + data
+
+
+def encode(tag, data):
+	return chr(tag) + encodeLength(len(data)) + data
+
+
+def encodeInteger(value, tag=INTEGER):
+	data = ''
+	while True:
+		data = chr(value & 0xff) + data
+		value >>= 8
+		if (value == 0 and ord(data[0]) < 0x80) or (value == -1 and ord(data[0]) >= 0x80):
+			break
+	return encode(tag, data)
+
+
+def encodeOID(oid):
+	data = chr(oid[0] * 40 + oid[1])
+	for sub in oid[2:]:
+		chunk = chr(sub & 0x7f)
+		sub >>= 7
+		while sub > 0:
+			chunk = chr(0x80 | (sub & 0x7f)) + chunk
+			sub >>= 7
+		data = data + chunk
+	return encode(OBJECT_IDENTIFIER, data)
+
+
+def decode(data, offset=0):
+	"""
+	Returns the tag, contents and end offset of the BER element at offset
+	"""
+	tag = ord(data[offset])
+	length = ord(data[offset + 1])
+	offset = offset + 2
+	if length & 0x80:
+		size = length & 0x7f
+		length = 0
+		for c in data[offset:offset + size]:
+			length = (length << 8) | ord(c)
+		offset = offset + size
+	return (tag, data[offset:offset + length], offset + length)
+
+
+def decodeSequence(data):
+	"""
+	Returns the list of (tag, contents) elements in data
+	"""
+	result = []
+	offset = 0
+	while offset < len(data):
+		(tag, contents, offset) = decode(data, offset)
+		result.append((tag, contents))
+	return result
+
+
+def decodeInteger(data):
+	value = 0
+	for c in data:
+		value = (value << 8) | ord(c)
+	if len(data) > 0 and ord(data[0]) & 0x80:
+		value -= 1 << (8 * len(data))
+	return value
+
+
+def decodeOID(data):
+	oid = [ord(data[0]) // 40, ord(data[0]) % 40]
+	sub = 0
+	for c in data[1:]:
+		sub = (sub << 7) | (ord(c) & 0x7f)
+		if not ord(c) & 0x80:
+			oid.append(sub)
+			sub = 0
+	return tuple(oid)
+
+
+def resolveColumn(name):
+	"""
+	Returns the OID of a MIB column as a tuple
+	"""
+	try:
+		oid = subprocess.check_output(['snmptranslate', '-m', 'ALL', '-On', name], stderr=open('/dev/null', 'w')).strip()
+	except (OSError, subprocess.CalledProcessError):
+		if name not in dot1agColumns:
+			raise ValueError("Unable to resolve [" + name + "], snmptranslate with the vendor MIBs is required")
+		oid = dot1agColumns[name]
+	return tuple([int(sub) for sub in oid.strip('.').split('.')])
+
+
+class Agent:
+	"""
+	Serves a sorted list of OIDs with their encoded values
+	"""
+	def __init__(self, tables, community, latency, maxsize):
+		self.community = community
+		self.latency = latency
+		self.maxsize = maxsize
+		self.pdus = 0
+		self.varbinds = 0
+		entries = []
+		for column in tables:
+			root = resolveColumn(column)
+			for (index, type, value) in tables[column]:
+				if type == 'int':
+					encoded = encodeInteger(value)
+				else:
+					encoded = encode(OCTET_STRING, value)
+				entries.append((root + tuple(index), encoded))
+		entries.sort()
+		self.oids = [oid for (oid, value) in entries]
+		self.values = [value for (oid, value) in entries]
+
+	def get(self, oid):
+		i = bisect.bisect_left(self.oids, oid)
+		if i < len(self.oids) and self.oids[i] == oid:
+			return (oid, self.values[i])
+		return (oid, encode(NO_SUCH_OBJECT, ''))
+
+	def getnext(self, oid):
+		i = bisect.bisect_right(self.oids, oid)
+		if i < len(self.oids):
+			return (self.oids[i], self.values[i])
+		return (oid, encode(END_OF_MIB_VIEW, ''))
+
+	def respond(self, request):
+		"""
+		Returns the response message to a request message, or None when it is not understood
+		"""
+		(tag, message, end) = decode(request)
+		elements = decodeSequence(message)
+		version = decodeInteger(elements[0][1])
+		if elements[1][1] != self.community: return None
+		(pdutype, pdu) = elements[2]
+		fields = decodeSequence(pdu)
+		requestId = decodeInteger(fields[0][1])
+		oids = [decodeOID(decodeSequence(varbind)[0][1]) for (t, varbind) in decodeSequence(fields[3][1])]
+		self.pdus += 1
+
+		if pdutype == GET:
+			rows = [[self.get(oid) for oid in oids]]
+		elif pdutype == GETNEXT:
+			rows = [[self.getnext(oid) for oid in oids]]
+		elif pdutype == GETBULK and version > 0:
+			nonRepeaters = min(decodeInteger(fields[1][1]), len(oids))
+			maxRepetitions = decodeInteger(fields[2][1])
+			rows = [[self.getnext(oid) for oid in oids[:nonRepeaters]]]
+			last = oids[nonRepeaters:]
+			for repetition in range(max(1, maxRepetitions)):
+				if len(last) == 0: break
+				row = [self.getnext(oid) for oid in last]
+				rows.append(row)
+				last = [oid for (oid, value) in row]
+		else:
+			return None
+
+		# Add whole rows while the response fits
+		varbinds = ''
+		for row in rows:
+			encodedRow = ''.join([encode(SEQUENCE, encodeOID(oid) + value) for (oid, value) in row])
+			if len(varbinds) > 0 and len(varbinds) + len(encodedRow) > self.maxsize: break
+			varbinds = varbinds + encodedRow
+			self.varbinds += len(row)
+
+		response = encodeInteger(requestId) + encodeInteger(0) + encodeInteger(0) + encode(SEQUENCE, varbinds)
+		return encode(SEQUENCE, encodeInteger(version) + encode(OCTET_STRING, self.community) + encode(RESPONSE, response))
+
+	def serve(self, sock, counters=None):
+		"""
+		Answers requests on a bound UDP socket forever. counters, a pair of shared values, receives the
+		PDU and varbind counts.
+		"""
+		while True:
+			(request, address) = sock.recvfrom(65535)
+			try:
+				response = self.respond(request)
+			except (IndexError, ValueError):
+				continue
+			if response is None: continue
+			if self.latency > 0: time.sleep(self.latency)
+			sock.sendto(response, address)
+			if counters is not None:
+				counters[0].value = self.pdus
+				counters[1].value = self.varbinds
+
+
+def buildTables(driver, meps):
+	if driver == 'ciena':
+		return mep_data.cienaTables(meps)
+	return mep_data.dot1agTables(meps)
+
+
+def buildParser():
+	"""
+	Prepare parsing of command line options
+	"""
+	parser = OptionParser("usage: %prog [options]")
+
+	parser.add_option("--driver",
+			  type='choice',
+			  dest="driver",
+			  choices=['8021ag', 'ciena'],
+			  default='8021ag',
+			  help="MIB to serve, 8021ag or ciena, default = 8021ag",
+			  metavar="DRIVER")
+	parser.add_option("--meps",
+			  dest="meps",
+			  default='100',
+			  help="number of remote MEPs, default = 100",
+			  metavar="COUNT")
+	parser.add_option("--port",
+			  dest="port",
+			  default='16161',
+			  help="UDP port to listen on, default = 16161",
+			  metavar="PORT")
+	parser.add_option("--community",
+			  dest="community",
+			  default='public',
+			  help="SNMP community, default = public",
+			  metavar="COMMUNITY")
+	parser.add_option("--latency",
+			  dest="latency",
+			  default='0',
+			  help="added response time in ms, default = 0",
+			  metavar="MS")
+	parser.add_option("--max-size",
+			  dest="maxsize",
+			  default='1400',
+			  help="maximum size of the varbinds in a response, default = 1400",
+			  metavar="BYTES")
+	return parser
+
+
+def main():
+	"""
+	Main function for snmp_agent.py
+	"""
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+
+	agent = Agent(buildTables(options.driver, int(options.meps)), options.community,
+			float(options.latency) / 1000.0, int(options.maxsize))
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sock.bind(('127.0.0.1', int(options.port)))
+	print "Serving {0} OIDs on udp/{1}".format(len(agent.oids), options.port)
+	try:
+		agent.serve(sock)
+	except KeyboardInterrupt:
+		print "{0} PDUs, {1} varbinds".format(agent.pdus, agent.varbinds)
+
+if __name__ == "__main__":
+    main()
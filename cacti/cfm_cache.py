@@ -0,0 +1 @@
+../icinga/cfm_cache.py
\ No newline at end of file
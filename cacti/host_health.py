@@ -0,0 +1 @@
+../icinga/host_health.py
\ No newline at end of file
@@ -23,41 +23,202 @@
 
 """
 Python script used for retrieving eth-oam data from Junos devices using netconf
+Usage: juniper_dmm.py <host> index | query <field> | get <field> <index>
+       juniper_dmm.py server  (reads the same commands from stdin, one per line, and stays resident)
 """
 
+import os
 import sys
+import time
 from optparse import OptionParser
 from collections import defaultdict
 from ncclient import manager
 from ncclient.xml_ import *
 from ncclient import transport
-import xml.etree.ElementTree as ET
+from ncclient.operations.rpc import RPCError
+from lxml import etree
+import junos_xml
+import netconf_broker
+import cfm_cache
+import host_health
+import phase_timing
 
 # Location of NETconf Authentication file:
 netconf_auth="/usr/share/cacti/resource/script_queries/netconf_auth"
 
-def buildDMMDictionary(host,port,username,password):
+# Time in seconds the DMM statistics of a host are served from cache (0 = disable caching).
+# Keep this below the Cacti polling interval, so every poll cycle fetches the device once.
+dmm_cache_ttl=240
+
+# Directory holding the cached DMM statistics and MEP configuration per host:
+cache_dir="/var/tmp/juniper_dmm"
+
+# Retrieve the statistics of all MEPs with one call per SLA iterator profile, instead of one call per MEP.
+# MEPs missing from the bulk reply are still retrieved one by one.
+dmm_bulk_statistics=True
+
+# Append the time spent per phase and the RPC count of every command to this file as a JSON line (empty = disabled)
+timing_log=""
+
+# Profile the command with cProfile and write the statistics to this file (empty = disabled)
+profile_file=""
+
+# Directory holding the learned connect timeouts and circuit breaker state per host (see host_health.py)
+health_dir="/var/tmp/juniper_dmm/health"
+
+# Connect timeout in seconds for hosts without known connect times, and the limits of learned timeouts
+connect_timeout_initial=15
+connect_timeout_min=3
+connect_timeout_max=30
+
+# Set by the server mode, NETconf sessions and DMM dictionaries are kept between commands
+persistent=False
+sessions={}
+memoryCache={}
+
+def healthOptions():
 	"""
-	This function performs Netconf calls to generate a dictionary of the RemoteMEP table from the Ciena MIB.
-	Some entries are parsed before the dictionary is returned.
+	Returns the retry budget and circuit breaker settings of host_health, with their defaults
 	"""
-	DMMlist= defaultdict(dict)
+	parser = OptionParser()
+	host_health.addOptions(parser)
+	(options, args) = parser.parse_args([])
+	options.health_dir = health_dir
+	return options
+
+def connectNetconf(host,port,username,password):
+	"""
+	Returns a NETconf session for host. A session held by a running netconf_broker.py is used when available,
+	otherwise a new session is set up. As in the Icinga checks, the connect timeout is learned per host,
+	failed connects are retried as long as the retry budget allows, and a host which stopped responding
+	is only tried again when its circuit breaker lets a probe through.
+	"""
+	with phase_timing.phase('connect'):
+		conn = netconf_broker.connectBroker(host)
+	if conn is not None:
+		return conn
+
+	options = healthOptions()
+	reason = host_health.allowPoll(options, host)
+	if reason is not None:
+		print reason
+		quit()
 
 	# Try to connect to the remote host
 	# Warning: Host keys in known_host file are not verfied by default! (adjust hostkey_verify=True to override)
+	budget = int(options.retry_budget)
+	while True:
+		timeout = host_health.timeout(options, host, 'netconf', connect_timeout_initial, connect_timeout_min, connect_timeout_max)
+		start = time.time()
+		try:
+			with phase_timing.phase('connect'):
+				conn = manager.connect(host=host, port=port, username=username, password=password,hostkey_verify=False,
+							timeout=timeout)
+			host_health.addSample(options, host, 'netconf', time.time() - start)
+			host_health.recordPoll(options, host, True)
+			return conn
+		except transport.AuthenticationError:
+			print "unable to connect [" + host + "], wrong username or password?"
+			quit()
+		except transport.SSHUnknownHostError:
+			print "Unknown host key for [" + host + "]"
+			quit()
+		except transport.SSHError:
+			if budget <= 0:
+				host_health.recordPoll(options, host, False)
+				print "SSH unreachable for [" + host + "]"
+				quit()
+			budget -= 1
+			phase_timing.count('retries')
+
+def getSession(host,port,username,password):
+	"""
+	Returns a NETconf session for host, sessions are reused in server mode
+	"""
+	if not persistent:
+		return connectNetconf(host,port,username,password)
+	if host not in sessions or not getattr(sessions[host], 'connected', True):
+		sessions[host] = connectNetconf(host,port,username,password)
+	return sessions[host]
+
+def closeSession(host):
+	"""
+	Drops the kept session of host, for instance after a failure
+	"""
+	conn = sessions.pop(host, None)
+	if conn is None: return
 	try:
-		conn = manager.connect(host=host, port=port, username=username, password=password,hostkey_verify=False) 
-	except transport.AuthenticationError:
-		print "unable to connect [" + host + "], wrong username or password?"
-		quit()
-	except transport.SSHUnknownHostError:
-		print "Unknown host key for [" + host + "]"
-		quit()
-	except transport.SSHError:
-		print "SSH unreachable for [" + host + "]"
-		quit()
-	
+		conn.close_session()
+	except Exception:
+		pass
+
+# Precompiled paths into the CFM configuration returned by get_config
+xpMaintenanceDomains = etree.XPath('data/configuration/protocols/oam/ethernet/connectivity-fault-management/maintenance-domain')
+xpAssociations = etree.XPath('maintenance-association')
+xpMEPs = etree.XPath('mep')
+xpName = etree.XPath('string(name)')
+xpRemoteMEP = etree.XPath('string(remote-mep/name)')
+xpIterator = etree.XPath('string(remote-mep/sla-iterator-profile/name)')
+
+# Commit time attribute of the configuration returned by get-configuration, with or without namespaces
+xpCommitSeconds = etree.XPath("string(//*[local-name()='configuration']/@*[local-name()='commit-seconds'])")
+
+# Elements of the get-cfm-iterator-statistics reply, and the DMM list field they are stored in
+DMMStatisticsFields = {	"cfm-average-twoway-delay" : "delay",
+			"cfm-average-twoway-delay-variation" : "jitter"}
+
+# Elements identifying the MEP the statistics in a bulk get-cfm-iterator-statistics reply belong to
+DMMIdentifierFields = {	"cfm-maintenance-domain-name" : "md",
+			"cfm-maintenance-association-name" : "ma",
+			"cfm-local-mep-identifier" : "local-mep",
+			"cfm-mep-identifier" : "local-mep",
+			"cfm-remote-mep-identifier" : "remote-mep"}
+
+def updateDMMStatistics(DMMlist, dmmresult):
+	"""
+	Adds the delay and jitter found in a get-cfm-iterator-statistics reply covering multiple MEPs to the DMM list.
+	The reply is parsed in document order, so statistics are mapped to the md/ma/local-mep/remote-mep
+	identifiers preceding them.
+	"""
+	DMMIndex = {}
+	for dmm in DMMlist:
+		DMMIndex[(DMMlist[dmm].get('md'), DMMlist[dmm].get('ma'), DMMlist[dmm].get('local-mep'), DMMlist[dmm].get('remote-mep'))] = dmm
+
+	current = {}
+	def handler(field, text):
+		if field in DMMStatisticsFields.values():
+			dmm = DMMIndex.get((current.get('md'), current.get('ma'), current.get('local-mep'), current.get('remote-mep')))
+			if dmm is not None: DMMlist[dmm].update({field:text})
+		else:
+			current[field] = text
 
+	dispatch = dict(DMMIdentifierFields)
+	dispatch.update(DMMStatisticsFields)
+	with phase_timing.phase('parse'):
+		junos_xml.walkReply(dmmresult, dispatch, handler)
+
+def commitRevision(conn):
+	"""
+	Returns the time of the last commit of the device configuration, used to detect configuration changes
+	with a small RPC. Returns None when the device does not report it.
+	"""
+	request = new_ele('get-configuration', {'database':'committed'})
+	sub_ele(sub_ele(request, 'configuration'), 'version')
+	try:
+		with phase_timing.phase('rpc_get-configuration'):
+			reply = conn.dispatch(request)
+	except (RPCError, netconf_broker.BrokerError):
+		return None
+	phase_timing.count('rpcs')
+	root = junos_xml.replyRoot(reply)
+	if root is None: root = reply.xpath('/*')[0]
+	return xpCommitSeconds(root) or None
+
+def buildMEPList(conn):
+	"""
+	Retrieves the CFM configuration of the device, and returns the MEPs with a sla-iterator profile
+	together with their md, ma, remote-mep and sla-iterator settings.
+	"""
 	# Get CFM related information using netconf call
 	root_filter = new_ele('filter')
  	config_filter = sub_ele(root_filter, 'configuration')
@@ -65,45 +226,65 @@ def buildDMMDictionary(host,port,username,password):
 	oam_filter = sub_ele(protocol_filter, 'oam')
 	ethernet_filter = sub_ele(oam_filter, 'ethernet')
 	cfm_filter = sub_ele(ethernet_filter, 'connectivity-fault-management')
-	filtered_result = conn.get_config('running', filter=root_filter)
-	iterators = filtered_result.xpath('data/configuration/protocols/oam/ethernet/connectivity-fault-management/performance-monitoring/sla-iterator-profiles')
-	for i in iterators:
-		if i.tag == "sla-iterator-profiles":
-			itername = i.xpath('name')[0].text
-			itertype = i.xpath('measurement-type')[0].text
-			
-	domains = filtered_result.xpath('data/configuration/protocols/oam/ethernet/connectivity-fault-management/maintenance-domain')	
-	
-	# Retrieve all Ethernet OAM configuration settings by iterating through the configuration tree
-	for i in domains:
-		remotemepid=""
-		remotemepiter=""
-		mdname=""
-		maname=""
-		mepid=""
-
-		if i.tag == "maintenance-domain":					# Find Maintenance Domains
-			mdname = i.xpath('name')[0].text				
-			matree = i.xpath('maintenance-association')
-			for ma in matree:	
-				if len(ma.xpath('name')) > 0 :				# Find Maintenance Associations
-					maname = ma.xpath('name')[0].text
-				meptree = ma.xpath('mep')					
-				for mep in meptree:							
-					if len(mep.xpath('name')) > 0:			# Find Local MEPs
-						mepid = mep.xpath('name')[0].text	
-					if len(mep.xpath('remote-mep/name')) > 0 :			# Find Remote MEPs
-						remotemepid = mep.xpath('remote-mep/name')[0].text
-					if len(mep.xpath('remote-mep/sla-iterator-profile/name')) > 0 :	# Find SLA iterators
-						remotemepiter = mep.xpath('remote-mep/sla-iterator-profile/name')[0].text
-						DMMlist[mepid].update({"local-mep":mepid})					# Only add CFM information to the list when there is a sla-iterator profile
-						DMMlist[mepid].update({"remote-mep":remotemepid})
-						DMMlist[mepid].update({"md":mdname})
-						DMMlist[mepid].update({"ma":maname})
-						DMMlist[mepid].update({"sla-iterator":remotemepiter})
-
-	# Iterate through the list of MEPs with DMM monitoring configured, and retrieve the DMM statistics using a netconf call. 
+	with phase_timing.phase('rpc_get-config'):
+		filtered_result = conn.get_config('running', filter=root_filter)
+	phase_timing.count('rpcs')
+	with phase_timing.phase('parse'):
+		root = junos_xml.replyRoot(filtered_result)
+		if root is None: root = filtered_result.xpath('/*')[0]
+
+		MEPlist = defaultdict(dict)
+
+		# Retrieve all Ethernet OAM configuration settings by iterating through the configuration tree
+		for i in xpMaintenanceDomains(root):						# Find Maintenance Domains
+			mdname = xpName(i)
+			maname = ""
+			mepid = ""
+			remotemepid = ""
+			for ma in xpAssociations(i):
+				maname = xpName(ma) or maname					# Find Maintenance Associations
+				for mep in xpMEPs(ma):
+					mepid = xpName(mep) or mepid					# Find Local MEPs
+					remotemepid = xpRemoteMEP(mep) or remotemepid			# Find Remote MEPs
+					remotemepiter = xpIterator(mep)					# Find SLA iterators
+					if len(remotemepiter) > 0:
+						MEPlist[mepid].update({"local-mep":mepid})		# Only add CFM information to the list when there is a sla-iterator profile
+						MEPlist[mepid].update({"remote-mep":remotemepid})
+						MEPlist[mepid].update({"md":mdname})
+						MEPlist[mepid].update({"ma":maname})
+						MEPlist[mepid].update({"sla-iterator":remotemepiter})
+
+	return MEPlist
+
+def buildDMMDictionary(host,port,username,password):
+	"""
+	This function performs Netconf calls to generate a dictionary of the RemoteMEP table from the Ciena MIB.
+	Some entries are parsed before the dictionary is returned.
+	"""
+	conn = getSession(host,port,username,password)
+
+	# The CFM configuration is only retrieved and parsed again when the device configuration was committed
+	# since it was cached.
+	MEPlist = cfm_cache.revisionFetch(cache_dir, host, 'meps', commitRevision(conn), lambda: buildMEPList(conn))
+	DMMlist = defaultdict(dict, MEPlist)
+
+	# Retrieve the DMM statistics of all MEPs sharing a SLA iterator profile using a single netconf call.
+	if dmm_bulk_statistics:
+		for itername in set([DMMlist[dmm].get('sla-iterator') for dmm in DMMlist]):
+			dmmstats = new_ele('get-cfm-iterator-statistics')
+			sub_ele(dmmstats,'sla-iterator').text = itername
+			try:
+				with phase_timing.phase('rpc_get-cfm-iterator-statistics'):
+					dmmresult = conn.dispatch(dmmstats)
+			except (RPCError, netconf_broker.BrokerError):
+				continue			# bulk request not supported, the per MEP calls below take over
+			phase_timing.count('rpcs')
+			updateDMMStatistics(DMMlist, dmmresult)
+
+	# Iterate through the list of MEPs with DMM monitoring configured which are missing from the bulk replies,
+	# and retrieve the DMM statistics using a netconf call. 
 	for dmm in DMMlist:
+		if 'delay' in DMMlist[dmm]: continue
 
 		dmmstats = new_ele('get-cfm-iterator-statistics')
 		sub_ele(dmmstats,'sla-iterator').text = DMMlist[dmm].get('sla-iterator')
@@ -111,86 +292,138 @@ def buildDMMDictionary(host,port,username,password):
 		sub_ele(dmmstats,'maintenance-association').text = DMMlist[dmm].get('ma')
 		sub_ele(dmmstats,'local-mep').text = DMMlist[dmm].get('local-mep')
 		sub_ele(dmmstats,'remote-mep').text = DMMlist[dmm].get('remote-mep')
-		dmmresult = conn.dispatch(dmmstats).tostring
-		DMMTree = ET.fromstring(dmmresult)
+		with phase_timing.phase('rpc_get-cfm-iterator-statistics'):
+			dmmresult = conn.dispatch(dmmstats)
+		phase_timing.count('rpcs')
 		
 		# Add the results to the list entry.
-		for elem in DMMTree.iter():
-			if elem.tag == "cfm-average-twoway-delay": DMMlist[dmm].update({"delay":elem.text})
-			if elem.tag == "cfm-average-twoway-delay-variation": DMMlist[dmm].update({"jitter":elem.text})
+		with phase_timing.phase('parse'):
+			DMMlist[dmm].update(junos_xml.replyFields(dmmresult, DMMStatisticsFields))
 		 
 	return DMMlist	
 	
-def main():
+def answerCommand(DMMDict, args):
 	"""
-	Main function for juniper_dmm.py 
+	Returns the output lines of a Cacti index, query or get command (args without the hostname)
 	"""
 	# Define Cacti output delimeter
 	output_delimeter = "!"	
-
-	# Read and parse the netconf_auth file
-	hostfound = False
-	hostname = sys.argv[1]
-	hosts=[]
-	with open(netconf_auth, 'r') as f:
-		read_data = f.read()
-	f.closed
-	
-	logininfo = read_data.split('\n')
-	for line in logininfo:
-		login = line.split(':')
-		hosts.append(login)
-	
-	for host in hosts: 
-		if host[0] == hostname:
-			hostfound = True
-			user=host[1]
-			passwd=host[2]
-			if len(host[3]) == 0: port = 22
-			if len(host[3]) > 0: port = host[3]
-
-	if hostfound == False:
-		print "No NETconf authentication info found for [" + hostname + "]"
-		quit()
-
-	
-	#Build teh dictionary of DDM statistics, making use of the command line options
-	DMMDict = buildDMMDictionary(sys.argv[1],port,user,passwd)
+	lines = []
 
 	# Cacti requires index, query and get commands to be implemented as command line options, to be able to retrieve data from scripts
 	
 	# Implement index command
-	if sys.argv[2] == 'index':
+	if args[0] == 'index':
 		for dmm in DMMDict:
-			print dmm
+			lines.append(dmm)
 
 	# Implement query command
-	if sys.argv[2] == 'query' and sys.argv[3] == 'index':
+	if args[0] == 'query' and args[1] == 'index':
 		for dmm in DMMDict:
-			print dmm + output_delimeter + DMMDict[dmm].get('local-mep')
+			lines.append(dmm + output_delimeter + DMMDict[dmm].get('local-mep'))
 
-	if sys.argv[2] == 'query' and sys.argv[3] == 'delay':
+	if args[0] == 'query' and args[1] == 'delay':
 		for dmm in DMMDict:
-			print dmm + output_delimeter + DMMDict[dmm].get('delay')
+			lines.append(dmm + output_delimeter + DMMDict[dmm].get('delay'))
 
-	if sys.argv[2] == 'query' and sys.argv[3] == 'jitter':
+	if args[0] == 'query' and args[1] == 'jitter':
 		for dmm in DMMDict:
-			print dmm + output_delimeter + DMMDict[dmm].get('jitter')
+			lines.append(dmm + output_delimeter + DMMDict[dmm].get('jitter'))
 
-	if sys.argv[2] == 'query' and sys.argv[3] == 'mepinfo':
+	if args[0] == 'query' and args[1] == 'mepinfo':
 		for dmm in DMMDict:
-			print dmm + output_delimeter + DMMDict[dmm].get('md') + "_" + DMMDict[dmm].get('ma') + "_" + DMMDict[dmm].get('local-mep') + "_" + DMMDict[dmm].get('remote-mep')
+			lines.append(dmm + output_delimeter + DMMDict[dmm].get('md') + "_" + DMMDict[dmm].get('ma') + "_" + DMMDict[dmm].get('local-mep') + "_" + DMMDict[dmm].get('remote-mep'))
 
 	# Implement get command
-	if sys.argv[2] == 'get' and sys.argv[3] == 'delay':
-		index = sys.argv[4]
+	if args[0] == 'get' and args[1] == 'delay':
+		index = args[2]
 		if index in DMMDict.keys():
-			print DMMDict[index].get('delay')
+			lines.append(DMMDict[index].get('delay'))
 	
-	if sys.argv[2] == 'get' and sys.argv[3] == 'jitter':
-		index = sys.argv[4]
+	if args[0] == 'get' and args[1] == 'jitter':
+		index = args[2]
 		if index in DMMDict.keys():
-			print DMMDict[index].get('jitter')
+			lines.append(DMMDict[index].get('jitter'))
+	return lines
+
+def fetchDMMDictionary(hostname, hosts):
+	"""
+	Returns the DMM dictionary of hostname, from the in-memory cache of the server mode, the on-disk cache or the device
+	"""
+	if hostname not in hosts:
+		print "No NETconf authentication info found for [" + hostname + "]"
+		quit()
+	(user, passwd, port) = hosts[hostname]
+
+	if hostname in memoryCache and time.time() - memoryCache[hostname][0] < dmm_cache_ttl:
+		return memoryCache[hostname][1]
+
+	#Build teh dictionary of DDM statistics, making use of the command line options
+	fetched = time.time()
+	DMMDict = cfm_cache.cachedFetch(cache_dir, hostname, 'dmm', dmm_cache_ttl, lambda: buildDMMDictionary(hostname,port,user,passwd))
+	if persistent:
+		# Statistics served from the on-disk cache are as old as the cache file, not fetched just now
+		try:
+			fetched = min(fetched, os.path.getmtime(cfm_cache.cachePath(cache_dir, hostname, 'dmm')))
+		except OSError:
+			pass
+		memoryCache[hostname] = (fetched, DMMDict)
+	return DMMDict
+
+def serve(input, output):
+	"""
+	Server mode: answers "<host> index", "<host> query <field>" and "<host> get <field> <index>" commands
+	read from input, one per line, until end of input or "quit". A get command is answered with exactly one line,
+	index and query commands are answered with their lines followed by an empty line.
+	NETconf sessions and DMM dictionaries are kept between commands.
+	"""
+	global persistent
+	persistent = True
+	hosts = netconf_broker.readNetconfAuth(netconf_auth)
+
+	# Messages of failed commands go to stderr, stdout only carries the answers
+	sys.stdout = sys.stderr
+
+	for line in iter(input.readline, ''):
+		args = line.split()
+		if len(args) == 0: continue
+		if args[0] == 'quit': break
+
+		lines = []
+		phase_timing.reset()
+		try:
+			if args[0] not in hosts: hosts = netconf_broker.readNetconfAuth(netconf_auth)	# pick up hosts added since startup
+			lines = answerCommand(fetchDMMDictionary(args[0], hosts), args[1:])
+		except (Exception, SystemExit), e:
+			print "command [" + line.strip() + "] failed: " + str(e)
+			closeSession(args[0])
+		if len(timing_log) > 0: phase_timing.logRun(timing_log, "juniper_dmm.py", args[0], None, command=' '.join(args[1:]))
+
+		if len(args) > 1 and args[1] == 'get':
+			lines = (lines + [''])[:1]
+		else:
+			lines.append('')
+		output.write('\n'.join([str(l) for l in lines]) + '\n')
+		output.flush()
+
+def main():
+	"""
+	Main function for juniper_dmm.py 
+	"""
+	if sys.argv[1] == 'server':
+		serve(sys.stdin, sys.stdout)
+		return
+
+	# Read and parse the netconf_auth file
+	hostname = sys.argv[1]
+	hosts = netconf_broker.readNetconfAuth(netconf_auth)
+
+	phase_timing.start(profile_file)
+	DMMDict = fetchDMMDictionary(hostname, hosts)
+	for line in answerCommand(DMMDict, sys.argv[2:]):
+		print line
+	if len(timing_log) > 0: phase_timing.logRun(timing_log, "juniper_dmm.py", hostname, None, command=' '.join(sys.argv[2:]))
+	phase_timing.stopProfile(profile_file)
 
 if __name__ == "__main__":
     main()
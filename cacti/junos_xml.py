@@ -0,0 +1 @@
+../icinga/junos_xml.py
\ No newline at end of file
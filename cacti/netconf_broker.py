@@ -0,0 +1,323 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+NETconf session broker for juniper_dmm.py
+The broker holds one authenticated ncclient session per device listed in the netconf_auth file,
+and executes RPCs on behalf of local clients connecting to a unix socket. Only the read-only RPCs used by
+juniper_dmm.py are executed. Idle sessions are kept alive and re-established when they fail.
+When the broker is not running, juniper_dmm.py connects directly.
+Example: ./netconf_broker.py -s /var/run/cacti/netconf_broker.sock -k 60
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import SocketServer
+from optparse import OptionParser
+
+# Location of NETconf Authentication file:
+netconf_auth="/usr/share/cacti/resource/script_queries/netconf_auth"
+
+# Location of the broker socket:
+broker_socket="/var/run/cacti/netconf_broker.sock"
+
+# RPCs executed on behalf of clients with the dispatch operation, all of them read-only
+allowed_rpcs = set(['get-configuration', 'get-cfm-iterator-statistics'])
+
+
+class BrokerError(Exception):
+	"""
+	Raised by a BrokerConnection when the broker reports a failed RPC
+	"""
+	pass
+
+
+def readNetconfAuth(filename):
+	"""
+	Reads the netconf_auth file (host:username:password:port per line) and returns a dictionary
+	of (username, password, port) tuples indexed by host. An empty port defaults to 22.
+	"""
+	hosts = {}
+	with open(filename, 'r') as f:
+		read_data = f.read()
+
+	for line in read_data.split('\n'):
+		login = line.split(':')
+		if len(login) < 3 or len(login[0]) == 0: continue
+		port = 22
+		if len(login) > 3 and len(login[3]) > 0: port = int(login[3])
+		hosts[login[0]] = (login[1], login[2], port)
+	return hosts
+
+
+# Client side, used by juniper_dmm.py
+
+class BrokerReply:
+	"""
+	Reply of a brokered RPC, offering the .tostring and .xpath() interface of the ncclient replies
+	"""
+	def __init__(self, xml):
+		self.tostring = xml
+		self._root = None
+
+	def xpath(self, path):
+		from lxml import etree
+		if self._root is None:
+			self._root = etree.fromstring(self.tostring)
+		return self._root.xpath(path)
+
+
+class BrokerConnection:
+	"""
+	Stand-in for an ncclient manager, forwarding get_config and dispatch calls to the broker
+	"""
+	def __init__(self, sock, host):
+		self.sock = sock
+		self.host = host
+		self.rfile = sock.makefile('r')
+
+	def _call(self, request):
+		request['host'] = self.host
+		self.sock.sendall(json.dumps(request) + '\n')
+		line = self.rfile.readline()
+		if len(line) == 0:
+			raise BrokerError("connection to broker lost")
+		answer = json.loads(line)
+		if 'error' in answer:
+			raise BrokerError(answer['error'])
+		return answer.get('reply')
+
+	def get_config(self, source, filter=None):
+		from ncclient.xml_ import to_xml
+		request = {'op' : 'get_config', 'source' : source}
+		if filter is not None: request['filter'] = to_xml(filter)
+		return BrokerReply(self._call(request))
+
+	def dispatch(self, rpc_command):
+		from ncclient.xml_ import to_xml
+		return BrokerReply(self._call({'op' : 'dispatch', 'rpc' : to_xml(rpc_command)}))
+
+	def close_session(self):
+		self.rfile.close()
+		self.sock.close()
+
+
+def connectBroker(host, path=broker_socket):
+	"""
+	Returns a BrokerConnection for host when a broker is listening on path and holds (or can open)
+	a session for this host, otherwise None so the caller can fall back to a direct connection.
+	"""
+	if not os.path.exists(path):
+		return None
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.connect(path)
+		conn = BrokerConnection(sock, host)
+		conn._call({'op' : 'open'})
+	except (socket.error, BrokerError, ValueError):
+		sock.close()
+		return None
+	return conn
+
+
+# Server side
+
+class SessionPool:
+	"""
+	Holds one ncclient session per host. Calls for the same host are serialized,
+	failed sessions are reconnected once before an error is returned to the client.
+	"""
+	def __init__(self, authfile):
+		self.authfile = authfile
+		self.auth = readNetconfAuth(authfile)
+		self.sessions = {}
+		self.lastUsed = {}
+		self.locks = {}
+		self.poollock = threading.Lock()
+
+	def _lock(self, host):
+		with self.poollock:
+			if host not in self.locks: self.locks[host] = threading.Lock()
+			return self.locks[host]
+
+	def _connect(self, host):
+		from ncclient import manager
+		if host not in self.auth:
+			self.auth = readNetconfAuth(self.authfile)	# pick up hosts added since startup
+		if host not in self.auth:
+			raise BrokerError("No NETconf authentication info found for [" + host + "]")
+		user, passwd, port = self.auth[host]
+		# Warning: Host keys in known_host file are not verfied by default! (adjust hostkey_verify=True to override)
+		conn = manager.connect(host=host, port=port, username=user, password=passwd, hostkey_verify=False)
+		self.sessions[host] = conn
+		return conn
+
+	def _drop(self, host):
+		conn = self.sessions.pop(host, None)
+		if conn is None: return
+		try:
+			conn.close_session()
+		except Exception:
+			pass
+
+	def _session(self, host):
+		conn = self.sessions.get(host)
+		if conn is None or not conn.connected:
+			self._drop(host)
+			conn = self._connect(host)
+		return conn
+
+	def _execute(self, conn, request):
+		from ncclient.xml_ import to_ele
+		if request['op'] == 'open':
+			return None
+		if request['op'] == 'get_config':
+			filter = None
+			if 'filter' in request: filter = to_ele(request['filter'])
+			return conn.get_config(request.get('source', 'running'), filter=filter).tostring
+		if request['op'] == 'dispatch':
+			rpc = to_ele(request['rpc'])
+			name = rpc.tag[rpc.tag.rfind('}')+1:]
+			if name not in allowed_rpcs:
+				raise BrokerError("RPC [" + name + "] is not allowed by the broker")
+			return conn.dispatch(rpc).tostring
+		raise BrokerError("Unknown operation [" + str(request['op']) + "]")
+
+	def call(self, host, request):
+		"""
+		Executes a request on the session of host and returns the reply as xml string
+		"""
+		with self._lock(host):
+			self.lastUsed[host] = time.time()
+			try:
+				return self._execute(self._session(host), request)
+			except BrokerError:
+				raise
+			except Exception:
+				# The session may have died since it was last used, retry once on a new session
+				self._drop(host)
+				return self._execute(self._session(host), request)
+
+	def keepalive(self, idle):
+		"""
+		Sends a cheap RPC on every session not used in the last idle seconds, and reconnects sessions that have failed
+		"""
+		from ncclient.xml_ import new_ele
+		for host in list(self.sessions.keys()):
+			if time.time() - self.lastUsed.get(host, 0) < idle: continue
+			with self._lock(host):
+				self.lastUsed[host] = time.time()
+				try:
+					self._session(host).dispatch(new_ele('get-system-uptime-information'))
+				except Exception, e:
+					self._drop(host)
+					print >> sys.stderr, "keepalive for [" + host + "] failed: " + str(e)
+
+	def close(self):
+		for host in list(self.sessions.keys()):
+			self._drop(host)
+
+
+class BrokerRequestHandler(SocketServer.StreamRequestHandler):
+	"""
+	Handles a client connection, one json encoded request per line
+	"""
+	def handle(self):
+		while True:
+			line = self.rfile.readline()
+			if len(line) == 0: break
+			try:
+				request = json.loads(line)
+				answer = {'reply' : self.server.pool.call(request['host'], request)}
+			except Exception, e:
+				answer = {'error' : str(e)}
+			self.wfile.write(json.dumps(answer) + '\n')
+			self.wfile.flush()
+
+
+class BrokerServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+	daemon_threads = True
+
+
+def buildParser():
+	"""
+	Prepare parsing of command line options
+	"""
+
+	parser = OptionParser("usage: %prog [options]")
+
+	parser.add_option("-s", "--socket",
+			  dest="socket",
+			  default=broker_socket,
+			  help="unix socket to listen on, default = " + broker_socket,
+			  metavar="SOCKET")
+	parser.add_option("-a", "--auth",
+			  dest="auth",
+			  default=netconf_auth,
+			  help="NETconf authentication file, default = " + netconf_auth,
+			  metavar="AUTHFILE")
+	parser.add_option("-k", "--keepalive",
+			  dest="keepalive",
+			  default='60',
+			  help="keepalive interval of idle sessions in seconds, default = 60",
+			  metavar="SECONDS")
+	return parser
+
+
+def main():
+	"""
+	Main function for netconf_broker.py
+	"""
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+
+	pool = SessionPool(options.auth)
+
+	if os.path.exists(options.socket): os.unlink(options.socket)
+	server = BrokerServer(options.socket, BrokerRequestHandler)
+	server.pool = pool
+	os.chmod(options.socket, 0660)
+
+	def keepaliveLoop():
+		while True:
+			time.sleep(int(options.keepalive))
+			pool.keepalive(int(options.keepalive))
+
+	keepaliveThread = threading.Thread(target=keepaliveLoop)
+	keepaliveThread.daemon = True
+	keepaliveThread.start()
+
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		pool.close()
+		os.unlink(options.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+../icinga/phase_timing.py
\ No newline at end of file
@@ -0,0 +1,151 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+On-disk per-host cache of collected MEP tables, shared by concurrent check processes.
+Cache files are replaced atomically, and a lock file per entry makes sure only one
+process collects from the device while the others wait for its result.
+The Cacti script juniper_dmm.py uses the same module (cacti/cfm_cache.py links to this file).
+"""
+
+import os
+import json
+import time
+import fcntl
+import tempfile
+
+
+def cachePath(directory, host, name):
+	"""
+	Returns the location of cache entry name for host
+	"""
+	return os.path.join(directory, host.replace('/', '_') + "." + name + ".json")
+
+
+def readCache(path, ttl):
+	"""
+	Returns the data stored in the cache file, or None when it is missing, unreadable or older than ttl seconds
+	"""
+	try:
+		if time.time() - os.path.getmtime(path) >= ttl: return None
+		with open(path, 'r') as f:
+			return json.load(f)
+	except (IOError, OSError, ValueError):
+		return None
+
+
+def writeCache(path, data):
+	"""
+	Stores data in the cache file. The file is written next to its destination and renamed,
+	so readers never see a partially written file.
+	"""
+	(fd, tmppath) = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+	try:
+		with os.fdopen(fd, 'w') as f:
+			json.dump(data, f)
+		os.rename(tmppath, path)
+	except:
+		os.unlink(tmppath)
+		raise
+
+
+def makeCacheDir(directory):
+	"""
+	Creates the cache directory when it does not exist yet
+	"""
+	if not os.path.isdir(directory):
+		try:
+			os.makedirs(directory)
+		except OSError:
+			pass		# created by a concurrent process
+
+
+def updateCache(path, update):
+	"""
+	Calls update(data) with the data stored in the cache file (None when missing or unreadable) while holding
+	its lock, and stores the data it returns. The file never expires. Returns the stored data.
+	"""
+	makeCacheDir(os.path.dirname(path))
+	with open(path + ".lock", 'w') as lock:
+		fcntl.flock(lock, fcntl.LOCK_EX)
+		data = update(readCache(path, float('inf')))
+		writeCache(path, data)
+		fcntl.flock(lock, fcntl.LOCK_UN)
+	return data
+
+
+def storeCache(directory, host, name, data):
+	"""
+	Stores cache entry name for host without taking its lock, for readers which only need the latest data
+	"""
+	makeCacheDir(directory)
+	writeCache(cachePath(directory, host, name), data)
+
+
+def cachedFetch(directory, host, name, ttl, fetch):
+	"""
+	Returns cache entry name for host. When the entry is older than ttl seconds, fetch() is called
+	to rebuild it. Concurrent callers serialize on a lock file, so the device is queried only once.
+	A ttl of 0 disables the cache.
+	"""
+	if ttl <= 0:
+		return fetch()
+
+	path = cachePath(directory, host, name)
+	data = readCache(path, ttl)
+	if data is not None:
+		return data
+
+	makeCacheDir(directory)
+	with open(path + ".lock", 'w') as lock:
+		fcntl.flock(lock, fcntl.LOCK_EX)
+		# Another process may have refreshed the entry while we were waiting for the lock
+		data = readCache(path, ttl)
+		if data is None:
+			data = fetch()
+			writeCache(path, data)
+		fcntl.flock(lock, fcntl.LOCK_UN)
+	return data
+
+
+def revisionFetch(directory, host, name, revision, fetch):
+	"""
+	Returns cache entry name for host as long as it was stored for the same revision of the device,
+	otherwise fetch() is called to rebuild it. Concurrent callers serialize on a lock file.
+	Without revision the cache is not used.
+	"""
+	if revision is None:
+		return fetch()
+
+	path = cachePath(directory, host, name)
+	entry = readCache(path, float('inf'))
+	if entry is not None and entry.get('revision') == revision:
+		return entry['data']
+
+	makeCacheDir(directory)
+	with open(path + ".lock", 'w') as lock:
+		fcntl.flock(lock, fcntl.LOCK_EX)
+		entry = readCache(path, float('inf'))
+		if entry is None or entry.get('revision') != revision:
+			entry = {'revision' : revision, 'data' : fetch()}
+			writeCache(path, entry)
+		fcntl.flock(lock, fcntl.LOCK_UN)
+	return entry['data']
@@ -0,0 +1,288 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Collector core shared by the check_cfm_state scripts.
+The vendor specific parts, collecting the remote MEP table and evaluating a remote MEP, are implemented
+by a driver from cfm_drivers. The core handles the command line, the selection of remote MEPs, caching
+of collected MEP tables, multi-host scheduling and timing statistics, so these work the same for all vendors.
+"""
+
+import os
+import sys
+import fnmatch
+import functools
+import multihost
+import cfm_cache
+import host_health
+import phase_timing
+from optparse import OptionParser
+from collections import defaultdict
+
+# Default directory of the MEP table cache:
+cache_dir="/var/tmp/cfm_state"
+
+
+class MEPIndex(object):
+	"""
+	Secondary indexes of a MEP dictionary by remote MEP identifier, MAID, MD level, local MEP and MAC address,
+	used to resolve the --mep selection without scanning the dictionary per selected MEP.
+	"""
+	# Selector prefix and the MEP entry field it indexes
+	fields = {'id' : 'ID', 'maid' : 'MAIDString', 'level' : 'MdLevel', 'local' : 'localMEP', 'mac' : 'MacAddr'}
+
+	def __init__(self, MEPDict):
+		self.keys = list(MEPDict.keys())
+		self.indexes = dict([(name, defaultdict(list)) for name in self.fields])
+		for key in self.keys:
+			for (name, field) in self.fields.items():
+				value = MEPDict[key].get(field)
+				if value is not None:
+					self.indexes[name][self.normalize(name, str(value))].append(key)
+
+	def normalize(self, name, value):
+		"""
+		Returns the indexed form of a value, MAC addresses are stored as lowercase aa:bb:cc:dd:ee:ff
+		"""
+		if name != 'mac': return value
+		digits = value.lower().replace(':', '').replace('-', '').replace('.', '')
+		if len(digits) != 12: return value.lower()
+		return ':'.join([digits[i:i+2] for i in range(0, 12, 2)])
+
+	def lookup(self, name, pattern):
+		"""
+		Returns the keys of the MEPs of which field name matches pattern, which is a value,
+		a numeric range (low-high) or a glob pattern
+		"""
+		index = self.indexes[name]
+		if any([c in pattern for c in '*?[']):
+			keys = []
+			for value in fnmatch.filter(index.keys(), self.normalize(name, pattern)):
+				keys.extend(index[value])
+			return keys
+		bounds = pattern.split('-')
+		if len(bounds) == 2 and bounds[0].isdigit() and bounds[1].isdigit():
+			(low, high) = (int(bounds[0]), int(bounds[1]))
+			if high - low < len(index):
+				values = [str(value) for value in range(low, high + 1) if str(value) in index]
+			else:
+				values = [value for value in index if value.isdigit() and low <= int(value) <= high]
+			keys = []
+			for value in sorted(values, key=int):
+				keys.extend(index[value])
+			return keys
+		return list(index.get(self.normalize(name, pattern), []))
+
+	def select(self, selection):
+		"""
+		Resolves a --mep selection, a comma separated list of terms, and returns a list of (term, keys) tuples.
+		A term is 'all', a remote MEP identifier, range (5-10) or glob (1*), or one of the selectors
+		maid:, level:, local: and mac: followed by a value, range or glob.
+		"""
+		selected = []
+		for term in selection.split(','):
+			term = term.strip()
+			if len(term) == 0: continue
+			if term == 'all':
+				selected.append((term, list(self.keys)))
+				continue
+			(name, pattern) = ('id', term)
+			if ':' in term and term.split(':')[0] in self.fields:
+				(name, pattern) = term.split(':', 1)
+			selected.append((term, self.lookup(name, pattern)))
+		return selected
+
+
+class CollectionError(Exception):
+	"""
+	Raised by a driver when the MEP table of a host can not be collected
+	"""
+	pass
+
+
+class UnreachableError(CollectionError):
+	"""
+	Raised by a driver when the host does not respond, counted by the circuit breaker of host_health
+	"""
+	pass
+
+
+def buildParser(driver):
+	"""
+	Prepare parsing of command line options, the driver adds its own options
+	"""
+
+	parser = OptionParser("usage: %prog [options] hostname")
+
+	driver.addOptions(parser)
+	parser.add_option("-m", "--mep",
+			  dest="mep",
+			  default='',
+			  help="comma separated list to specify remote MEPs to monitor: all, MEP ids, ranges (5-10), globs (1*), or maid:, level:, local: and mac: selectors (level:5, maid:CUST*)",
+			  metavar="LIST")
+	parser.add_option("--cache-ttl",
+			  dest="cache_ttl",
+			  default='0',
+			  help="reuse MEP tables collected less than this number of seconds ago, default = 0 (no caching, the table is still stored for oam_exporter.py)",
+			  metavar="SECONDS")
+	parser.add_option("--cache-dir",
+			  dest="cache_dir",
+			  default=cache_dir,
+			  help="directory of the MEP table cache, default = " + cache_dir,
+			  metavar="DIR")
+	host_health.addOptions(parser)
+	phase_timing.addOptions(parser)
+	multihost.addOptions(parser, "CFM state")
+	return parser
+
+
+def collect(driver, options, host):
+	"""
+	Returns the MEP dictionary of host, served from the cache when it was collected less than
+	--cache-ttl seconds ago. Without caching the collected table is still stored in the cache directory,
+	where oam_exporter.py finds it. Hosts which did not respond to recent polls are not polled until
+	their next probe, the outcome of every poll is recorded by host_health.
+	"""
+	ttl = int(options.cache_ttl)
+	reason = host_health.allowPoll(options, host)
+	if reason is not None:
+		raise CollectionError(reason)
+	try:
+		with phase_timing.phase('collect'):
+			MEPDict = cfm_cache.cachedFetch(options.cache_dir, host, driver.name, ttl,
+							lambda: driver.buildMEPDictionary(options, host))
+			if ttl <= 0:
+				try:
+					cfm_cache.storeCache(options.cache_dir, host, driver.name, MEPDict)
+				except (IOError, OSError):
+					pass		# only the exporter misses the table
+	except UnreachableError:
+		host_health.recordPoll(options, host, False)
+		raise
+	except CollectionError:
+		host_health.recordPoll(options, host, True)		# the host did respond
+		raise
+	host_health.recordPoll(options, host, True)
+	return MEPDict
+
+
+def checkHost(driver, options, host):
+	"""
+	Performs the CCM checks of the remote MEPs selected by the --mep option on host.
+	Returns a dictionary holding the Icinga / Nagios state and output, and the results per remote MEP.
+	"""
+
+	ErrorState=0
+	output=[]
+	items=[]
+
+	# retreive Remote MEP data
+
+	MEPDict = collect(driver, options, host)
+
+	# Perform CCM checks on the selected MEPs, every MEP is checked once even when selected by several terms
+
+	with phase_timing.phase('evaluate'):
+		checked = set()
+		for (term, keys) in MEPIndex(MEPDict).select(options.mep):
+			if len(keys) == 0:
+				output.append('Remote MEP {0:<4} NO DATA'.format(term))
+				items.append((term, 1, output[-1]))
+				ErrorState = 1
+				continue
+			for key in keys:
+				if key in checked: continue
+				checked.add(key)
+				result = driver.checkMEP_CCM(MEPDict[key])
+				if result == 1: ErrorState = 1
+				output.append(MEPDict[key]['Output'])
+				items.append((MEPDict[key].get('ID'), result, MEPDict[key]['Output']))
+
+	return {'state' : ErrorState, 'output' : '\n'.join(output), 'items' : items}
+
+
+def checkHostLogged(driver, options, host):
+	"""
+	Multi-host mode entry, checks host in a worker process and logs the timing of this host to --timing-log
+	"""
+	phase_timing.reset()
+	result = checkHost(driver, options, host)
+	if len(options.timing_log) > 0:
+		phase_timing.logRun(options.timing_log, os.path.basename(sys.argv[0]), host, result['state'])
+	return result
+
+
+def formatStatistics(driver):
+	"""
+	Returns status lines with the request statistics of the driver and the time spent per phase of this run.
+	The collect phase includes the connect, walk, rpc, parse and merge phases of the driver.
+	"""
+	lines = []
+	if driver.statistics() is not None: lines.append(driver.statistics())
+	lines.append(phase_timing.formatTiming())
+	return '\n'.join(lines)
+
+
+def main(driver):
+	"""
+	Main function of the check_cfm_state scripts, driver performs the vendor specific collection
+	"""
+
+	# Parse options and arguments
+
+	parser = buildParser(driver)
+	(options, args) = parser.parse_args()
+
+	if len(args) == 0 and len(options.hosts) == 0:
+		print "No hostname specified --exiting"
+		quit()
+	if len(options.mep) == 0:
+		print "No remote MEP specified --exiting"
+		quit()
+	error = driver.validate(options)
+	if error is not None:
+		print error + " --exiting"
+		quit()
+
+	phase_timing.start(options.profile)
+
+	# Check all hosts from the host list, and submit the results as passive checks
+
+	if len(options.hosts) > 0:
+		state = multihost.runMultiHost(options, functools.partial(checkHostLogged, driver))
+		if len(options.profile) > 0: phase_timing.stopProfile(options.profile)
+		sys.exit(state)
+
+	try:
+		result = checkHost(driver, options, args[0])
+	except CollectionError, e:
+		print str(e)
+		phase_timing.finish(options, args[0], 3)
+		sys.exit(3)
+	print result['output']
+
+	if options.statistics:
+		print formatStatistics(driver)
+	phase_timing.finish(options, args[0], result['state'])
+
+	# Exit with value to inform Nagios / Icinga
+	sys.exit(result['state'])
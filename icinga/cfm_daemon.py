@@ -0,0 +1,264 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Polling daemon for the CFM checks, feeding Icinga / Nagios with passive check results.
+The device inventory is loaded once, and every host is polled on its own interval by a pool of
+resident worker processes keeping their SNMP and NETconf sessions open. The latest result of every
+host is kept in memory, and is written to the checkresult spool directory and / or command pipe.
+Workers which exit are restarted with the same hosts. The state file holds the latest check result
+and per MEP state of every host, the MEP tables themselves are stored in the MEP table cache of the
+checks (--cache-dir in the inventory), where oam_exporter.py reads them.
+
+The inventory is an ini file with a section per host, keys are the long options of the check scripts:
+	[DEFAULT]
+	interval = 60
+	mep = all
+
+	[switch1.example.net]
+	driver = 8021ag
+	community = public
+
+	[router1.example.net]
+	driver = junos
+	username = monitor
+	password = secret
+Example: ./cfm_daemon.py -i /etc/icinga/cfm_inventory.ini --spool-dir /var/spool/icinga/checkresults
+"""
+
+import os
+import sys
+import json
+import time
+import Queue
+import signal
+import tempfile
+import functools
+import multiprocessing
+import ConfigParser
+from optparse import OptionParser
+import cfm_core
+import cfm_drivers
+import multihost
+
+# Inventory settings of the daemon itself, all other settings are long options of the check scripts
+inventory_keys = ['driver', 'interval']
+
+# Seconds between checks of the worker processes, and the least time a worker runs before it is restarted
+supervise_interval = 5
+restart_delay = 10
+
+
+def buildParser():
+	"""
+	Prepare parsing of command line options
+	"""
+
+	parser = OptionParser("usage: %prog [options]")
+
+	parser.add_option("-i", "--inventory",
+			  dest="inventory",
+			  default='',
+			  help="inventory file listing the hosts to poll",
+			  metavar="FILE")
+	parser.add_option("--workers",
+			  dest="workers",
+			  default='4',
+			  help="number of worker processes, default = 4",
+			  metavar="WORKERS")
+	parser.add_option("--command-file",
+			  dest="command_file",
+			  default='',
+			  help="submit results to this Icinga / Nagios command pipe",
+			  metavar="PIPE")
+	parser.add_option("--spool-dir",
+			  dest="spool_dir",
+			  default='',
+			  help="submit results as files in this checkresult spool directory",
+			  metavar="DIR")
+	parser.add_option("--state-file",
+			  dest="state_file",
+			  default='',
+			  help="write the latest result and MEP states of all hosts to this json file after every poll",
+			  metavar="FILE")
+	return parser
+
+
+def loadInventory(filename):
+	"""
+	Reads the inventory and returns a list of (host, driver name, options) tuples, where options holds
+	the defaults of the check scripts overridden by the inventory settings of the host
+	"""
+	config = ConfigParser.RawConfigParser()
+	if len(config.read(filename)) == 0:
+		raise IOError("Unable to read inventory [" + filename + "]")
+
+	inventory = []
+	for host in config.sections():
+		name = config.get(host, 'driver') if config.has_option(host, 'driver') else '8021ag'
+		if name not in cfm_drivers.drivers:
+			raise ValueError("Unknown driver [" + name + "] for [" + host + "]")
+		parser = cfm_core.buildParser(cfm_drivers.drivers[name]())
+		options = parser.get_default_values()
+		options.interval = '60'
+		options.mep = 'all'
+		for (key, value) in config.items(host):
+			if key in inventory_keys:
+				setattr(options, key, value)
+				continue
+			option = parser.get_option('--' + key)
+			if option is None or option.dest is None:
+				raise ValueError("Unknown setting [" + key + "] for [" + host + "]")
+			setattr(options, option.dest, value)
+		options.persistent = True
+		inventory.append((host, name, options))
+	return inventory
+
+
+def pollWorker(hosts, results):
+	"""
+	Worker process, polls its share of the hosts on their intervals and puts the results on the queue.
+	Drivers are kept for the lifetime of the worker, so sessions are reused between polls.
+	The phase timing is reset for every poll, and logged to the --timing-log of the host.
+	"""
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	drivers = {}
+	schedule = []
+	now = time.time()
+	for (index, (host, name, options)) in enumerate(hosts):
+		if name not in drivers: drivers[name] = cfm_drivers.drivers[name]()
+		# spread the first polls over the interval, so the hosts are not polled in bursts
+		schedule.append([now + float(options.interval) * index / len(hosts), host, name, options])
+
+	while True:
+		schedule.sort(key=lambda entry: entry[0])
+		entry = schedule[0]
+		delay = entry[0] - time.time()
+		if delay > 0: time.sleep(delay)
+
+		(due, host, name, options) = entry
+		check = functools.partial(cfm_core.checkHostLogged, drivers[name])
+		result = multihost.runCheck((check, options, host))
+		results.put(result)
+
+		# schedule the next poll, skipping polls missed because this one took too long
+		interval = float(options.interval)
+		entry[0] = due + interval
+		if entry[0] < time.time(): entry[0] = time.time() + interval
+
+
+def writeState(filename, state):
+	"""
+	Writes the latest results to the state file, replacing the file atomically
+	"""
+	(fd, tmppath) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), prefix=".tmp-")
+	with os.fdopen(fd, 'w') as f:
+		json.dump(state, f)
+	os.rename(tmppath, filename)
+
+
+def startWorker(hosts, results):
+	"""
+	Starts a worker process polling hosts, and returns it
+	"""
+	process = multiprocessing.Process(target=pollWorker, args=(hosts, results))
+	process.daemon = True
+	process.start()
+	process.started = time.time()
+	return process
+
+
+def superviseWorkers(processes, shares, results):
+	"""
+	Restarts the worker processes which exited, each with its own share of the hosts
+	"""
+	for i in range(len(processes)):
+		process = processes[i]
+		if process.is_alive() or time.time() - process.started < restart_delay: continue
+		print "Worker polling [" + ','.join([host for (host, name, options) in shares[i]]) + "] exited with code " + \
+			str(process.exitcode) + ", restarting"
+		sys.stdout.flush()
+		processes[i] = startWorker(shares[i], results)
+
+
+def main():
+	"""
+	Main function for cfm_daemon.py
+	"""
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+
+	if len(options.inventory) == 0:
+		print "No inventory specified --exiting"
+		quit()
+	if len(options.command_file) == 0 and len(options.spool_dir) == 0:
+		print "No command pipe or spool directory specified --exiting"
+		quit()
+
+	try:
+		inventory = loadInventory(options.inventory)
+	except (IOError, ValueError), e:
+		print str(e) + " --exiting"
+		quit()
+	if len(inventory) == 0:
+		print "No hosts found in [" + options.inventory + "]"
+		quit()
+
+	# Divide the hosts over the workers, every host is always polled by the same worker
+	workers = max(1, min(int(options.workers), len(inventory)))
+	results = multiprocessing.Queue()
+	shares = [inventory[i::workers] for i in range(workers)]
+	processes = [startWorker(share, results) for share in shares]
+
+	def terminate(signum, frame):
+		for process in processes: process.terminate()
+		sys.exit(0)
+	signal.signal(signal.SIGTERM, terminate)
+
+	hostOptions = dict([(host, hostoptions) for (host, name, hostoptions) in inventory])
+	state = {}
+	try:
+		while True:
+			try:
+				result = results.get(timeout=supervise_interval)
+			except Queue.Empty:
+				result = None
+			superviseWorkers(processes, shares, results)
+			if result is None: continue
+
+			host = result['item']
+			state[host] = result
+			service = hostOptions[host].service
+			itemService = hostOptions[host].item_service
+			multihost.submitResult(options, host, service, result['state'], result['output'], result['start'], result['finish'])
+			if len(itemService) > 0:
+				for (item, itemstate, output) in result['items']:
+					multihost.submitResult(options, host, itemService.format(item), itemstate, output, result['start'], result['finish'])
+			if len(options.state_file) > 0:
+				writeState(options.state_file, state)
+	except KeyboardInterrupt:
+		terminate(None, None)
+
+if __name__ == "__main__":
+    main()
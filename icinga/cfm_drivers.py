@@ -0,0 +1,552 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Vendor drivers for the CFM collector core (cfm_core).
+A driver adds its own command line options, collects the remote MEP table of a host into a dictionary
+of remote MEP entries, and evaluates the CCM state of an entry. Every entry holds the remote MEP
+identifier as 'ID', the MD level as 'MdLevel' and the MAID as 'MAIDString', and when the device provides
+them the local MEP identifier as 'localMEP' and the remote MEP MAC address as 'MacAddr'.
+The netsnmp and ncclient modules are imported by the drivers using them only.
+"""
+
+from collections import defaultdict, deque
+from cfm_core import CollectionError, UnreachableError
+from junos_xml import walkReply, replyFields
+import time
+import phase_timing
+import host_health
+
+
+class CFMDriver(object):
+	"""
+	Base class of the vendor drivers
+	"""
+	# Name of the driver, used for cache entries
+	name = ''
+
+	def addOptions(self, parser):
+		"""
+		Adds the driver specific command line options
+		"""
+		pass
+
+	def validate(self, options):
+		"""
+		Returns an error message when the driver options are incomplete, otherwise None
+		"""
+		return None
+
+	def buildMEPDictionary(self, options, host):
+		"""
+		Returns the dictionary of remote MEP entries of host
+		"""
+		raise NotImplementedError
+
+	def checkMEP_CCM(self, mepEntry):
+		"""
+		Checks a entry from the MEP Dictionary and returns 1 if there are any CCM errors detected.
+		Output for Icinga / Nagios is generated and stored in the entry as 'Output'.
+		"""
+		raise NotImplementedError
+
+	def mepMetrics(self, mepEntry):
+		"""
+		Returns the state of a MEP entry as a dictionary of numeric metrics, used by the exporter
+		"""
+		return {}
+
+	def statistics(self):
+		"""
+		Returns a status line with the request statistics of this run, or None
+		"""
+		return None
+
+
+class SNMPDriver(CFMDriver):
+	"""
+	Base class of the drivers collecting using SNMP
+	"""
+	def addOptions(self, parser):
+		parser.add_option("-v", "--version",
+				  type='choice',
+				  dest="version",
+				  choices=['1','2'],
+				  default='2',
+				  help="Use specific SNMP version default = 2 (version 2 walks using GETBULK)",
+				  metavar="SNMP_VERSION")
+		parser.add_option("-p", "--port",
+				  dest="port",
+				  default='161',
+				  help="SNMP port default = 161",
+				  metavar="PORT")
+		parser.add_option("-c", "--community",
+				  dest="community",
+				  help="SNMP community",
+				  metavar="COMMUNITY")
+		parser.add_option("-r", "--max-repetitions",
+				  dest="repetitions",
+				  default='auto',
+				  help="GETBULK max-repetitions, default = auto (selected per device)",
+				  metavar="REPETITIONS")
+
+	def walkTables(self, options, host, tables):
+		"""
+		Walks the specified columns of independent tables concurrently on one session, and returns
+		the results per table, timed as phase walk_<driver>. Raises CollectionError when the host stopped responding.
+		"""
+		import snmp_engine
+		session = snmp_engine.hostSession(options, host)
+		with phase_timing.phase('walk_' + self.name):
+			results = session.walkTables(tables)
+		if session.failed:
+			raise UnreachableError("No SNMP response from [" + host + "]")
+		return results
+
+	def statistics(self):
+		import snmp_engine
+		return snmp_engine.formatStatistics()
+
+
+class Dot1agDriver(SNMPDriver):
+	"""
+	Driver for devices implementing the standardized 802.1ag IEEE8021-CFM-MIB.
+	This has been tested for Overture ISG24.
+	"""
+	name = '8021ag'
+
+	MEPPortStatus = {'0' : 'psNoPortStateTLV', '1' : 'psBlocked', '2' : 'psUp'}
+	MEPInterfaceStatus = {'0' : '0', '1' : 'isUp', '2' : 'isDown', '3' : 'isTesting', '4' : 'isUnknown', '5' : 'isDormant', '6' : 'isNotPresent', '7' : 'isLowerLayerDown'}
+
+	# Table columns used by the CCM check, other columns are not retrieved
+	MdColumns = ['dot1agCfmMdName', 'dot1agCfmMdMdLevel']
+	MaColumns = ['dot1agCfmMaNetName']
+	MEPDbColumns = ['dot1agCfmMepDbRMepState', 'dot1agCfmMepDbMacAddress', 'dot1agCfmMepDbRdi', 'dot1agCfmMepDbPortStatusTlv', 'dot1agCfmMepDbInterfaceStatusTlv']
+
+	def buildMEPDictionary(self, options, host):
+		"""
+		This function performs snmpwalks to generate a dictionary of the RemoteMEP table from the IEEE8021-CFM-MIB.
+		Some entries are parsed before the dictionary is returned.
+		"""
+
+		# Retreive CFM MD, MA and Remote MEP data, the tables are walked concurrently
+
+		(MdEntry, MaEntry, MEPEntry) = self.walkTables(options, host, [self.MdColumns, self.MaColumns, self.MEPDbColumns])
+
+		Mdlist = defaultdict(dict)
+		for var in MdEntry:
+			Mdlist[var.iid].update({var.tag.replace("dot1agCfmMd", "") : var.val})
+
+		Malist = defaultdict(dict)
+		for var in MaEntry:
+			Malist[var.iid].update({var.tag.replace("dot1agCfmMa", "") : var.val})
+
+		MEPlist= defaultdict(dict)
+		for var in MEPEntry:
+			MEPlist[var.iid].update({var.tag.replace("dot1agCfmMepDb", ""):var.val})
+
+		# Merge required MD and MA data into the MEPlist dictionary, and do parsing for some elements
+
+		with phase_timing.phase('merge'):
+			for var in MEPlist:
+				leafindexes = var.split('.')
+				MdIndex = leafindexes[0]
+				MaIndex = leafindexes[1]
+				MEPlist[var]['ID'] = leafindexes[3]
+				MEPlist[var]['localMEP'] = leafindexes[2]
+				# The raw MAC address octets are not kept, they can not be stored in the json cache
+				MacAddress = MEPlist[var].pop('MacAddress', '')
+				if len(MacAddress) == 6:
+					MEPlist[var]['MacAddr'] = ':'.join(['%02x' % ord(c) for c in MacAddress])
+				elif len(MacAddress) > 0:
+					MEPlist[var]['MacAddr'] = MacAddress.encode('hex')
+				MEPlist[var]['MdLevel'] = Mdlist[MdIndex].get('MdLevel')
+				MEPlist[var]['MdName'] = Mdlist[MdIndex].get('Name')
+				MEPlist[var]['NetName'] = Malist[MdIndex + '.' + MaIndex].get('NetName').strip()
+				MEPlist[var]['MAIDString'] = "{0}_{1}".format(MEPlist[var]['MdName'] , MEPlist[var]['NetName'])
+				MEPlist[var]['MAIDString'] = MEPlist[var]['MAIDString'].replace('\x00',"")
+				MEPlist[var]['ErrorMessage']=""
+				MEPlist[var]['IcingaState']=""
+
+		return MEPlist
+
+	def checkMEP_CCM(self, mepEntry):
+		if mepEntry['Rdi'] <> '2': mepEntry['ErrorMessage'] += " -- RDI Error Detected!"
+		if mepEntry['RMepState'] <> '4': mepEntry['ErrorMessage'] += " -- Remote MEP State Error Detected!"
+		if (int(mepEntry['PortStatusTlv']) == 1) | (int(mepEntry['InterfaceStatusTlv']) > 1) :
+			mepEntry['ErrorMessage'] += " -- PortStatus: " + self.MEPPortStatus[mepEntry['PortStatusTlv']] + " InterfaceStatusTlv: " + self.MEPInterfaceStatus[mepEntry['InterfaceStatusTlv']]
+
+		if len(mepEntry['ErrorMessage']) > 0:
+			ErrorState = 1
+			mepEntry['IcingaState'] = "WARNING"
+		else:
+			ErrorState = 0
+			mepEntry['IcingaState'] = "OK"
+
+		mepEntry['Output'] = 'Remote MEP {0:<4} {1} - Level {2} MAID: {3:<20} {4}'.format(
+									mepEntry['ID'],
+									mepEntry['IcingaState'],
+									mepEntry['MdLevel'],
+									mepEntry['MAIDString'],
+									mepEntry['ErrorMessage'])
+		return ErrorState
+
+	def mepMetrics(self, mepEntry):
+		return {'rdi' : int(mepEntry['Rdi'] == '1'),
+			'remote_mep_state' : int(mepEntry['RMepState']),
+			'port_status_tlv' : int(mepEntry['PortStatusTlv']),
+			'interface_status_tlv' : int(mepEntry['InterfaceStatusTlv'])}
+
+
+class CienaDriver(SNMPDriver):
+	"""
+	Driver for Ciena 3960 devices using the WWP-LEOS-CFM-MIB
+	"""
+	name = 'ciena'
+
+	MEPAdminState = {'1' : 'disabled', '2' : 'enabled'}
+	MEPOperState = {'1' : 'disabled', '2' : 'enabled', '3' : 'hold', '4' : 'holdLocked'}
+
+	# Table columns used by the CCM check, other columns are not retrieved
+	ServiceColumns = ['wwpLeosCfmServiceCfmMAID', 'wwpLeosCfmServiceCfmMaintAssocName', 'wwpLeosCfmServiceMdLevel']
+	RemoteMEPColumns = ['wwpLeosCfmRemoteMEPID', 'wwpLeosCfmRemoteMEPFailureFlag', 'wwpLeosCfmRemoteMEPCCMErrorFlag', 'wwpLeosCfmRemoteMEPRDIErrorFlag', 'wwpLeosCfmRemoteMEPAdminState', 'wwpLeosCfmRemoteMEPOperState']
+
+	def addOptions(self, parser):
+		SNMPDriver.addOptions(self, parser)
+		parser.add_option("-t", "--type",
+				  type='choice',
+				  dest="type",
+				  choices=['CCM', 'DMM', 'LMM'],
+				  default='CCM',
+				  help="monitor packet type, can be CCM/DMM/LMM, default=CCM",
+				  metavar="TYPE")
+
+	def buildMEPDictionary(self, options, host):
+		"""
+		This function performs snmpwalks to generate a dictionary of the RemoteMEP table from the Ciena MIB.
+		Some entries are parsed before the dictionary is returned.
+		"""
+
+		# Retreive CFM Service and Remote MEP data, the tables are walked concurrently
+
+		(ServiceEntry, MEPEntry) = self.walkTables(options, host, [self.ServiceColumns, self.RemoteMEPColumns])
+
+		Servicelist = defaultdict(dict)
+		for var in ServiceEntry:
+			Servicelist[var.iid].update({var.tag.replace("wwpLeosCfmService", "") : var.val})
+
+		MEPlist= defaultdict(dict)
+		for var in MEPEntry:
+			MEPlist[var.iid].update({var.tag.replace("wwpLeosCfmRemoteMEP", ""):var.val})
+
+		# Merge required Service data into the MEPlist dictionary, and do parsing for some elements
+
+		with phase_timing.phase('merge'):
+			for var in MEPlist:
+				serviceIndex=var[:var.find('.')]
+				CFMMaid = Servicelist[serviceIndex].get('CfmMAID')
+				MdStrLen = ord(CFMMaid[1])
+				MEPlist[var]['MAIDString'] = CFMMaid[2:MdStrLen+2] + "_" + Servicelist[serviceIndex].get('CfmMaintAssocName')
+				MEPlist[var]['MdLevel'] = Servicelist[serviceIndex].get('MdLevel')
+				MEPlist[var]['ErrorMessage']=""
+				MEPlist[var]['IcingaState']=""
+		return MEPlist
+
+	def checkMEP_CCM(self, mepEntry):
+		if mepEntry['FailureFlag'] == '1': mepEntry['ErrorMessage'] += " -- Failure Error Detected!"
+		if mepEntry['CCMErrorFlag'] == '1': mepEntry['ErrorMessage'] += " -- CCM Error Detected!"
+		if mepEntry['RDIErrorFlag'] == '1': mepEntry['ErrorMessage'] += " -- RDI Error Detected!"
+		if ((int(mepEntry['AdminState']) == 1)) | ((int(mepEntry['OperState']) <> 0) & (int(mepEntry['OperState']) <> 2))  :
+			mepEntry['ErrorMessage'] += " -- WARNING AdminState: " + self.MEPAdminState[mepEntry['AdminState']] + " OperState: " + self.MEPOperState[mepEntry['OperState']]
+		if len(mepEntry['ErrorMessage']) > 0:
+			ErrorState = 1
+			mepEntry['IcingaState'] = "WARNING"
+		else:
+			ErrorState = 0
+			mepEntry['IcingaState'] = "OK"
+
+		mepEntry['Output'] = 'Remote MEP {0:<4} {1} - Level: {2} MAID: {3:<20} {4}'.format(
+									mepEntry['ID'],
+									mepEntry['IcingaState'],
+									mepEntry['MdLevel'],
+									mepEntry['MAIDString'],
+									mepEntry['ErrorMessage'])
+		return ErrorState
+
+	def mepMetrics(self, mepEntry):
+		return {'rdi' : int(mepEntry['RDIErrorFlag'] == '1'),
+			'remote_mep_failure' : int(mepEntry['FailureFlag'] == '1'),
+			'ccm_error' : int(mepEntry['CCMErrorFlag'] == '1'),
+			'admin_state' : int(mepEntry['AdminState']),
+			'oper_state' : int(mepEntry['OperState'])}
+
+
+class JunosDriver(CFMDriver):
+	"""
+	Driver for Juniper EX (+MX) devices using Netconf
+	"""
+	name = 'junos'
+
+	MEPAdminState = {'1' : 'disabled', '2' : 'enabled'}
+	MEPOperState = {'1' : 'disabled', '2' : 'enabled', '3' : 'hold', '4' : 'holdLocked'}
+
+	# Elements of the get-cfm-mep-database-information reply, and the MEP entry field they are stored in
+	MEPDatabaseFields = {	"cfm-maintenance-domain-name" : "Md",
+				"cfm-maintenance-association-name" : "Ma",
+				"cfm-level" : "MdLevel",
+				"cfm-remote-mep-mac-address" : "MacAddr",
+				"cfm-local-mep-identifier" : "localMEP",
+				"cfm-remote-mep-state" : "FailureFlag",
+				"cfm-remote-mep-rdi" : "RDIErrorFlag",
+				"cfm-remote-mep-port-status-tlv" : "AdminState",
+				"cfm-remote-mep-interface-status-tlv" : "OperState"}
+
+	# Connect timeout in seconds for hosts without known connect times, and the limits of learned timeouts
+	connect_timeout_initial = 15
+	connect_timeout_min = 3
+	connect_timeout_max = 30
+
+	def __init__(self):
+		self.sessions = {}
+
+	def addOptions(self, parser):
+		parser.add_option("-P", "--port",
+				  dest="port",
+				  default='22',
+				  help="NETconf port default = 22",
+				  metavar="PORT")
+		parser.add_option("-u", "--username",
+				  dest="username",
+				  default='',
+				  help="ssh username",
+				  metavar="USERNAME")
+		parser.add_option("-p", "--password",
+				  dest="password",
+				  default='',
+				  help="ssh password (can be ommited when using remote ssh key)",
+				  metavar="password")
+		parser.add_option("-t", "--type",
+				  type='choice',
+				  dest="type",
+				  choices=['CCM', 'DMM', 'LMM'],
+				  default='CCM',
+				  help="monitor packet type, can be CCM/DMM/LMM, default=CCM",
+				  metavar="TYPE")
+		parser.add_option("-w", "--window",
+				  dest="window",
+				  default='16',
+				  help="maximum number of NETconf requests in flight, default = 16 (1 = no pipelining)",
+				  metavar="WINDOW")
+
+	def validate(self, options):
+		if len(options.username) == 0:
+			return "No username specified"
+		return None
+
+	def connect(self, options, host):
+		"""
+		Connects to the remote host, and returns the NETconf session. The connect timeout is learned from
+		earlier connects, failed connects are retried as long as the retry budget allows.
+		"""
+		from ncclient import manager
+		from ncclient import transport
+		budget = int(options.retry_budget)
+		while True:
+			timeout = host_health.timeout(options, host, 'netconf', self.connect_timeout_initial,
+							self.connect_timeout_min, self.connect_timeout_max)
+			start = time.time()
+			try:
+				with phase_timing.phase('connect'):
+					conn = manager.connect(host=host, port=options.port, username=options.username, password=options.password,
+								hostkey_verify=False, timeout=timeout)
+				host_health.addSample(options, host, 'netconf', time.time() - start)
+				return conn
+			except transport.AuthenticationError:
+				raise CollectionError("unable to connect [" + host + "], wrong username or password?")
+			except transport.SSHUnknownHostError:
+				raise CollectionError("Unknown host key for [" + host + "]")
+			except transport.SSHError:
+				if budget <= 0:
+					raise UnreachableError("SSH unreachable for [" + host + "]")
+				budget -= 1
+				phase_timing.count('retries')
+
+	def session(self, options, host):
+		"""
+		Returns a NETconf session for host. Resident processes (options.persistent set) keep the session
+		open for the next collection, and reconnect when it has failed.
+		"""
+		conn = self.sessions.get(host)
+		if conn is not None and conn.connected:
+			return conn
+		conn = self.connect(options, host)
+		if getattr(options, 'persistent', False):
+			self.sessions[host] = conn
+		return conn
+
+	def closeSession(self, options, host, conn, failed=False):
+		"""
+		Closes the session after a collection, unless it is kept open for the next one
+		"""
+		if getattr(options, 'persistent', False) and not failed:
+			return
+		self.sessions.pop(host, None)
+		try:
+			conn.close_session()
+		except Exception:
+			pass
+
+	def dispatchPipelined(self, conn, requests, window):
+		"""
+		Dispatches a list of RPCs over one session using ncclient async mode, keeping at most window
+		requests in flight, and returns the replies in the same order as the requests.
+		Without async support in ncclient, the requests are dispatched one by one.
+		"""
+		phase_timing.count('rpcs', len(requests))
+		if window <= 1 or not hasattr(conn, 'async_mode'):
+			return [conn.dispatch(request) for request in requests]
+
+		replies = []
+		inflight = deque()
+		conn.async_mode = True
+		try:
+			for request in requests:
+				if len(inflight) >= window:
+					replies.append(self.waitReply(conn, inflight.popleft()))
+				inflight.append(conn.dispatch(request))
+			while len(inflight) > 0:
+				replies.append(self.waitReply(conn, inflight.popleft()))
+		finally:
+			conn.async_mode = False
+		return replies
+
+	def replySize(self, reply):
+		"""
+		Returns the size in bytes of the raw xml text of a reply, or 0 when only the parsed reply is available.
+		Parsed replies are not serialized again just to be counted.
+		"""
+		for attribute in ('xml', '_raw'):
+			xml = getattr(reply, attribute, None)
+			if isinstance(xml, basestring): return len(xml)
+		return 0
+
+	def waitReply(self, conn, rpc):
+		"""
+		Waits for the reply of an asynchronously dispatched RPC, and returns it
+		"""
+		from ncclient.operations import TimeoutExpiredError
+		rpc.event.wait(conn.timeout)
+		if rpc.error is not None:
+			raise rpc.error
+		if rpc.reply is None:
+			raise TimeoutExpiredError("NETconf reply timed out")
+		return rpc.reply
+
+	def buildMEPDictionary(self, options, host):
+		"""
+		This function performs Netconf calls to generate a dictionary of the remote MEPs of the device.
+		Some entries are parsed before the dictionary is returned.
+		"""
+		conn = self.session(options, host)
+		try:
+			MEPlist = self.collectMEPs(options, conn)
+		except:
+			self.closeSession(options, host, conn, failed=True)
+			raise
+		self.closeSession(options, host, conn)
+		return MEPlist
+
+	def collectMEPs(self, options, conn):
+		"""
+		Retrieves the remote MEPs and their details over the NETconf session
+		"""
+		from ncclient.xml_ import new_ele, sub_ele
+		MEPlist= defaultdict(dict)
+
+		# Get remote meps using netconf call
+
+		cfminfo = new_ele('get-cfm-interface')
+		sub_ele(cfminfo, 'detail').text=""
+		with phase_timing.phase('rpc_get-cfm-interface'):
+			result = conn.dispatch(cfminfo)
+		phase_timing.count('rpcs')
+		phase_timing.count('bytes', self.replySize(result))
+		with phase_timing.phase('parse'):
+			walkReply(result, {"cfm-remote-mep-identifier" : "ID"}, lambda field, text: MEPlist[text].update({"ID":text}))
+
+		#Retrieve detaild intformation about the remote MEPs and store them in the MEPlist
+
+		meps = list(MEPlist.keys())
+		requests = []
+		for mep in meps:
+			cfmdatabase = new_ele('get-cfm-mep-database-information')
+			sub_ele(cfmdatabase,'remote-mep').text = mep
+			requests.append(cfmdatabase)
+		with phase_timing.phase('rpc_get-cfm-mep-database-information'):
+			mepresults = self.dispatchPipelined(conn, requests, int(options.window))
+		phase_timing.count('bytes', sum([self.replySize(mepresult) for mepresult in mepresults]))
+
+		with phase_timing.phase('parse'):
+			fields = [replyFields(mepresult, self.MEPDatabaseFields) for mepresult in mepresults]
+
+		with phase_timing.phase('merge'):
+			for mep, mepfields in zip(meps, fields):
+				MEPlist[mep].update(mepfields)
+				MEPlist[mep].update({"MAIDString":MEPlist[mep].get('Md')+"_"+ MEPlist[mep].get('Ma')})
+				MEPlist[mep].update({"CCMErrorFlag":0})
+				MEPlist[mep].update({"ErrorMessage":""})
+
+		return MEPlist
+
+	def checkMEP_CCM(self, mepEntry):
+		if mepEntry['FailureFlag'] <> 'ok': mepEntry['ErrorMessage'] += " -- Failure Error Detected!"
+		if mepEntry['CCMErrorFlag'] == '1': mepEntry['ErrorMessage'] += " -- CCM Error Detected!"
+		if mepEntry['RDIErrorFlag'] == 'true': mepEntry['ErrorMessage'] += " -- RDI Error Detected!"
+		if ((int(mepEntry['AdminState']) == 1)) | ((int(mepEntry['OperState']) <> 0) & (int(mepEntry['OperState']) <> 2))  :
+			mepEntry['ErrorMessage'] += " -- WARNING AdminState: " + self.MEPAdminState[mepEntry['AdminState']] + " OperState: " + self.MEPOperState[mepEntry['OperState']]
+		if len(mepEntry['ErrorMessage']) > 0:
+			ErrorState = 1
+			mepEntry['IcingaState'] = "WARNING"
+		else:
+			ErrorState = 0
+			mepEntry['IcingaState'] = "OK"
+
+		mepEntry['Output'] = 'Remote MEP {0:<4} {1} - Level: {2} MAID: {3:<20} {4}'.format(
+									mepEntry['ID'],
+									mepEntry['IcingaState'],
+									mepEntry['MdLevel'],
+									mepEntry['MAIDString'],
+									mepEntry['ErrorMessage'])
+		return ErrorState
+
+	def mepMetrics(self, mepEntry):
+		return {'rdi' : int(mepEntry['RDIErrorFlag'] == 'true'),
+			'remote_mep_failure' : int(mepEntry['FailureFlag'] <> 'ok'),
+			'port_status_tlv' : int(mepEntry['AdminState']),
+			'interface_status_tlv' : int(mepEntry['OperState'])}
+
+	def statistics(self):
+		return "NETconf statistics: {0} RPCs, {1} bytes".format(phase_timing.counters['rpcs'], phase_timing.counters['bytes'])
+
+
+# Drivers by name, as used in the cfm_daemon inventory
+drivers = {'8021ag' : Dot1agDriver, 'ciena' : CienaDriver, 'junos' : JunosDriver}
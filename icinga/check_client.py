@@ -0,0 +1,113 @@
+#!/usr/bin/python -S
+
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Client of check_server.py, executed by Icinga / Nagios in place of a check script.
+The script is selected by the name this file is invoked as (a symlink named check_ethping points to it),
+or by the first argument: check_client.py check_ethping -i eth0 00:11:22:33:44:55
+The command line is passed to the server, and the output and exit code of the check are relayed.
+When the server is not running, or the check reads its host or target list from stdin (--hosts - or --targets -),
+the check script is executed directly. Only small modules are imported,
+and python runs without site initialization (-S), to keep the startup time of the client low.
+The server socket can be set with the CHECK_SERVER_SOCKET environment variable.
+"""
+
+import os
+import sys
+import socket
+import struct
+
+# Location of the server socket:
+server_socket="/var/run/icinga/check_server.sock"
+
+
+def readExactly(sock, size):
+	data = ''
+	while len(data) < size:
+		chunk = sock.recv(size - len(data))
+		if len(chunk) == 0: break
+		data += chunk
+	return data
+
+
+def runDirect(name, args):
+	"""
+	Executes the check script located next to this file, replacing the client process
+	"""
+	path = os.path.join(os.path.dirname(os.path.realpath(__file__)), name + '.py')
+	os.execv(sys.executable, [sys.executable, path] + args)
+
+
+def readsStdin(args):
+	"""
+	Returns True when the command line makes the check read from stdin, which the server does not relay
+	"""
+	for arg in args:
+		if arg == '-' or arg in ('--hosts=-', '--targets=-', '-H-', '-T-'): return True
+	return False
+
+
+def main():
+	"""
+	Main function for check_client.py
+	"""
+	name = os.path.basename(sys.argv[0])
+	if name.endswith('.py'): name = name[:-3]
+	args = sys.argv[1:]
+	if name == 'check_client':
+		if len(args) == 0:
+			print "usage: check_client.py <check script> [options]"
+			sys.exit(3)
+		name = os.path.basename(args[0])
+		if name.endswith('.py'): name = name[:-3]
+		args = args[1:]
+
+	if readsStdin(args):
+		runDirect(name, args)
+
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.connect(os.environ.get('CHECK_SERVER_SOCKET', server_socket))
+	except socket.error:
+		runDirect(name, args)
+
+	request = '\0'.join([name] + args)
+	sock.sendall(struct.pack('!I', len(request)) + request)
+
+	while True:
+		header = readExactly(sock, 5)
+		if len(header) < 5:
+			print "CHECK UNKNOWN - connection to check server lost"
+			sys.exit(3)
+		data = readExactly(sock, struct.unpack('!I', header[1:])[0])
+		if header[0] == 'O':
+			sys.stdout.write(data)
+		elif header[0] == 'E':
+			sys.stderr.write(data)
+		elif header[0] == 'X':
+			sys.stdout.flush()
+			sys.exit(int(data))
+
+if __name__ == "__main__":
+    main()
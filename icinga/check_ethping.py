@@ -25,20 +25,20 @@
 Inciga and/or Nagios script for monitoring Ethernet OAM LBM status 
 """
 
+import os
 import sys
+import math
+import time
+import select
 import subprocess
 from optparse import OptionParser
 from collections import defaultdict
+import multitarget
+import rtt_history
+import phase_timing
 
 ErrorStateString = { 0: "OK", 1: "WARNING", 2: "CRITICAL"}
 
-def is_number(s):
-    try:
-        float(s)
-        return True
-    except ValueError:
-        return False
-
 # Parse and check arguments
 
 def buildParser():
@@ -73,28 +73,188 @@ def buildParser():
                           default='1',
 			  help="Return warning on packetloss 1=yes 0=no (default=1)",
                           metavar="WARN_ON_PACKETLOSS")
+	parser.add_option("--critical-loss",
+			  dest="critical_loss",
+			  default='100',
+			  help="Return critical when the packet loss reaches this percentage (default=100)",
+			  metavar="PERCENT")
+	parser.add_option("-e", "--early",
+			  dest="early",
+			  action="store_true",
+			  default=False,
+			  help="Stop ethping as soon as the critical packet loss is reached, or enough replies are received")
+	parser.add_option("--min-replies",
+			  dest="min_replies",
+			  default='0',
+			  help="With --early, stop after this number of replies (default=0, wait for all replies)",
+			  metavar="REPLIES")
+	parser.add_option("--interval",
+			  dest="interval",
+			  default='1',
+			  help="Seconds between the ethpings sent, used to detect lost replies with --early (default=1)",
+			  metavar="SECONDS")
+	parser.add_option("--percentiles",
+			  dest="percentiles",
+			  default='50,95',
+			  help="RTT percentiles reported as perfdata (default=50,95)",
+			  metavar="LIST")
+	parser.add_option("--history",
+			  dest="history",
+			  default='0',
+			  help="Keep the RTTs of the last SAMPLES ethpings of the target, and report statistics over them (default=0, no history)",
+			  metavar="SAMPLES")
+	parser.add_option("--history-dir",
+			  dest="history_dir",
+			  default=rtt_history.history_dir,
+			  help="Directory of the RTT history files (default=" + rtt_history.history_dir + ")",
+			  metavar="DIR")
+	parser.add_option("--rta-warning",
+			  dest="rta_warning",
+			  default='',
+			  help="Return warning when the average RTT over the history exceeds this value",
+			  metavar="MS")
+	parser.add_option("--rta-critical",
+			  dest="rta_critical",
+			  default='',
+			  help="Return critical when the average RTT over the history exceeds this value",
+			  metavar="MS")
+	parser.add_option("--trend-warning",
+			  dest="trend_warning",
+			  default='',
+			  help="Return warning when the average RTT of the newest half of the history is this percentage above the oldest half",
+			  metavar="PERCENT")
+	parser.add_option("--native",
+			  dest="native",
+			  action="store_true",
+			  default=False,
+			  help="Send the loopback messages from this process instead of executing ethping")
+	phase_timing.addOptions(parser)
+	multitarget.addOptions(parser, "ETHPING")
 	return parser
 
 
+def lostProbes(options, replies, elapsed):
+	"""
+	Returns the number of ethpings which should have been answered after elapsed seconds,
+	but are missing from the replies. An ethping is considered lost when it is not answered within one interval,
+	that is by the time the next one is sent.
+	"""
+	settled = min(int(options.count), int(elapsed / float(options.interval)))
+	return max(0, settled - replies)
 
-def main():
+
+def decided(options, replies, lost):
 	"""
-	Main function for check_ethping.py 
+	Returns True when the remaining ethpings can not change the result anymore, or when enough replies are received
 	"""
-	
-	ErrorState=0
+	if lost >= max(1, math.ceil(int(options.count) * float(options.critical_loss) / 100.0)):
+		return True
+	return int(options.min_replies) > 0 and replies >= int(options.min_replies)
 
-	# Parse options and arguments
 
-	parser = buildParser()
-	(options, args) = parser.parse_args()
-	if len(args) == 0:
-        	print "No destination_MAC specified --exiting"
-        	quit()
-	if len(options.interface) == 0:
-		print "No interface specified --exiting"		
-		quit()
- 	
+def runEthping(call, options):
+	"""
+	Executes ethping and collects the RTTs from its output while the replies arrive.
+	With --early ethping is stopped once the result is decided.
+	Returns the list of RTTs, the number of ethpings the result covers and whether ethping was stopped.
+	"""
+	RTTlist = []
+	lines = ''
+	start = time.time()
+	proc = subprocess.Popen(call, stdout=subprocess.PIPE)
+	stdout = proc.stdout.fileno()
+
+	while True:
+		if len(select.select([stdout], [], [], 0.1)[0]) > 0:
+			data = os.read(stdout, 4096)
+			if len(data) == 0: break
+			lines = lines + data
+			while lines.count('\n') > 0:
+				(line, lines) = lines.split('\n', 1)
+				rtt = rtt_history.parseRTT(line)
+				if rtt is not None: RTTlist.append(rtt)
+
+		if options.early:
+			lost = lostProbes(options, len(RTTlist), time.time() - start)
+			if decided(options, len(RTTlist), lost):
+				proc.terminate()
+				proc.wait()
+				return (RTTlist, min(int(options.count), len(RTTlist) + lost), True)
+
+	rtt = rtt_history.parseRTT(lines)
+	if rtt is not None: RTTlist.append(rtt)
+	proc.wait()
+	return (RTTlist, int(options.count), False)
+
+
+def runNative(options, destination):
+	"""
+	Sends the loopback messages using the native OAM engine, with the same results as runEthping
+	"""
+	import oam_engine
+	vlan = None
+	if len(options.vlan) > 0: vlan = int(options.vlan)
+	level = 0
+	if len(options.mdlevel) > 0: level = int(options.mdlevel)
+
+	stop = None
+	if options.early: stop = lambda replies, lost: decided(options, replies, lost)
+
+	engine = oam_engine.OAMEngine(options.interface, vlan, level)
+	try:
+		result = engine.loopback([destination], int(options.count), float(options.interval), float(options.interval), stop)[destination]
+	finally:
+		engine.close()
+	return (result['rtts'], result['sent'], result['stopped'])
+
+
+def formatPerfdata(stats, packetloss, options, percentiles):
+	"""
+	Returns the Nagios perfdata of an ethping result
+	"""
+	warning = ''
+	if options.warn_on_packetloss == '1': warning = '0'
+	perfdata = "rta={0:.4f}ms;;;0 pl={1:.1f}%;{2};{3};0;100".format(stats['rta'], packetloss, warning, options.critical_loss)
+	for key in ['rtmin', 'rtmax', 'rtsd', 'jitter'] + ['p' + p for p in percentiles]:
+		perfdata = perfdata + " {0}={1:.4f}ms;;;0".format(key, stats[key])
+	return perfdata
+
+
+
+def historyStatistics(options, name, RTTlist, sent, percentiles):
+	"""
+	Adds the samples of this run to the RTT history of target name, and returns the statistics over the history,
+	its packet loss and the RTT trend: the percentage the average RTT of the newest half of the history differs
+	from the oldest half.
+	"""
+	rtt_history.history_dir = options.history_dir
+	now = time.time()
+	history = rtt_history.RTTHistory(name, int(options.history))
+	try:
+		history.append([(now, rtt) for rtt in RTTlist] + [(now, None)] * max(0, sent - len(RTTlist)))
+		samples = history.samples()
+	finally:
+		history.close()
+
+	RTTwindow = [rtt for (timestamp, rtt) in samples if rtt is not None]
+	stats = rtt_history.rttStatistics(RTTwindow, percentiles)
+	packetloss = 0.0
+	if len(samples) > 0: packetloss = 100.0 * (len(samples) - len(RTTwindow)) / len(samples)
+
+	trend = 0.0
+	half = len(RTTwindow) // 2
+	if half > 0:
+		older = sum(RTTwindow[:half]) / half
+		newer = sum(RTTwindow[-half:]) / half
+		if older > 0: trend = 100.0 * (newer - older) / older
+	return (stats, packetloss, trend, len(samples))
+
+
+def ethping(options, destination):
+	"""
+	Probes destination with ethping, and returns the Nagios state and output line
+	"""
+	ErrorState=0
 
 	# prepare and generate system call for executing ethping
 
@@ -102,31 +262,88 @@ def main():
 	if len(options.vlan) > 0:
 		call.append("-v")
 		call.append(options.vlan)
-        if len(options.mdlevel) > 0:
+	if len(options.mdlevel) > 0:
 		call.append("-l")
 		call.append(options.mdlevel)
-	call.append(args[0])
-	
-	ret = subprocess.check_output(call)
-	result = ret.split("ms")
+	call.append(destination)
 	
-	RTTlist= []
-	for i in result:
-		value = i[i.rfind(', ')+1:].strip(' ')
-		if is_number(value) :
-			RTTlist.append(float(value))
-	
-	if len(RTTlist) == 0:
-		packetloss = 100
-		RTA = 0
-	else:
-		packetloss = 100.0 - (len(RTTlist) / int(options.count)) * 100
-		RTA = sum(RTTlist)/len(RTTlist)
+	percentiles = [p for p in options.percentiles.split(',') if len(p) > 0]
+
+	with phase_timing.phase('probe'):
+		if options.native:
+			(RTTlist, sent, stopped) = runNative(options, destination)
+		else:
+			(RTTlist, sent, stopped) = runEthping(call, options)
+	phase_timing.count('probes', sent)
+
+	packetloss = 100.0
+	if sent > 0: packetloss = 100.0 * (sent - len(RTTlist)) / sent
+	stats = rtt_history.rttStatistics(RTTlist, percentiles)
 	
 	if (packetloss > 0) & (options.warn_on_packetloss == '1'): ErrorState = 1
-        if packetloss == 100: ErrorState = 2	
+	if packetloss >= float(options.critical_loss) or len(RTTlist) == 0: ErrorState = 2
 	
-	print "PING {0} {1} - Packet loss = {2}%, RTA = {3:.4f} ms".format(args[0],ErrorStateString[ErrorState], int(packetloss), RTA)
+	perfdata = formatPerfdata(stats, packetloss, options, percentiles)
+	historyString = ""
+	if int(options.history) > 0:
+		name = options.name or options.interface + "_" + destination
+		with phase_timing.phase('history'):
+			(window, windowloss, trend, samples) = historyStatistics(options, name, RTTlist, sent, percentiles)
+		if len(options.rta_warning) > 0 and window['rta'] > float(options.rta_warning): ErrorState = max(ErrorState, 1)
+		if len(options.trend_warning) > 0 and trend > float(options.trend_warning): ErrorState = max(ErrorState, 1)
+		if len(options.rta_critical) > 0 and window['rta'] > float(options.rta_critical): ErrorState = 2
+		historyString = ", last {0} ethpings: loss = {1:.1f}%, RTA = {2:.4f} ms, trend = {3:+.1f}%".format(samples, windowloss, window['rta'], trend)
+		perfdata = perfdata + " hist_rta={0:.4f}ms;{1};{2};0 hist_pl={3:.1f}%;;;0;100 hist_jitter={4:.4f}ms;;;0 trend={5:.1f}%;{6};;".format(
+						window['rta'], options.rta_warning, options.rta_critical, windowloss, window['jitter'], trend, options.trend_warning)
+		for p in percentiles:
+			perfdata = perfdata + " hist_p{0}={1:.4f}ms;;;0".format(p, window['p' + p])
+
+	if options.statistics: perfdata = perfdata + " " + phase_timing.formatPerfdata()
+
+	stoppedString = ""
+	if stopped: stoppedString = " (stopped after {0} of {1} ethpings)".format(sent, options.count)
+	output = "PING {0} {1} - Packet loss = {2}%, RTA = {3:.4f} ms{4}{5} | {6}".format(destination,ErrorStateString[ErrorState], int(packetloss),
+								stats['rta'], stoppedString, historyString, perfdata)
+	return (ErrorState, output)
+
+
+def checkTarget(options, target):
+	"""
+	Multi-target mode entry, probes a target read from the --targets file
+	"""
+	if len(target['options'].interface) == 0:
+		return {'state' : 3, 'output' : "No interface specified"}
+	phase_timing.reset()
+	(state, output) = ethping(target['options'], target['destination'])
+	if len(target['options'].timing_log) > 0:
+		phase_timing.logRun(target['options'].timing_log, "check_ethping.py", target['destination'], state)
+	return {'state' : state, 'output' : output}
+
+
+def main():
+	"""
+	Main function for check_ethping.py 
+	"""
+
+	# Parse options and arguments
+
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+	phase_timing.start(options.profile)
+	if len(options.targets) > 0:
+		state = multitarget.runMultiTarget(parser, options, checkTarget)
+		if len(options.profile) > 0: phase_timing.stopProfile(options.profile)
+		sys.exit(state)
+	if len(args) == 0:
+        	print "No destination_MAC specified --exiting"
+        	quit()
+	if len(options.interface) == 0:
+		print "No interface specified --exiting"		
+		quit()
+
+	(ErrorState, output) = ethping(options, args[0])
+	print output
+	phase_timing.finish(options, args[0], ErrorState)
  
 	# Exit with value to inform Nagios / Icinga
 	sys.exit(ErrorState)
@@ -30,6 +30,11 @@ import sys
 import subprocess
 import string
 from optparse import OptionParser
+import time
+import multitarget
+import path_store
+import rtt_history
+import phase_timing
 
 ErrorStateString = { 0: "OK", 1: "WARNING", 2: "CRITICAL"}
 
@@ -66,39 +71,158 @@ def buildParser():
 						default='',
 						help="Specified trace path (use comma separated mac addresses)",
 						metavar="MACPATH")
+	parser.add_option("--native",
+						dest="native",
+						action="store_true",
+						default=False,
+						help="Send the linktrace message from this process instead of executing ethtrace")
+	parser.add_option("--track",
+						dest="track",
+						action="store_true",
+						default=False,
+						help="Store the traced path, and warn when it changes")
+	parser.add_option("--verify",
+						dest="verify",
+						action="store_true",
+						default=False,
+						help="Only confirm the last hop of the stored path is reachable, a full trace is done when no path is stored")
+	parser.add_option("--path-dir",
+						dest="path_dir",
+						default=path_store.path_dir,
+						help="Directory of the stored paths (default=" + path_store.path_dir + ")",
+						metavar="DIR")
+	parser.add_option("--change-hold",
+						dest="change_hold",
+						default='3600',
+						help="Seconds a path change is reported (default=3600)",
+						metavar="SECONDS")
+	parser.add_option("--retrace-after",
+						dest="retrace_after",
+						default='86400',
+						help="Seconds after which --verify reports a full retrace is warranted (default=86400)",
+						metavar="SECONDS")
+	phase_timing.addOptions(parser)
+	multitarget.addOptions(parser, "ETHTRACE")
 	return parser
 
-def main():
+def parseHops(options):
 	"""
-	Main function for check_ethtrace.py 
+	Validates the hops option, returns an error message or an empty string
+	"""
+	if len(options.hops) > 0 and options.hops.count(":") > 0:
+		minhopcount = options.hops.split(":")[0]
+		maxhopcount = options.hops.split(":")[1]
+		if minhopcount.isdigit() == False or maxhopcount.isdigit() == False:
+			return "Unable to parse hops option"
+	else:
+		if len(options.hops) > 0 and options.hops.isdigit() == False:
+			return "Unable to parse hops option"
+	return ""
+
+def runNative(options, destination):
+	"""
+	Sends a linktrace message using the native OAM engine, and returns the replies in the
+	[id, ttl, mac] format of the parsed ethtrace output together with the trace id
+	"""
+	import oam_engine
+	vlan = None
+	if len(options.vlan) > 0: vlan = int(options.vlan)
+	level = 0
+	if len(options.mdlevel) > 0: level = int(options.mdlevel)
+
+	engine = oam_engine.OAMEngine(options.interface, vlan, level)
+	try:
+		hops = engine.linktrace(destination)
+	finally:
+		engine.close()
+	return ([[engine.transaction, hop, mac] for (hop, mac, relayAction) in hops], engine.transaction)
+
+def targetName(options, destination):
+	"""
+	Returns the name a target is stored under
+	"""
+	return options.name or options.interface + "_" + destination
+
+def verifyLastHop(options, mac):
+	"""
+	Returns True when mac answers a loopback message
+	"""
+	if options.native:
+		import oam_engine
+		vlan = None
+		if len(options.vlan) > 0: vlan = int(options.vlan)
+		level = 0
+		if len(options.mdlevel) > 0: level = int(options.mdlevel)
+		engine = oam_engine.OAMEngine(options.interface, vlan, level)
+		try:
+			return len(engine.loopback([mac], 1, 1.0, 1.0)[mac]['rtts']) > 0
+		finally:
+			engine.close()
+
+	call = ["/usr/local/bin/ethping","-i",options.interface,"-c","1"]
+	if len(options.vlan) > 0:
+		call.append("-v")
+		call.append(options.vlan)
+	if len(options.mdlevel) > 0:
+		call.append("-l")
+		call.append(options.mdlevel)
+	call.append(mac)
+	try:
+		ret = subprocess.check_output(call)
+	except subprocess.CalledProcessError:
+		return False
+	return len([line for line in ret.split('\n') if rtt_history.parseRTT(line) is not None]) > 0
+
+def verifyPath(options, destination, entry):
+	"""
+	Light check of a stored path, only the last hop is probed. Returns the Nagios state and output line
+	"""
+	name = targetName(options, destination)
+	age = time.time() - entry['traced']
+	hops = len(entry['path'])
+	lasthop = entry['path'][-1]
+	if not verifyLastHop(options, lasthop):
+		return (1, "ETHTRACE {0} {1} - hops = {2} -- Last hop {3} not reachable, full retrace warranted".format(
+				destination, ErrorStateString[1], hops, lasthop))
+	path_store.recordVerify(name)
+	if age > float(options.retrace_after):
+		return (1, "ETHTRACE {0} {1} - hops = {2} -- Path traced {3}s ago, full retrace warranted".format(
+				destination, ErrorStateString[1], hops, int(age)))
+	return (0, "ETHTRACE {0} {1} - hops = {2} (last hop {3} verified, path traced {4}s ago)".format(
+				destination, ErrorStateString[0], hops, lasthop, int(age)))
+
+def trackPath(options, destination, path):
+	"""
+	Stores the traced path, and returns the state and message reporting a recent path change
+	"""
+	name = targetName(options, destination)
+	entry = path_store.recordTrace(name, path)
+	if entry['changed'] is None or time.time() - entry['changed'] > float(options.change_hold):
+		return (0, "")
+	drift = len(entry['path']) - len(entry['previous'])
+	return (1, "-- Path changed {0}s ago (previous: {1}  detected: {2}, hop drift {3:+d})".format(
+			int(time.time() - entry['changed']), ",".join(entry['previous']), ",".join(entry['path']), drift))
+
+def ethtrace(options, destination):
+	"""
+	Traces destination with ethtrace, and returns the Nagios state and output line
 	"""
-	
 	ErrorState=0
 	ErrorMsg=""
 	minmaxhopsused = False
 
-	# Parse options and arguments
-	parser = buildParser()
-	(options, args) = parser.parse_args()
-	
-	if len(args) == 0:				
-		print "No destination MAC specified --exiting"
-		quit()
-	if len(options.interface) == 0:
-		print "No interface specified --exiting"		
-		quit()
-	if len(options.hops) > 0 and options.hops.count(":") > 0:
+	path_store.path_dir = options.path_dir
+	if options.verify:
+		entry = path_store.readPath(targetName(options, destination))
+		if entry is not None:
+			with phase_timing.phase('verify'):
+				return verifyPath(options, destination, entry)
+
+	if options.hops.count(":") > 0:
 		minhopcount = options.hops.split(":")[0]
 		maxhopcount = options.hops.split(":")[1]
 		minmaxhopsused = True
-		if minhopcount.isdigit() == False or maxhopcount.isdigit() == False:
-			print "Unable to parse hops option"
-			quit()
-	else:
-		if len(options.hops) > 0 and options.hops.isdigit() == False:
-			print "Unable to parse hops option"
-			quit()
-	
+
 	# prepare and generate system call for executing ethping
 	call = ["/usr/local/bin/ethtrace","-i",options.interface]
 	if len(options.vlan) > 0:			# append vlan option
@@ -108,32 +232,38 @@ def main():
 		call.append("-l")
 		call.append(options.mdlevel)
 
-	call.append(args[0])				# append destination MAC address
+	call.append(destination)				# append destination MAC address
 	
-	ret = ""
-	try:								# execute trace call, and report execution problems
-		ret = subprocess.check_output(call)
-	except subprocess.CalledProcessError:
-		ErrorState=1
-		ErrorMsg="-- Execution problem "
-
 	# parse mac address, trace id and mac address, and determine the highest trace id, because this id contains the only interesting results
 	maxid = 0
 	hops = 0
 	tracedata = []
 	tracepathstring = ""
 
-	result = ret.split('\n')
-	for i in result:
-		if i.count('reply from') > 0:
-			idIndex = i.find('id=') + 3			
-			id = i[idIndex:idIndex+10]				# Find ID of the trace
-			ttlIndex = i.find('ttl=') +4
-			ttl = i[ttlIndex:ttlIndex+1]			# find ttl number of hop
-			macIndex = i.find('reply from') + 11
-			mac = i[macIndex:macIndex+17]			# find MAC address of hop
-			if maxid < id: maxid = id 				# Find the highest ID of the trace, its the only interesting one
-			tracedata.append([id, ttl, mac])		# append trace results to a list
+	if options.native:
+		with phase_timing.phase('trace'):
+			(tracedata, maxid) = runNative(options, destination)
+	else:
+		ret = ""
+		try:								# execute trace call, and report execution problems
+			with phase_timing.phase('trace'):
+				ret = subprocess.check_output(call)
+		except subprocess.CalledProcessError:
+			ErrorState=1
+			ErrorMsg="-- Execution problem "
+
+		result = ret.split('\n')
+		for i in result:
+			if i.count('reply from') > 0:
+				idIndex = i.find('id=') + 3			
+				id = i[idIndex:idIndex+10]				# Find ID of the trace
+				ttlIndex = i.find('ttl=') +4
+				ttl = i[ttlIndex:ttlIndex+1]			# find ttl number of hop
+				macIndex = i.find('reply from') + 11
+				mac = i[macIndex:macIndex+17]			# find MAC address of hop
+				if maxid < id: maxid = id 				# Find the highest ID of the trace, its the only interesting one
+				tracedata.append([id, ttl, mac])		# append trace results to a list
+	phase_timing.count('replies', len(tracedata))
 			
 	if len(tracedata) == 0:	
 		ErrorState = 1
@@ -162,9 +292,60 @@ def main():
 				ErrorState = 1
 				ErrorMsg = ErrorMsg + "-- Invalid hop count (configured: " + options.hops + " detected: " + str(hops) + ")"
 
+		# Compare the path with the last known path of the target
+		if options.track or options.verify:
+			with phase_timing.phase('track'):
+				(TrackState, TrackMsg) = trackPath(options, destination, tracepathstring.split(","))
+			ErrorState = max(ErrorState, TrackState)
+			ErrorMsg = ErrorMsg + TrackMsg
+
+	output = "ETHTRACE {0} {1} - hops = {2} {3}".format(destination, ErrorStateString[ErrorState], hops, ErrorMsg)
+	if options.statistics: output = output + " | " + phase_timing.formatPerfdata()
+	return (ErrorState, output)
+
+def checkTarget(options, target):
+	"""
+	Multi-target mode entry, traces a target read from the --targets file
+	"""
+	if len(target['options'].interface) == 0:
+		return {'state' : 3, 'output' : "No interface specified"}
+	if len(parseHops(target['options'])) > 0:
+		return {'state' : 3, 'output' : parseHops(target['options'])}
+	phase_timing.reset()
+	(state, output) = ethtrace(target['options'], target['destination'])
+	if len(target['options'].timing_log) > 0:
+		phase_timing.logRun(target['options'].timing_log, "check_ethtrace.py", target['destination'], state)
+	return {'state' : state, 'output' : output}
+
+def main():
+	"""
+	Main function for check_ethtrace.py 
+	"""
+	
+	# Parse options and arguments
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+	phase_timing.start(options.profile)
+	
+	if len(options.targets) > 0:
+		state = multitarget.runMultiTarget(parser, options, checkTarget)
+		if len(options.profile) > 0: phase_timing.stopProfile(options.profile)
+		sys.exit(state)
+	if len(args) == 0:				
+		print "No destination MAC specified --exiting"
+		quit()
+	if len(options.interface) == 0:
+		print "No interface specified --exiting"		
+		quit()
+	if len(parseHops(options)) > 0:
+		print parseHops(options)
+		quit()
+	
+	(ErrorState, output) = ethtrace(options, args[0])
 
 	# print output			
-	print "ETHTRACE {0} {1} - hops = {2} {3}".format(args[0], ErrorStateString[ErrorState], hops, ErrorMsg)
+	print output
+	phase_timing.finish(options, args[0], ErrorState)
  
 	# Exit with value to inform Nagios / Icinga
 	sys.exit(ErrorState)
@@ -0,0 +1,288 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Fork server for the check scripts.
+The server imports the check scripts and the modules they use (netsnmp, ncclient with paramiko, lxml) once,
+and forks a child per check request received on a unix socket, so a check does not pay for interpreter
+startup and imports. check_client.py is executed by Icinga / Nagios in place of the check scripts, passes
+the command line to the server and relays output and exit code. The checks run the same as standalone,
+a fresh child per request. When the server is not running, check_client.py executes the script itself.
+Example: ./check_server.py -s /var/run/icinga/check_server.sock
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import socket
+import struct
+import threading
+import traceback
+from optparse import OptionParser
+
+import cfm_core
+import cfm_drivers
+import check_ethping
+import check_ethtrace
+
+# Location of the server socket:
+server_socket="/var/run/icinga/check_server.sock"
+
+# Modules imported by the checks on demand, imported by the server beforehand when installed
+preload = "netsnmp,snmp_engine,ncclient.manager,ncclient.transport,ncclient.xml_,ncclient.operations,lxml.etree,oam_engine"
+
+# Check scripts served, by name without .py
+scripts = {	'check_cfm_state_8021ag' : lambda: cfm_core.main(cfm_drivers.Dot1agDriver()),
+		'check_cfm_state_ciena' : lambda: cfm_core.main(cfm_drivers.CienaDriver()),
+		'check_cfm_state_juniper' : lambda: cfm_core.main(cfm_drivers.JunosDriver()),
+		'check_ethping' : check_ethping.main,
+		'check_ethtrace' : check_ethtrace.main}
+
+# Frame types of the replies: output for stdout, output for stderr, exit code
+STDOUT = 'O'
+STDERR = 'E'
+EXIT = 'X'
+
+
+def sendFrame(sock, kind, data):
+	sock.sendall(kind + struct.pack('!I', len(data)) + data)
+
+
+def readExactly(sock, size):
+	"""
+	Reads size bytes from sock, returns less when the connection is closed
+	"""
+	data = ''
+	while len(data) < size:
+		chunk = sock.recv(size - len(data))
+		if len(chunk) == 0: break
+		data += chunk
+	return data
+
+
+def readRequest(sock):
+	"""
+	Reads a request, the length prefixed command line of a check joined by NUL characters
+	"""
+	header = readExactly(sock, 4)
+	if len(header) < 4: return None
+	return readExactly(sock, struct.unpack('!I', header)[0]).split('\0')
+
+
+class FrameWriter(object):
+	"""
+	File object collecting the output written to sys.stdout or sys.stderr of a check, sent as one frame
+	of type kind when flushed
+	"""
+	def __init__(self, sock, kind):
+		self.sock = sock
+		self.kind = kind
+		self.buffer = []
+		self.softspace = 0
+
+	def write(self, data):
+		if isinstance(data, unicode): data = data.encode('utf-8')
+		self.buffer.append(data)
+
+	def writelines(self, lines):
+		for line in lines: self.write(line)
+
+	def flush(self):
+		if len(self.buffer) == 0: return
+		data = ''.join(self.buffer)
+		self.buffer = []
+		sendFrame(self.sock, self.kind, data)
+
+	def isatty(self):
+		return False
+
+
+def exitCode(e):
+	"""
+	Returns the exit code of a SystemExit, printing its message like the interpreter does
+	"""
+	if e.code is None: return 0
+	if isinstance(e.code, int): return e.code
+	print >> sys.stderr, e.code
+	return 1
+
+
+def runCheck(conn, options):
+	"""
+	Child process: runs the check requested on conn, sends its output and exit code, and exits
+	"""
+	code = 3
+	os.setpgid(0, 0)
+	try:
+		argv = readRequest(conn)
+		if argv is None: os._exit(0)
+		name = os.path.basename(argv[0])
+		if name.endswith('.py'): name = name[:-3]
+
+		# stdin is not relayed, check_client.py runs checks reading their input from stdin itself
+		devnull = os.open(os.devnull, os.O_RDWR)
+		os.dup2(devnull, 0)
+		sys.stdout = FrameWriter(conn, STDOUT)
+		sys.stderr = FrameWriter(conn, STDERR)
+
+		# The timeout is run by a timer thread, a signal handler only runs once the main thread returns from a
+		# blocking call such as the wait for the workers of the multi-host and multi-target modes. It ends the check
+		# itself instead of raising an exception, which those modes would catch as the failure of one item.
+		# The processes started by the check share the process group of this child, and are killed with it.
+		def timeout():
+			print "CHECK TIMEOUT after {0} seconds".format(options.timeout)
+			sys.stdout.flush()
+			sys.stderr.flush()
+			sendFrame(conn, EXIT, '3')
+			os.killpg(0, signal.SIGKILL)
+		timer = threading.Timer(float(options.timeout), timeout)
+		timer.daemon = True
+		timer.start()
+
+		if name not in scripts:
+			print "Unknown check [" + name + "]"
+		else:
+			sys.argv = [name + '.py'] + argv[1:]
+			try:
+				scripts[name]()
+				code = 0
+			except SystemExit, e:
+				code = exitCode(e)
+			except Exception:
+				traceback.print_exc()
+		timer.cancel()
+		sys.stdout.flush()
+		sys.stderr.flush()
+		sendFrame(conn, EXIT, str(code))
+	except Exception:
+		pass				# the client has gone away
+	os._exit(0)
+
+
+def preloadModules(modules):
+	"""
+	Imports the modules the checks import on demand, skipping the ones which are not installed
+	"""
+	for module in [m.strip() for m in modules.split(',') if len(m.strip()) > 0]:
+		try:
+			__import__(module)
+		except ImportError, e:
+			print >> sys.stderr, "not preloading [" + module + "]: " + str(e)
+
+
+def reapChildren(children, block=False):
+	"""
+	Collects the exit status of finished children, waiting for one when block is set
+	"""
+	while len(children) > 0:
+		try:
+			(pid, status) = os.waitpid(-1, (not block) and os.WNOHANG or 0)
+		except OSError, e:
+			if e.errno == errno.ECHILD:
+				children.clear()
+				return
+			raise
+		if pid == 0: return
+		children.discard(pid)
+		block = False
+
+
+def serve(listener, options):
+	"""
+	Accepts check requests and forks a child for every request
+	"""
+	children = set()
+	while True:
+		reapChildren(children, len(children) >= int(options.max_children))
+		if len(select.select([listener], [], [], 1.0)[0]) == 0: continue
+		try:
+			(conn, address) = listener.accept()
+		except socket.error, e:
+			if e.errno in (errno.EINTR, errno.EAGAIN): continue
+			raise
+		pid = os.fork()
+		if pid == 0:
+			listener.close()
+			runCheck(conn, options)
+		conn.close()
+		children.add(pid)
+
+
+def buildParser():
+	"""
+	Prepare parsing of command line options
+	"""
+	parser = OptionParser("usage: %prog [options]")
+
+	parser.add_option("-s", "--socket",
+			  dest="socket",
+			  default=server_socket,
+			  help="unix socket to listen on, default = " + server_socket,
+			  metavar="SOCKET")
+	parser.add_option("--preload",
+			  dest="preload",
+			  default=preload,
+			  help="comma separated list of modules to import at startup, default = " + preload,
+			  metavar="MODULES")
+	parser.add_option("--timeout",
+			  dest="timeout",
+			  default='60',
+			  help="seconds after which a check is stopped, default = 60",
+			  metavar="SECONDS")
+	parser.add_option("--max-children",
+			  dest="max_children",
+			  default='200',
+			  help="maximum number of checks running at the same time, default = 200",
+			  metavar="COUNT")
+	return parser
+
+
+def main():
+	"""
+	Main function for check_server.py
+	"""
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+
+	preloadModules(options.preload)
+
+	if os.path.exists(options.socket): os.unlink(options.socket)
+	listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	listener.bind(options.socket)
+	os.chmod(options.socket, 0660)
+	listener.listen(128)
+
+	try:
+		serve(listener, options)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		listener.close()
+		os.unlink(options.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Persistent reachability state per host, shared by the check processes.
+Request timeouts are derived from response times learned per host and request kind (snmp, netconf),
+using the smoothed RTT and RTT variation estimators of TCP: timeout = srtt + 4 * rttvar.
+A circuit breaker opens after --breaker-failures consecutive polls in which the host did not respond,
+after which checks of the host fail fast. Every --breaker-probe seconds one check is let through as a probe,
+and the breaker closes again at the first successful poll. Entries are replaced atomically under a lock file,
+a successful poll is only stored when it closes the breaker or noticeably changes a learned timeout.
+"""
+
+import time
+import cfm_cache
+from collections import defaultdict
+
+# Default directory holding the host state files:
+health_dir="/var/tmp/cfm_health"
+
+# Entries read in this process, updated with the response times measured since
+entries = {}
+
+# Response times measured in this run and not stored yet, per host
+pending = defaultdict(list)
+
+# Learned RTT estimators as last read from or written to the state file, per host
+stored = {}
+
+# Relative change of a learned timeout from which a successful poll is stored
+store_change = 0.1
+
+
+def addOptions(parser):
+	"""
+	Adds the timeout and circuit breaker command line options to parser
+	"""
+	parser.add_option("--retry-budget",
+			  dest="retry_budget",
+			  default='3',
+			  help="total number of request retries per check, default = 3",
+			  metavar="RETRIES")
+	parser.add_option("--breaker-failures",
+			  dest="breaker_failures",
+			  default='3',
+			  help="stop polling a host after this number of consecutive polls without response, default = 3 (0 = never)",
+			  metavar="POLLS")
+	parser.add_option("--breaker-probe",
+			  dest="breaker_probe",
+			  default='300',
+			  help="seconds between probe polls of a host which is not polled, default = 300",
+			  metavar="SECONDS")
+	parser.add_option("--health-dir",
+			  dest="health_dir",
+			  default=health_dir,
+			  help="directory of the host reachability state, default = " + health_dir,
+			  metavar="DIR")
+
+
+def healthPath(options, host):
+	"""
+	Returns the location of the state file of host
+	"""
+	return cfm_cache.cachePath(options.health_dir, host, 'health')
+
+
+def newEntry():
+	return {'failures' : 0, 'probe_at' : 0, 'rtt' : {}}
+
+
+def updateHealth(options, host, update):
+	"""
+	Calls update(entry) with the stored entry of host (None when unknown) while holding its lock,
+	and stores the entry it returns
+	"""
+	return cfm_cache.updateCache(healthPath(options, host), update)
+
+
+def loadEntry(options, host):
+	"""
+	Returns the entry of host, read once per process
+	"""
+	if host not in entries:
+		setEntry(host, cfm_cache.readCache(healthPath(options, host), float('inf')) or newEntry())
+	return entries[host]
+
+
+def setEntry(host, entry):
+	"""
+	Keeps entry as the stored state of host
+	"""
+	entries[host] = entry
+	stored[host] = dict([(kind, list(estimator)) for (kind, estimator) in entry['rtt'].items()])
+	return entry
+
+
+def estimate(entry, kind, rtt):
+	"""
+	Updates the smoothed RTT and RTT variation of kind in entry with a response time
+	"""
+	if kind not in entry['rtt']:
+		entry['rtt'][kind] = [rtt, rtt / 2]
+		return
+	(srtt, rttvar) = entry['rtt'][kind]
+	rttvar = 0.75 * rttvar + 0.25 * abs(srtt - rtt)
+	srtt = 0.875 * srtt + 0.125 * rtt
+	entry['rtt'][kind] = [srtt, rttvar]
+
+
+def addSample(options, host, kind, rtt):
+	"""
+	Adds the response time of a request of kind to host, it is stored at the end of the poll
+	"""
+	estimate(loadEntry(options, host), kind, rtt)
+	pending[host].append((kind, rtt))
+
+
+def rto(estimator):
+	"""
+	Returns the timeout following from the smoothed RTT and RTT variation of estimator
+	"""
+	(srtt, rttvar) = estimator
+	return srtt + 4 * rttvar
+
+
+def timeout(options, host, kind, initial, minimum, maximum):
+	"""
+	Returns the timeout in seconds for a request of kind to host, initial when no response times are known
+	"""
+	estimator = loadEntry(options, host)['rtt'].get(kind)
+	if estimator is None: return initial
+	return max(minimum, min(maximum, rto(estimator)))
+
+
+def changed(options, host):
+	"""
+	Returns True when a timeout learned for host in this process differs noticeably from the stored one
+	"""
+	for (kind, estimator) in loadEntry(options, host)['rtt'].items():
+		previous = stored[host].get(kind)
+		if previous is None or abs(rto(estimator) - rto(previous)) > store_change * rto(previous):
+			return True
+	return False
+
+
+def allowPoll(options, host):
+	"""
+	Returns None when host may be polled, otherwise the reason it is not. When a probe of a host which
+	is not polled is due, the probe is claimed so concurrent checks of the host keep failing fast.
+	"""
+	threshold = int(options.breaker_failures)
+	if threshold <= 0: return None
+	entry = loadEntry(options, host)
+	if entry['failures'] < threshold: return None
+
+	now = time.time()
+	if now >= entry['probe_at']:
+		claimed = []
+		def claim(current):
+			current = current or newEntry()
+			if current['failures'] < threshold or now >= current['probe_at']:
+				current['probe_at'] = now + int(options.breaker_probe)
+				claimed.append(True)
+			return current
+		entry = setEntry(host, updateHealth(options, host, claim))
+		if len(claimed) > 0: return None
+	return "[{0}] did not respond to the last {1} polls, next probe in {2:.0f}s".format(host, entry['failures'],
+												max(0, entry['probe_at'] - now))
+
+
+def recordPoll(options, host, success):
+	"""
+	Stores the outcome and the response times of a poll of host. A successful poll of a host which
+	was responding is not stored unless its response times changed a learned timeout noticeably.
+	"""
+	if success and loadEntry(options, host)['failures'] == 0 and not changed(options, host):
+		pending.pop(host, None)
+		return
+	now = time.time()
+	threshold = int(options.breaker_failures)
+	def update(current):
+		current = current or newEntry()
+		for (kind, rtt) in pending.pop(host, []):
+			estimate(current, kind, rtt)
+		if success:
+			current['failures'] = 0
+			current['probe_at'] = 0
+		else:
+			current['failures'] += 1
+			if threshold > 0 and current['failures'] >= threshold:
+				current['probe_at'] = now + int(options.breaker_probe)
+		return current
+	setEntry(host, updateHealth(options, host, update))
@@ -0,0 +1,151 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Field extraction from Junos NETconf replies.
+Wanted elements are listed in a dispatch table mapping their tag (without namespace) to a field name,
+and their text is passed to a handler in document order.
+Replies already parsed by ncclient are searched in their lxml tree with one compiled XPath expression.
+Replies only available as xml text, such as the replies relayed by netconf_broker.py, are parsed with a
+streaming (expat based) parser instead. The reply text is already complete in memory when parsing starts,
+it is fed to the parser in slices; no element tree is built next to the text.
+"""
+
+try:
+	import xml.etree.cElementTree as ET
+except ImportError:
+	import xml.etree.ElementTree as ET
+
+
+def localTag(tag):
+	"""
+	Returns the tag of an element without its namespace
+	"""
+	return tag[tag.rfind('}')+1:]
+
+
+class DispatchTarget(object):
+	"""
+	Parser target collecting the text of the elements in the dispatch table
+	"""
+	def __init__(self, dispatch, handler):
+		self.dispatch = dispatch
+		self.handler = handler
+		self.field = None
+		self.text = []
+
+	def start(self, tag, attrib):
+		self.field = self.dispatch.get(localTag(tag))
+		self.text = []
+
+	def data(self, data):
+		if self.field is not None: self.text.append(data)
+
+	def end(self, tag):
+		if self.field is not None:
+			self.handler(self.field, ''.join(self.text))
+			self.field = None
+
+	def close(self):
+		return None
+
+
+class DispatchParser(object):
+	"""
+	Streaming reply parser, calls handler(field, text) for every element listed in dispatch
+	"""
+	def __init__(self, dispatch, handler):
+		self.parser = ET.XMLParser(target=DispatchTarget(dispatch, handler))
+
+	def feed(self, data):
+		self.parser.feed(data)
+
+	def close(self):
+		self.parser.close()
+
+
+def parseReply(reply, dispatch, handler, chunksize=65536):
+	"""
+	Parses a complete reply xml string, fed in slices of chunksize to the streaming parser,
+	calling handler(field, text) for every element listed in dispatch
+	"""
+	parser = DispatchParser(dispatch, handler)
+	for i in range(0, len(reply), chunksize):
+		parser.feed(reply[i:i+chunksize])
+	parser.close()
+
+
+# Replies which are already parsed by ncclient are not serialized and parsed again. Their native lxml tree
+# is searched with one XPath expression per dispatch table, matching the wanted elements on their local
+# name so replies with and without Junos namespaces are handled alike. The expressions are compiled once.
+
+compiledDispatch = {}
+
+def dispatchXPath(dispatch):
+	"""
+	Returns the compiled XPath expression selecting all elements listed in dispatch
+	"""
+	key = tuple(sorted(dispatch.keys()))
+	if key not in compiledDispatch:
+		from lxml import etree
+		compiledDispatch[key] = etree.XPath('//*[' + ' or '.join(["local-name()='%s'" % tag for tag in key]) + ']')
+	return compiledDispatch[key]
+
+
+def replyRoot(reply):
+	"""
+	Returns the root element of the parsed tree of an ncclient reply, or None when only the xml text
+	of the reply is available
+	"""
+	if isinstance(reply, basestring):
+		return None
+	if hasattr(reply, 'parse') and getattr(reply, '_root', None) is None:
+		reply.parse()				# raw RPCReply of an asynchronous RPC
+	if hasattr(reply, '_root'):
+		return reply._root			# RPCReply, or a broker reply which may not be parsed yet
+	if hasattr(reply, 'xpath'):
+		return reply.xpath('/*')[0]		# reply transformed by the Junos device handler
+	return None
+
+
+def walkReply(reply, dispatch, handler):
+	"""
+	Calls handler(field, text) in document order for every element of the reply listed in dispatch.
+	Parsed replies are searched in their native tree, the text of other replies is parsed without building a tree.
+	"""
+	root = replyRoot(reply)
+	if root is None:
+		if not isinstance(reply, basestring): reply = reply.tostring
+		parseReply(reply, dispatch, handler)
+		return
+	for elem in dispatchXPath(dispatch)(root):
+		handler(dispatch[localTag(elem.tag)], elem.text)
+
+
+def replyFields(reply, dispatch):
+	"""
+	Returns a dictionary with the text of the elements of the reply listed in dispatch, indexed by field name.
+	When an element occurs more than once, the last one is kept.
+	"""
+	fields = {}
+	walkReply(reply, dispatch, fields.__setitem__)
+	return fields
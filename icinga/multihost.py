@@ -0,0 +1,196 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Multi-host mode for the check scripts.
+A list of hosts is checked concurrently by a pool of worker processes (netsnmp does not release
+the interpreter lock, so threads would not overlap network waits). Results are submitted to
+Icinga / Nagios as passive check results, through the external command pipe or as checkresult
+spool files, and a timing summary per host is printed.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import traceback
+import multiprocessing
+
+ErrorStateString = { 0: "OK", 1: "WARNING", 2: "CRITICAL", 3: "UNKNOWN"}
+
+
+def addOptions(parser, service):
+	"""
+	Adds the multi-host command line options to parser, service is the default service description
+	"""
+	parser.add_option("-H", "--hosts",
+			  dest="hosts",
+			  default='',
+			  help="check all hosts listed in file (one per line, - = stdin) and submit passive results",
+			  metavar="FILE")
+	parser.add_option("--workers",
+			  dest="workers",
+			  default='20',
+			  help="number of hosts checked concurrently in multi-host mode, default = 20",
+			  metavar="WORKERS")
+	parser.add_option("--command-file",
+			  dest="command_file",
+			  default='',
+			  help="submit passive results to this Icinga / Nagios command pipe",
+			  metavar="PIPE")
+	parser.add_option("--spool-dir",
+			  dest="spool_dir",
+			  default='',
+			  help="submit passive results as files in this checkresult spool directory",
+			  metavar="DIR")
+	parser.add_option("--service",
+			  dest="service",
+			  default=service,
+			  help="service description of passive results, default = " + service,
+			  metavar="SERVICE")
+	parser.add_option("--item-service",
+			  dest="item_service",
+			  default='',
+			  help="also submit a result per item using this service description, {0} is replaced by the item",
+			  metavar="TEMPLATE")
+
+
+def readHostList(filename):
+	"""
+	Returns the hosts listed in a file, skipping empty lines and comments
+	"""
+	if filename == '-':
+		lines = sys.stdin.readlines()
+	else:
+		with open(filename, 'r') as f:
+			lines = f.readlines()
+	hosts = []
+	for line in lines:
+		line = line.split('#')[0].strip()
+		if len(line) > 0: hosts.append(line)
+	return hosts
+
+
+def submitCommand(pipe, host, service, state, output):
+	"""
+	Writes a PROCESS_SERVICE_CHECK_RESULT external command to the command pipe
+	"""
+	command = "[{0}] PROCESS_SERVICE_CHECK_RESULT;{1};{2};{3};{4}\n".format(
+				int(time.time()), host, service, state, output.replace('\n', '\\n'))
+	with open(pipe, 'a') as f:
+		f.write(command)
+
+
+def writeCheckResult(spooldir, host, service, state, output, start, finish):
+	"""
+	Writes a passive service check result file to the checkresult spool directory.
+	The .ok marker file is created last, so the result is never read before it is complete.
+	"""
+	(fd, path) = tempfile.mkstemp(prefix='c', dir=spooldir)
+	with os.fdopen(fd, 'w') as f:
+		f.write("### Passive Check Result File ###\n")
+		f.write("file_time={0}\n\n".format(int(finish)))
+		f.write("host_name={0}\n".format(host))
+		f.write("service_description={0}\n".format(service))
+		f.write("check_type=1\n")
+		f.write("check_options=0\n")
+		f.write("scheduled_check=0\n")
+		f.write("reschedule_check=0\n")
+		f.write("latency=0.0\n")
+		f.write("start_time={0:.6f}\n".format(start))
+		f.write("finish_time={0:.6f}\n".format(finish))
+		f.write("early_timeout=0\n")
+		f.write("exited_ok=1\n")
+		f.write("return_code={0}\n".format(state))
+		f.write("output={0}\n".format(output.replace('\\', '\\\\').replace('\n', '\\n')))
+	os.chmod(path, 0644)
+	open(path + '.ok', 'w').close()
+
+
+def submitResult(options, host, service, state, output, start, finish):
+	"""
+	Submits a passive result using the configured command pipe and / or spool directory
+	"""
+	if len(options.command_file) > 0:
+		submitCommand(options.command_file, host, service, state, output)
+	if len(options.spool_dir) > 0:
+		writeCheckResult(options.spool_dir, host, service, state, output, start, finish)
+
+
+def runCheck(args):
+	"""
+	Worker process entry, runs check(options, item) and adds timing information to the result.
+	Exceptions (and exits) of the check are turned into an UNKNOWN result.
+	"""
+	(check, options, item) = args
+	start = time.time()
+	try:
+		result = check(options, item)
+	except (Exception, SystemExit), e:
+		result = {'state' : 3, 'output' : "collection failed: " + (str(e) or traceback.format_exc().splitlines()[-1]), 'items' : []}
+	result['item'] = item
+	result['start'] = start
+	result['finish'] = time.time()
+	return result
+
+
+def runConcurrent(check, options, items, workers):
+	"""
+	Runs check(options, item) for all items with at most workers running at the same time,
+	and returns the results in order of completion
+	"""
+	pool = multiprocessing.Pool(max(1, min(workers, len(items))))
+	try:
+		results = list(pool.imap_unordered(runCheck, [(check, options, item) for item in items]))
+	finally:
+		pool.close()
+		pool.join()
+	return results
+
+
+def runMultiHost(options, check):
+	"""
+	Multi-host mode: checks the hosts from the --hosts file concurrently and submits the results.
+	check(options, host) returns a dictionary with 'state', 'output' and 'items', a list of
+	(item, state, output) tuples which are submitted separately when --item-service is set.
+	Returns the worst state found.
+	"""
+	hosts = readHostList(options.hosts)
+	if len(hosts) == 0:
+		print "No hosts found in [" + options.hosts + "]"
+		return 3
+
+	sweepStart = time.time()
+	results = runConcurrent(check, options, hosts, int(options.workers))
+	worst = 0
+
+	for result in sorted(results, key=lambda r: r['item']):
+		host = result['item']
+		submitResult(options, host, options.service, result['state'], result['output'], result['start'], result['finish'])
+		if len(options.item_service) > 0:
+			for (item, state, output) in result['items']:
+				submitResult(options, host, options.item_service.format(item), state, output, result['start'], result['finish'])
+		worst = max(worst, result['state'])
+		print "{0:<30} {1:<8} {2:>4} items {3:8.3f}s".format(host, ErrorStateString[result['state']],
+									len(result['items']), result['finish'] - result['start'])
+
+	print "{0} hosts checked in {1:.3f}s with {2} workers".format(len(hosts), time.time() - sweepStart, options.workers)
+	return worst
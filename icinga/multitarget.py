@@ -0,0 +1,199 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Multi-target mode for check_ethping.py and check_ethtrace.py
+A target file lists one probe per line, written as the command line of a single check, e.g.
+	-i em1.1235 -v 1235 -l 7 --name evc-1235 b0a8.6e0d.2f03
+Options given on the command line of the check are the defaults for every target.
+Targets are probed concurrently by a pool of worker processes, with a limit on the number of probes
+running on the same interface. The results are reported as one aggregate result, and optionally
+submitted per target as passive results.
+"""
+
+import sys
+import time
+import copy
+import shlex
+import socket
+import multiprocessing
+import multihost
+
+
+def addOptions(parser, service):
+	"""
+	Adds the multi-target command line options to parser, service is the default service description
+	"""
+	parser.add_option("-T", "--targets",
+			  dest="targets",
+			  default='',
+			  help="probe all targets listed in file (one check command line per line, - = stdin)",
+			  metavar="FILE")
+	parser.add_option("--name",
+			  dest="name",
+			  default='',
+			  help="name of a target in the result, default = interface and destination",
+			  metavar="NAME")
+	parser.add_option("--workers",
+			  dest="workers",
+			  default='20',
+			  help="number of targets probed concurrently, default = 20",
+			  metavar="WORKERS")
+	parser.add_option("--interface-limit",
+			  dest="interface_limit",
+			  default='4',
+			  help="number of targets probed concurrently on the same interface, default = 4",
+			  metavar="PROBES")
+	parser.add_option("--target-timeout",
+			  dest="target_timeout",
+			  default='300',
+			  help="report a target which is not probed within this number of seconds as UNKNOWN, default = 300",
+			  metavar="SECONDS")
+	parser.add_option("--command-file",
+			  dest="command_file",
+			  default='',
+			  help="submit passive results to this Icinga / Nagios command pipe",
+			  metavar="PIPE")
+	parser.add_option("--spool-dir",
+			  dest="spool_dir",
+			  default='',
+			  help="submit passive results as files in this checkresult spool directory",
+			  metavar="DIR")
+	parser.add_option("--passive-host",
+			  dest="passive_host",
+			  default=socket.gethostname(),
+			  help="host name of passive results, default = this host",
+			  metavar="HOST")
+	parser.add_option("--service",
+			  dest="service",
+			  default=service,
+			  help="service description of the aggregate passive result, default = " + service,
+			  metavar="SERVICE")
+	parser.add_option("--item-service",
+			  dest="item_service",
+			  default='',
+			  help="submit a result per target using this service description, {0} is replaced by the target name",
+			  metavar="TEMPLATE")
+
+
+def readTargets(parser, options):
+	"""
+	Returns the targets of the --targets file as a list of dictionaries holding the name, options and
+	destination of the target. Lines are parsed with the parser of the check, using options as defaults.
+	"""
+	lines = multihost.readHostList(options.targets)
+	targets = []
+	for line in lines:
+		(targetOptions, args) = parser.parse_args(shlex.split(line), copy.copy(options))
+		if len(args) == 0:
+			raise ValueError("No destination specified for target [" + line + "]")
+		name = targetOptions.name or targetOptions.interface + "_" + args[0]
+		targets.append({'name' : name, 'options' : targetOptions, 'destination' : args[0]})
+	return targets
+
+
+def runLimited(check, options, items, workers, group, limit, timeout):
+	"""
+	Runs check(options, item) for all items with at most workers running at the same time,
+	and at most limit running for items with the same group(item). Returns the results in order of completion.
+	Items without a result after timeout seconds, for instance because their worker process died, are reported
+	as UNKNOWN and their workers are terminated.
+	"""
+	pending = list(items)
+	running = []			# (item, AsyncResult, submit time) of the items handed to the pool
+	results = []
+	abandoned = False
+	pool = multiprocessing.Pool(max(1, min(workers, len(items))))
+	try:
+		while len(pending) > 0 or len(running) > 0:
+			for item in list(pending):
+				if len(running) >= workers: break
+				if len([entry for entry in running if group(entry[0]) == group(item)]) >= limit: continue
+				pending.remove(item)
+				running.append((item, pool.apply_async(multihost.runCheck, ((check, options, item),)), time.time()))
+
+			# a wait with timeout, unlike a blocking get, can be interrupted with Ctrl-C
+			running[0][1].wait(0.1)
+			for entry in list(running):
+				(item, reply, start) = entry
+				if reply.ready():
+					try:
+						result = reply.get()
+					except Exception, e:
+						result = {'state' : 3, 'output' : "probe failed: " + str(e), 'items' : [], 'item' : item,
+							'start' : start, 'finish' : time.time()}
+				elif time.time() - start >= timeout:
+					result = {'state' : 3, 'output' : "probe did not finish within {0}s".format(timeout), 'items' : [],
+						'item' : item, 'start' : start, 'finish' : time.time()}
+					abandoned = True
+				else:
+					continue
+				running.remove(entry)
+				results.append(result)
+	finally:
+		if abandoned or len(running) > 0:
+			pool.terminate()
+		else:
+			pool.close()
+		pool.join()
+	return results
+
+
+def runMultiTarget(parser, options, check):
+	"""
+	Multi-target mode: probes the targets from the --targets file concurrently, prints the aggregate result
+	with a line per target and submits the passive results. check(options, target) returns a dictionary
+	with 'state' and 'output' of a target. Returns the worst state found.
+	"""
+	try:
+		targets = readTargets(parser, options)
+	except (IOError, ValueError), e:
+		print "Unable to read targets: " + str(e)
+		return 3
+	if len(targets) == 0:
+		print "No targets found in [" + options.targets + "]"
+		return 3
+
+	sweepStart = time.time()
+	results = runLimited(check, options, targets, int(options.workers),
+				lambda target: target['options'].interface, int(options.interface_limit), float(options.target_timeout))
+	results.sort(key=lambda r: r['item']['name'])
+
+	counts = [0, 0, 0, 0]
+	worst = 0
+	details = ""				# perfdata of the targets is only part of their own passive results
+	for result in results:
+		target = result['item']
+		counts[result['state']] += 1
+		worst = max(worst, result['state'])
+		details = details + "\n{0:<30} {1:<8} {2:7.3f}s {3}".format(target['name'], multihost.ErrorStateString[result['state']],
+										result['finish'] - result['start'], result['output'].split('|')[0].strip())
+		if len(options.item_service) > 0:
+			multihost.submitResult(options, options.passive_host, options.item_service.format(target['name']),
+						result['state'], result['output'], result['start'], result['finish'])
+
+	output = "{0} {1} - {2} targets: {3} OK, {4} WARNING, {5} CRITICAL, {6} UNKNOWN in {7:.3f}s".format(
+			options.service, multihost.ErrorStateString[worst], len(results), counts[0], counts[1], counts[2], counts[3],
+			time.time() - sweepStart)
+	multihost.submitResult(options, options.passive_host, options.service, worst, output, sweepStart, time.time())
+	print output + details
+	return worst
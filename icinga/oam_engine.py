@@ -0,0 +1,321 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Native IEEE 802.1ag / Y.1731 loopback (LBM/LBR) and linktrace (LTM/LTR) engine, used by check_ethping.py
+and check_ethtrace.py with --native instead of the ethping and ethtrace programs.
+Frames are sent and received on a raw AF_PACKET socket (root or CAP_NET_RAW is required), optionally with
+an 802.1Q tag, at the given MD level. Outstanding transactions are matched on their transaction identifier,
+so many loopbacks can be in flight on one socket.
+Run as a script, a responder answers LBMs and LTMs addressed to the interface, which allows local testing:
+	ip netns add oam; ip link add veth0 type veth peer name veth1; ip link set veth1 netns oam
+	ip link set veth0 up; ip netns exec oam ip link set veth1 up
+	ip netns exec oam ./oam_engine.py -i veth1 -l 7 &
+	./check_ethping.py --native -i veth0 -l 7 <MAC of veth1>
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import select
+import socket
+import struct
+import binascii
+from optparse import OptionParser
+
+ETH_P_ALL = 0x0003
+ETH_P_8021Q = 0x8100
+ETH_P_CFM = 0x8902
+
+PACKET_OUTGOING = 4
+
+OPCODE_LBR = 2
+OPCODE_LBM = 3
+OPCODE_LTR = 4
+OPCODE_LTM = 5
+
+FLAG_USEFDBONLY = 0x80
+FLAG_FWDYES = 0x40
+FLAG_TERMINALMEP = 0x20
+
+TLV_END = 0
+TLV_LTM_EGRESS = 7
+TLV_LTR_EGRESS = 8
+
+RELAY_HIT = 1
+
+RelayActionString = { 1: "RlyHit", 2: "RlyFDB", 3: "RlyMPDB"}
+
+# Frames are padded to the minimum Ethernet frame size (without FCS)
+min_frame_size = 60
+
+
+def parseMAC(text):
+	"""
+	Returns the 6 byte address of a MAC address written with any separators (00:11:22:33:44:55, 0011.2233.4455)
+	"""
+	digits = re.sub('[^0-9a-fA-F]', '', text)
+	if len(digits) != 12:
+		raise ValueError("Invalid MAC address [" + text + "]")
+	return binascii.unhexlify(digits)
+
+
+def formatMAC(address):
+	"""
+	Returns a 6 byte address as 00:11:22:33:44:55
+	"""
+	return ':'.join(['%02x' % ord(c) for c in address])
+
+
+def multicastGroup(level, linktrace=False):
+	"""
+	Returns the CFM group address of a MD level, class 1 (CCM, LBM) or class 2 (LTM)
+	"""
+	return parseMAC('01:80:c2:00:00:3%x' % (level + 8 * int(linktrace)))
+
+
+def interfaceMAC(interface):
+	"""
+	Returns the 6 byte address of a local interface
+	"""
+	with open('/sys/class/net/' + interface + '/address', 'r') as f:
+		return parseMAC(f.read().strip())
+
+
+def buildFrame(destination, source, vlan, level, opcode, flags, tlvOffset, payload):
+	"""
+	Returns a CFM frame, tagged when vlan is set, ending with an End TLV
+	"""
+	frame = destination + source
+	if vlan is not None:
+		frame = frame + struct.pack('!HH', ETH_P_8021Q, vlan & 0xfff)
+	frame = frame + struct.pack('!HBBBB', ETH_P_CFM, level << 5, opcode, flags, tlvOffset) + payload + chr(TLV_END)
+	return frame + '\x00' * max(0, min_frame_size - len(frame))
+
+
+def parseFrame(data):
+	"""
+	Returns a dictionary with the header fields and body of a CFM frame, or None for other frames
+	"""
+	if len(data) < 18: return None
+	(ethertype,) = struct.unpack('!H', data[12:14])
+	offset = 14
+	vlan = None
+	if ethertype == ETH_P_8021Q:
+		(tci, ethertype) = struct.unpack('!HH', data[14:18])
+		vlan = tci & 0xfff
+		offset = 18
+	if ethertype != ETH_P_CFM or len(data) < offset + 4: return None
+	(level, opcode, flags, tlvOffset) = struct.unpack('!BBBB', data[offset:offset+4])
+	return {'destination' : data[0:6], 'source' : data[6:12], 'vlan' : vlan, 'level' : level >> 5,
+		'opcode' : opcode, 'flags' : flags, 'tlvOffset' : tlvOffset, 'body' : data[offset+4:]}
+
+
+class OAMEngine:
+	"""
+	CFM maintenance point on a local interface, sending and receiving loopback and linktrace messages
+	"""
+	def __init__(self, interface, vlan=None, level=0):
+		self.interface = interface
+		self.level = level
+		self.mac = interfaceMAC(interface)
+		# Frames on a VLAN device are tagged by the kernel, otherwise the tag is added here
+		self.vlan = None
+		if vlan is not None and not os.path.exists('/proc/net/vlan/' + interface):
+			self.vlan = vlan
+		proto = ETH_P_CFM
+		if self.vlan is not None: proto = ETH_P_ALL
+		self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(proto))
+		self.sock.bind((interface, proto))
+		self.transaction = random.randint(0, 0x7fffffff)
+
+	def close(self):
+		self.sock.close()
+
+	def nextTransaction(self):
+		self.transaction = (self.transaction + 1) & 0xffffffff
+		return self.transaction
+
+	def send(self, destination, opcode, flags, tlvOffset, payload):
+		self.sock.send(buildFrame(destination, self.mac, self.vlan, self.level, opcode, flags, tlvOffset, payload))
+
+	def receive(self, timeout):
+		"""
+		Returns the next CFM frame at our MD level received within timeout seconds (None = wait forever)
+		and its receive time, or (None, None) on timeout
+		"""
+		deadline = None
+		if timeout is not None: deadline = time.time() + timeout
+		while True:
+			wait = None
+			if deadline is not None: wait = max(0, deadline - time.time())
+			if len(select.select([self.sock], [], [], wait)[0]) == 0:
+				return (None, None)
+			(data, address) = self.sock.recvfrom(65535)
+			received = time.time()
+			if address[2] == PACKET_OUTGOING: continue
+			frame = parseFrame(data)
+			if frame is None or frame['level'] != self.level: continue
+			# The kernel may have stripped the tag, frames without tag are matched on their transaction only
+			if self.vlan is not None and frame['vlan'] is not None and frame['vlan'] != self.vlan: continue
+			return (frame, received)
+
+	def loopback(self, destinations, count, interval, timeout, stop=None):
+		"""
+		Sends count LBMs to each destination, one every interval seconds, and collects the LBRs.
+		An LBM without LBR after timeout seconds is lost. stop(replies, lost) is called for a destination
+		after every reply or loss, the destination gets no more LBMs when it returns True.
+		Returns a dictionary with per destination the list of RTTs in ms, the number of LBMs sent
+		and whether it was stopped.
+		"""
+		results = {}
+		for destination in destinations:
+			results[destination] = {'rtts' : [], 'sent' : 0, 'lost' : 0, 'stopped' : False}
+		outstanding = {}
+		nextSend = time.time()
+
+		while True:
+			now = time.time()
+			active = [d for d in destinations if results[d]['sent'] < count and not results[d]['stopped']]
+			if now >= nextSend and len(active) > 0:
+				for destination in active:
+					transaction = self.nextTransaction()
+					outstanding[transaction] = (destination, time.time())
+					self.send(parseMAC(destination), OPCODE_LBM, 0, 4, struct.pack('!I', transaction))
+					results[destination]['sent'] += 1
+				nextSend = nextSend + interval
+
+			# Expire the LBMs which are not answered in time
+			for transaction in [t for t in outstanding if now - outstanding[t][1] >= timeout]:
+				result = results[outstanding.pop(transaction)[0]]
+				result['lost'] += 1
+				if stop is not None and stop(len(result['rtts']), result['lost']): result['stopped'] = True
+
+			outstanding = dict([(t, outstanding[t]) for t in outstanding if not results[outstanding[t][0]]['stopped']])
+			active = [d for d in destinations if results[d]['sent'] < count and not results[d]['stopped']]
+			if len(outstanding) == 0 and len(active) == 0: break
+
+			deadlines = [outstanding[t][1] + timeout for t in outstanding]
+			if len(active) > 0: deadlines.append(nextSend)
+			(frame, received) = self.receive(max(0, min(deadlines) - time.time()))
+			if frame is None or frame['opcode'] != OPCODE_LBR or len(frame['body']) < 4: continue
+			(transaction,) = struct.unpack('!I', frame['body'][:4])
+			if transaction not in outstanding or frame['source'] != parseMAC(outstanding[transaction][0]): continue
+			(destination, sent) = outstanding.pop(transaction)
+			result = results[destination]
+			result['rtts'].append((received - sent) * 1000.0)
+			if stop is not None and stop(len(result['rtts']), result['lost']): result['stopped'] = True
+
+		return results
+
+	def linktrace(self, destination, ttl=64, timeout=5.0):
+		"""
+		Sends an LTM for destination and collects the LTRs until the destination replies or timeout seconds pass.
+		Returns a list of (hop, MAC address, relay action) tuples ordered by hop.
+		"""
+		transaction = self.nextTransaction()
+		target = parseMAC(destination)
+		egress = chr(TLV_LTM_EGRESS) + struct.pack('!HH', 8, 0) + self.mac
+		self.send(multicastGroup(self.level, True), OPCODE_LTM, FLAG_USEFDBONLY, 17,
+				struct.pack('!IB', transaction, ttl) + self.mac + target + egress)
+
+		hops = {}
+		deadline = time.time() + timeout
+		while time.time() < deadline:
+			(frame, received) = self.receive(deadline - time.time())
+			if frame is None: break
+			if frame['opcode'] != OPCODE_LTR or len(frame['body']) < 6: continue
+			(replyTransaction, replyTTL, relayAction) = struct.unpack('!IBB', frame['body'][:6])
+			if replyTransaction != transaction: continue
+			hop = ttl - replyTTL
+			hops[hop] = (hop, formatMAC(frame['source']), relayAction)
+			# Done when the destination replied and all hops before it are known
+			if relayAction == RELAY_HIT and len(hops) >= hop: break
+
+		return [hops[hop] for hop in sorted(hops)]
+
+	def respond(self):
+		"""
+		Answers the LBMs and LTMs for this interface at our MD level, until interrupted
+		"""
+		while True:
+			(frame, received) = self.receive(None)
+			if frame['opcode'] == OPCODE_LBM and frame['destination'] in (self.mac, multicastGroup(self.level)):
+				self.send(frame['source'], OPCODE_LBR, 0, frame['tlvOffset'], frame['body'][:frame['tlvOffset']])
+			if frame['opcode'] == OPCODE_LTM and len(frame['body']) >= 17 and frame['body'][11:17] == self.mac:
+				(transaction, ttl) = struct.unpack('!IB', frame['body'][:5])
+				egress = chr(TLV_LTR_EGRESS) + struct.pack('!H', 16) + frame['body'][20:28].ljust(8, '\x00') + struct.pack('!H', 0) + self.mac
+				self.send(frame['body'][5:11], OPCODE_LTR, (frame['flags'] & FLAG_USEFDBONLY) | FLAG_TERMINALMEP, 6,
+						struct.pack('!IBB', transaction, max(0, ttl - 1), RELAY_HIT) + egress)
+
+
+def buildParser():
+	"""
+	Prepare parsing of command line options
+	"""
+	parser = OptionParser("usage: %prog [options]")
+
+	parser.add_option("-i", "--interface",
+			  dest="interface",
+			  default="",
+			  help="interface to answer on",
+			  metavar="INTERFACE")
+	parser.add_option("-v", "--vlan",
+			  dest="vlan",
+			  default="",
+			  help="vlan to answer on",
+			  metavar="VLAN")
+	parser.add_option("-l", "--mdlevel",
+			  dest="mdlevel",
+			  default="0",
+			  help="OAM Maintenance Level, default = 0",
+			  metavar="MDLEVEL")
+	return parser
+
+
+def main():
+	"""
+	Main function for oam_engine.py, runs a responder
+	"""
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+	if len(options.interface) == 0:
+		print "No interface specified --exiting"
+		quit()
+
+	vlan = None
+	if len(options.vlan) > 0: vlan = int(options.vlan)
+	engine = OAMEngine(options.interface, vlan, int(options.mdlevel))
+	print "Answering LBM and LTM on {0} ({1}), MD level {2}".format(options.interface, formatMAC(engine.mac), options.mdlevel)
+	try:
+		engine.respond()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		engine.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Metrics exporter for Ethernet OAM data collected by the other scripts.
+Metrics are read from the shared on-disk state on every export, no device is queried:
+	- the MEP caches of the check_cfm_state scripts and cfm_daemon.py (--cache-dir)
+	- the state file of cfm_daemon.py (--state-file)
+	- the DMM caches of juniper_dmm.py
+	- the RTT histories of check_ethping.py (--history)
+The metrics are served in OpenMetrics text format over HTTP, and / or sent to Carbon in batches of plaintext lines.
+Example: ./oam_exporter.py --listen 127.0.0.1:9472 --state-file /var/tmp/cfm_daemon.json --carbon graphite:2003
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import socket
+import threading
+import BaseHTTPServer
+from optparse import OptionParser
+from collections import defaultdict
+
+import cfm_core
+import cfm_drivers
+import rtt_history
+
+# Directory holding the DMM caches of juniper_dmm.py (juniper_dmm.cache_dir):
+dmm_cache_dir="/var/tmp/juniper_dmm"
+
+# RTT percentiles exported per ethping target
+history_percentiles = ['50', '95']
+
+
+def labelText(value):
+	"""
+	Returns a label value as utf-8 encoded string, values read from json files are unicode
+	"""
+	if isinstance(value, unicode): return value.encode('utf-8')
+	return str(value)
+
+
+class MetricFamilies:
+	"""
+	Metric families collected for one export, with their type, help text and samples
+	"""
+	def __init__(self):
+		self.families = {}
+		self.order = []
+
+	def add(self, name, help, labels, value, type='gauge'):
+		if name not in self.families:
+			self.families[name] = (type, help, [])
+			self.order.append(name)
+		self.families[name][2].append((dict([(key, labelText(labels[key])) for key in labels]), value))
+
+
+def readJSON(path):
+	"""
+	Returns the contents of a json file, or None when it is missing or being replaced
+	"""
+	try:
+		with open(path, 'r') as f:
+			return json.load(f)
+	except (IOError, OSError, ValueError):
+		return None
+
+
+def collectMEPs(metrics, options):
+	"""
+	Adds the MEP state found in the MEP caches of the CFM checks
+	"""
+	for driverClass in cfm_drivers.drivers.values():
+		driver = driverClass()
+		suffix = "." + driver.name + ".json"
+		for path in glob.glob(os.path.join(options.cfm_cache_dir, "*" + suffix)):
+			MEPDict = readJSON(path)
+			if MEPDict is None: continue
+			host = os.path.basename(path)[:-len(suffix)]
+			metrics.add('cfm_cache_age_seconds', "Age of the MEP table of the host", {'host' : host}, time.time() - os.path.getmtime(path))
+			for key in MEPDict:
+				# the drivers format their output from the (utf-8) strings of the device, not from unicode
+				mepEntry = dict([(field, labelText(value)) for (field, value) in MEPDict[key].items()])
+				labels = {'host' : host, 'driver' : driver.name, 'mep' : mepEntry.get('ID', key),
+					'level' : mepEntry.get('MdLevel', ''), 'maid' : mepEntry.get('MAIDString', '')}
+				try:
+					values = driver.mepMetrics(mepEntry)
+					mepEntry['ErrorMessage'] = ""
+					values['ccm_ok'] = int(driver.checkMEP_CCM(mepEntry) == 0)
+				except (KeyError, ValueError):
+					continue			# incomplete entry
+				for name in sorted(values):
+					metrics.add('cfm_mep_' + name, "CFM remote MEP " + name.replace('_', ' '), labels, values[name])
+
+
+def collectState(metrics, options):
+	"""
+	Adds the latest check results found in the state file of cfm_daemon.py
+	"""
+	state = readJSON(options.state_file)
+	if state is None: return
+	for host in sorted(state):
+		result = state[host]
+		metrics.add('cfm_check_state', "Icinga state of the CFM check of the host", {'host' : host}, result['state'])
+		metrics.add('cfm_check_duration_seconds', "Duration of the last CFM check of the host", {'host' : host}, result['finish'] - result['start'])
+		metrics.add('cfm_check_timestamp_seconds', "Time of the last CFM check of the host", {'host' : host}, result['finish'])
+		for (item, itemstate, output) in result['items']:
+			metrics.add('cfm_mep_check_state', "Icinga state of the remote MEP", {'host' : host, 'mep' : item}, itemstate)
+
+
+def collectDMM(metrics, options):
+	"""
+	Adds the DMM statistics found in the caches of juniper_dmm.py
+	"""
+	for path in glob.glob(os.path.join(options.dmm_cache_dir, "*.dmm.json")):
+		DMMDict = readJSON(path)
+		if DMMDict is None: continue
+		host = os.path.basename(path)[:-len(".dmm.json")]
+		for dmm in DMMDict:
+			entry = DMMDict[dmm]
+			labels = {'host' : host, 'md' : entry.get('md', ''), 'ma' : entry.get('ma', ''),
+				'local_mep' : entry.get('local-mep', ''), 'remote_mep' : entry.get('remote-mep', '')}
+			for field in ['delay', 'jitter']:
+				try:
+					metrics.add('dmm_' + field + '_microseconds', "Average two-way " + field + " of the DMM iterator", labels, float(entry[field]))
+				except (KeyError, TypeError, ValueError):
+					pass
+
+
+def collectHistory(metrics, options):
+	"""
+	Adds the RTT statistics over the last samples of the RTT histories of check_ethping.py
+	"""
+	for path in glob.glob(os.path.join(options.history_dir, "*.rtt")):
+		try:
+			samples = rtt_history.readHistory(path, int(options.history_samples))
+		except (IOError, OSError):
+			continue
+		if len(samples) == 0: continue
+		labels = {'target' : os.path.basename(path)[:-len(".rtt")]}
+		RTTlist = [rtt for (timestamp, rtt) in samples if rtt is not None]
+		stats = rtt_history.rttStatistics(RTTlist, history_percentiles)
+		metrics.add('ethping_samples', "Number of ethpings the statistics cover", labels, len(samples))
+		metrics.add('ethping_loss_ratio', "Ratio of lost ethpings", labels, float(len(samples) - len(RTTlist)) / len(samples))
+		metrics.add('ethping_last_timestamp_seconds', "Time of the last ethping", labels, samples[-1][0])
+		for key in ['rta', 'rtmin', 'rtmax', 'rtsd', 'jitter'] + ['p' + p for p in history_percentiles]:
+			metrics.add('ethping_' + key + '_milliseconds', "RTT " + key + " of the ethpings", labels, stats[key])
+
+
+def collectMetrics(options):
+	"""
+	Returns the metric families of all sources
+	"""
+	metrics = MetricFamilies()
+	if len(options.cfm_cache_dir) > 0: collectMEPs(metrics, options)
+	if len(options.state_file) > 0: collectState(metrics, options)
+	if len(options.dmm_cache_dir) > 0: collectDMM(metrics, options)
+	if len(options.history_dir) > 0: collectHistory(metrics, options)
+	return metrics
+
+
+def escapeLabel(value):
+	return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def formatOpenMetrics(metrics):
+	"""
+	Returns the metric families in OpenMetrics text format, utf-8 encoded
+	"""
+	lines = []
+	for name in metrics.order:
+		(type, help, samples) = metrics.families[name]
+		lines.append("# TYPE {0} {1}".format(name, type))
+		lines.append("# HELP {0} {1}".format(name, help))
+		for (labels, value) in samples:
+			labelString = ','.join(['{0}="{1}"'.format(key, escapeLabel(labels[key])) for key in sorted(labels)])
+			lines.append("{0}{{{1}}} {2}".format(name, labelString, repr(float(value))))
+	lines.append("# EOF")
+	return '\n'.join(lines) + '\n'
+
+
+def formatCarbon(metrics, prefix, timestamp):
+	"""
+	Returns the metric families as Carbon plaintext lines, labels become path components in sorted label order.
+	The lines are utf-8 encoded.
+	"""
+	lines = []
+	for name in metrics.order:
+		for (labels, value) in metrics.families[name][2]:
+			path = [prefix, name] + [labels[key].replace('.', '_').replace(' ', '_') or '_' for key in sorted(labels)]
+			lines.append("{0} {1} {2}".format('.'.join(path), repr(float(value)), int(timestamp)))
+	return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""
+	Serves the metrics on /metrics
+	"""
+	def do_GET(self):
+		if self.path.split('?')[0] != '/metrics':
+			self.send_error(404)
+			return
+		body = formatOpenMetrics(collectMetrics(self.server.options))
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+def sendCarbon(options):
+	"""
+	Sends all metrics to Carbon in one batch
+	"""
+	(host, port) = options.carbon.rsplit(':', 1)
+	batch = formatCarbon(collectMetrics(options), options.carbon_prefix, time.time())
+	sock = socket.create_connection((host, int(port)), 10)
+	try:
+		sock.sendall(batch)
+	finally:
+		sock.close()
+
+
+def buildParser():
+	"""
+	Prepare parsing of command line options
+	"""
+	parser = OptionParser("usage: %prog [options]")
+
+	parser.add_option("-l", "--listen",
+			  dest="listen",
+			  default='127.0.0.1:9472',
+			  help="address:port of the OpenMetrics endpoint, empty to disable, default = 127.0.0.1:9472",
+			  metavar="ADDRESS")
+	parser.add_option("--carbon",
+			  dest="carbon",
+			  default='',
+			  help="send the metrics to this Carbon plaintext receiver (host:port)",
+			  metavar="HOST:PORT")
+	parser.add_option("--carbon-prefix",
+			  dest="carbon_prefix",
+			  default='ethoam',
+			  help="prefix of the Carbon metric paths, default = ethoam",
+			  metavar="PREFIX")
+	parser.add_option("--interval",
+			  dest="interval",
+			  default='60',
+			  help="seconds between Carbon batches, default = 60",
+			  metavar="SECONDS")
+	parser.add_option("--state-file",
+			  dest="state_file",
+			  default='',
+			  help="state file of cfm_daemon.py",
+			  metavar="FILE")
+	parser.add_option("--cfm-cache-dir",
+			  dest="cfm_cache_dir",
+			  default=cfm_core.cache_dir,
+			  help="MEP cache directory of the CFM checks, default = " + cfm_core.cache_dir,
+			  metavar="DIR")
+	parser.add_option("--dmm-cache-dir",
+			  dest="dmm_cache_dir",
+			  default=dmm_cache_dir,
+			  help="DMM cache directory of juniper_dmm.py, default = " + dmm_cache_dir,
+			  metavar="DIR")
+	parser.add_option("--history-dir",
+			  dest="history_dir",
+			  default=rtt_history.history_dir,
+			  help="RTT history directory of check_ethping.py, default = " + rtt_history.history_dir,
+			  metavar="DIR")
+	parser.add_option("--history-samples",
+			  dest="history_samples",
+			  default='100',
+			  help="number of ethpings the RTT statistics cover, default = 100",
+			  metavar="SAMPLES")
+	parser.add_option("--once",
+			  dest="once",
+			  action="store_true",
+			  default=False,
+			  help="print the metrics in OpenMetrics format and exit")
+	return parser
+
+
+def main():
+	"""
+	Main function for oam_exporter.py
+	"""
+	parser = buildParser()
+	(options, args) = parser.parse_args()
+
+	if options.once:
+		sys.stdout.write(formatOpenMetrics(collectMetrics(options)))
+		return
+	if len(options.listen) == 0 and len(options.carbon) == 0:
+		print "No endpoint or Carbon receiver specified --exiting"
+		quit()
+
+	if len(options.listen) > 0:
+		(address, port) = options.listen.rsplit(':', 1)
+		server = BaseHTTPServer.HTTPServer((address, int(port)), MetricsHandler)
+		server.options = options
+		serverThread = threading.Thread(target=server.serve_forever)
+		serverThread.daemon = True
+		serverThread.start()
+
+	try:
+		while True:
+			if len(options.carbon) > 0:
+				try:
+					sendCarbon(options)
+				except (socket.error, ValueError), e:
+					print >> sys.stderr, "sending to Carbon failed: " + str(e)
+			time.sleep(int(options.interval))
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Persistent store of the last known linktrace path per check_ethtrace.py target.
+Every entry holds the path, when it was first and last traced, when it was last verified,
+and the path it replaced. Entries are replaced atomically under a lock file.
+"""
+
+import time
+import cfm_cache
+
+# Directory holding the path files:
+path_dir="/var/tmp/ethtrace_paths"
+
+
+def storePath(name):
+	"""
+	Returns the location of the path entry of target name
+	"""
+	return cfm_cache.cachePath(path_dir, name.replace(':', ''), 'path')
+
+
+def readPath(name):
+	"""
+	Returns the path entry of target name, or None when no path is known
+	"""
+	return cfm_cache.readCache(storePath(name), float('inf'))
+
+
+def updatePath(name, update):
+	"""
+	Calls update(entry) with the current entry of target name (None when unknown) while holding its lock,
+	and stores the entry it returns
+	"""
+	return cfm_cache.updateCache(storePath(name), update)
+
+
+def recordTrace(name, hops):
+	"""
+	Stores the path (list of MAC addresses) found by a full trace of target name, and returns the entry.
+	When the path differs from the known path, the known path is kept as previous path.
+	"""
+	now = time.time()
+	def update(entry):
+		if entry is not None and entry['path'] == hops:
+			entry['traced'] = now
+			return entry
+		return {'path' : hops, 'first' : now, 'traced' : now, 'verified' : now, 'previous' : entry and entry['path'],
+			'changed' : entry is not None and now or None}
+	return updatePath(name, update)
+
+
+def recordVerify(name):
+	"""
+	Marks the known path of target name as verified, and returns the entry
+	"""
+	now = time.time()
+	def update(entry):
+		entry['verified'] = now
+		return entry
+	return updatePath(name, update)
@@ -0,0 +1,177 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Phase timing instrumentation shared by the scripts.
+The time spent per phase of a run (connect, every walk or RPC, parse, merge, evaluate) and the request
+counters (PDUs, RPCs, bytes) are kept in module dictionaries, reported as Nagios perfdata, and optionally
+appended to a log file as one JSON object per run. cProfile, and tracemalloc when the interpreter has it,
+can be enabled for a run. Without them the cost of a phase is two clock reads.
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+from collections import defaultdict
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None		# Python 2, the peak RSS is logged instead
+
+# Time in seconds spent per phase in this run
+timing = defaultdict(float)
+
+# Request counters of this run
+counters = defaultdict(int)
+
+# Profiler of this run, when --profile is set
+profiler = None
+
+
+class phase(object):
+	"""
+	Context manager adding the time spent in its block to phase name
+	"""
+	__slots__ = ('name', 'start')
+
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, type, value, traceback):
+		timing[self.name] += time.time() - self.start
+		return False
+
+
+def count(name, n=1):
+	"""
+	Adds n to request counter name
+	"""
+	counters[name] += n
+
+
+def reset():
+	"""
+	Clears the timing and counters, used by resident processes between runs
+	"""
+	timing.clear()
+	counters.clear()
+
+
+def addOptions(parser):
+	"""
+	Adds the instrumentation command line options to parser
+	"""
+	parser.add_option("-S", "--statistics",
+			  action="store_true",
+			  dest="statistics",
+			  default=False,
+			  help="report request counts and the time spent per phase, including perfdata")
+	parser.add_option("--timing-log",
+			  dest="timing_log",
+			  default='',
+			  help="append the timing and request counts of every run to this file as a JSON line",
+			  metavar="FILE")
+	parser.add_option("--profile",
+			  dest="profile",
+			  default='',
+			  help="profile the run with cProfile and write the statistics to this file (tracemalloc statistics to FILE.mem when available)",
+			  metavar="FILE")
+
+
+def start(profile=''):
+	"""
+	Starts the profilers of a run when a profile file is given
+	"""
+	global profiler
+	if len(profile) == 0: return
+	import cProfile
+	profiler = cProfile.Profile()
+	if tracemalloc is not None: tracemalloc.start()
+	profiler.enable()
+
+
+def stopProfile(profile):
+	"""
+	Stops the profilers and writes their statistics
+	"""
+	global profiler
+	if profiler is None: return
+	profiler.disable()
+	profiler.dump_stats(profile)
+	profiler = None
+	if tracemalloc is not None:
+		with open(profile + '.mem', 'w') as f:
+			for stat in tracemalloc.take_snapshot().statistics('lineno')[:50]:
+				f.write(str(stat) + '\n')
+		tracemalloc.stop()
+
+
+def formatPerfdata():
+	"""
+	Returns the phase timing and request counters as Nagios perfdata
+	"""
+	perfdata = ["{0}={1:.6f}s".format(name, timing[name]) for name in sorted(timing)]
+	for name in sorted(counters):
+		unit = ''
+		if name == 'bytes': unit = 'B'
+		perfdata.append("{0}={1}{2}".format(name, counters[name], unit))
+	return ' '.join(perfdata)
+
+
+def formatTiming():
+	"""
+	Returns a status line with the time spent per phase, including Nagios perfdata
+	"""
+	return "Timing: {0} | {1}".format(', '.join(["{0} {1:.3f}s".format(name, timing[name]) for name in sorted(timing)]),
+						formatPerfdata())
+
+
+def logRun(path, script, target, state, **fields):
+	"""
+	Appends the timing and counters of a run to the log file as a JSON line. Lines are written in one call
+	to a file opened in append mode, so concurrent processes do not interleave their lines.
+	"""
+	record = {'time' : time.time(), 'script' : script, 'target' : target, 'state' : state, 'pid' : os.getpid(),
+		'timing' : dict(timing), 'counters' : dict(counters),
+		'maxrss' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+	if tracemalloc is not None and tracemalloc.is_tracing():
+		record['peak_traced'] = tracemalloc.get_traced_memory()[1]
+	record.update(fields)
+	with open(path, 'a') as f:
+		f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def finish(options, target, state):
+	"""
+	Ends a run of a script using the options from addOptions: writes the log line and the profile
+	"""
+	if len(options.timing_log) > 0:
+		logRun(options.timing_log, os.path.basename(sys.argv[0]), target, state)
+	if len(options.profile) > 0:
+		stopProfile(options.profile)
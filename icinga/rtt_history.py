@@ -0,0 +1,202 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Persistent RTT history of check_ethping.py targets.
+Every target has a fixed size ring buffer in a memory-mapped file, holding the time and RTT of its
+last samples (lost probes included), so rolling statistics over many runs are available while each run
+only sends a few probes. Writers of the same target are serialized with a file lock.
+The RTT statistics reported by check_ethping.py and oam_exporter.py are computed here as well,
+and the RTTs are read from ethping output for check_ethping.py and check_ethtrace.py.
+"""
+
+import os
+import math
+import mmap
+import time
+import fcntl
+import struct
+
+# Directory holding the history files:
+history_dir="/var/tmp/ethping_history"
+
+# File header: magic, version, capacity and total number of samples appended
+header = struct.Struct('<4sIIQ')
+magic = 'RTTH'
+version = 1
+
+# Sample: time and RTT in ms, a negative RTT marks a lost probe
+record = struct.Struct('<dd')
+
+
+def historyPath(name):
+	"""
+	Returns the location of the history file of target name
+	"""
+	return os.path.join(history_dir, name.replace('/', '_').replace(':', '') + ".rtt")
+
+
+class RTTHistory:
+	"""
+	Ring buffer of the last capacity samples of a target
+	"""
+	def __init__(self, name, capacity):
+		if not os.path.isdir(history_dir):
+			try:
+				os.makedirs(history_dir)
+			except OSError:
+				pass		# created by a concurrent process
+		self.capacity = capacity
+		self.file = open(historyPath(name), 'a+b')
+		fcntl.flock(self.file, fcntl.LOCK_EX)
+		self.map = None
+		self.open()
+
+	def open(self):
+		self.file.seek(0, os.SEEK_END)
+		size = self.file.tell()
+		if size < header.size:
+			self.create([])
+			return
+
+		self.mmap(size)
+		(fileMagic, fileVersion, fileCapacity, total) = header.unpack_from(self.map, 0)
+		if fileMagic != magic or fileVersion != version or size != header.size + fileCapacity * record.size:
+			self.create([])
+		elif fileCapacity != self.capacity:
+			# Keep the newest samples when the history length is changed
+			requested = self.capacity
+			self.capacity = fileCapacity
+			samples = self.samples()
+			self.capacity = requested
+			self.create(samples)
+
+	def mmap(self, size):
+		if self.map is not None: self.map.close()
+		self.map = mmap.mmap(self.file.fileno(), size)
+
+	def create(self, samples):
+		"""
+		Recreates the file with the current capacity holding samples
+		"""
+		if self.map is not None: self.map.close()
+		self.map = None
+		size = header.size + self.capacity * record.size
+		self.file.truncate(0)
+		self.file.truncate(size)
+		self.mmap(size)
+		header.pack_into(self.map, 0, magic, version, self.capacity, 0)
+		self.append(samples[-self.capacity:])
+
+	def total(self):
+		return header.unpack_from(self.map, 0)[3]
+
+	def append(self, samples):
+		"""
+		Adds a list of (time, RTT) samples, RTT None for a lost probe
+		"""
+		total = self.total()
+		for (timestamp, rtt) in samples:
+			if rtt is None: rtt = -1.0
+			record.pack_into(self.map, header.size + (total % self.capacity) * record.size, timestamp, rtt)
+			total = total + 1
+		header.pack_into(self.map, 0, magic, version, self.capacity, total)
+
+	def samples(self, count=None):
+		"""
+		Returns the last count samples (all when not given) as (time, RTT) tuples, oldest first
+		"""
+		total = self.total()
+		available = min(total, self.capacity)
+		if count is None or count > available: count = available
+		result = []
+		for i in range(total - count, total):
+			(timestamp, rtt) = record.unpack_from(self.map, header.size + (i % self.capacity) * record.size)
+			if rtt < 0: rtt = None
+			result.append((timestamp, rtt))
+		return result
+
+	def close(self):
+		self.map.flush()
+		self.map.close()
+		fcntl.flock(self.file, fcntl.LOCK_UN)
+		self.file.close()
+
+
+def readHistory(path, count=None):
+	"""
+	Returns the last count samples of a history file without locking or changing it, oldest first.
+	Used by readers like the exporter, a sample being written concurrently may be missed.
+	"""
+	with open(path, 'rb') as f:
+		data = f.read()
+	if len(data) < header.size: return []
+	(fileMagic, fileVersion, capacity, total) = header.unpack_from(data, 0)
+	if fileMagic != magic or fileVersion != version or len(data) != header.size + capacity * record.size: return []
+	available = min(total, capacity)
+	if count is None or count > available: count = available
+	result = []
+	for i in range(total - count, total):
+		(timestamp, rtt) = record.unpack_from(data, header.size + (i % capacity) * record.size)
+		if rtt < 0: rtt = None
+		result.append((timestamp, rtt))
+	return result
+
+
+def percentile(values, p):
+	"""
+	Returns the p-th percentile of a sorted list of values (nearest rank)
+	"""
+	rank = int(math.ceil(p / 100.0 * len(values)))
+	return values[max(0, min(len(values), rank) - 1)]
+
+
+def rttStatistics(RTTlist, percentiles):
+	"""
+	Returns a dictionary with min, max, average, standard deviation, jitter and percentiles of a list of RTTs.
+	Jitter is the mean difference between consecutive RTTs.
+	"""
+	stats = {'rta' : 0.0, 'rtmin' : 0.0, 'rtmax' : 0.0, 'rtsd' : 0.0, 'jitter' : 0.0}
+	for p in percentiles: stats['p' + p] = 0.0
+	if len(RTTlist) == 0: return stats
+
+	stats['rta'] = sum(RTTlist) / len(RTTlist)
+	stats['rtmin'] = min(RTTlist)
+	stats['rtmax'] = max(RTTlist)
+	stats['rtsd'] = math.sqrt(sum([(rtt - stats['rta']) ** 2 for rtt in RTTlist]) / len(RTTlist))
+	if len(RTTlist) > 1:
+		stats['jitter'] = sum([abs(RTTlist[i] - RTTlist[i-1]) for i in range(1, len(RTTlist))]) / (len(RTTlist) - 1)
+	ordered = sorted(RTTlist)
+	for p in percentiles: stats['p' + p] = percentile(ordered, float(p))
+	return stats
+
+
+def parseRTT(line):
+	"""
+	Returns the round trip time in ms of an ethping reply line, or None for other lines
+	"""
+	if line.count("ms") == 0: return None
+	i = line[:line.rfind("ms")]
+	try:
+		return float(i[i.rfind(', ')+1:].strip(' '))
+	except ValueError:
+		return None
@@ -0,0 +1,307 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+SNMP walking engine shared by the check_cfm_state scripts.
+All walks of a run use one session per host, which resident processes keep for the next runs.
+For SNMP version 2 subtrees are walked using GETBULK requests. The number of repetitions per request
+is selected automatically per device, limited by the expected size of the response. Independent tables
+are walked concurrently on the session, each request carrying the next varbind of every unfinished column.
+Request timeouts are learned per host by host_health. Timed out requests are retried on the same session
+as long as the retry budget of the run allows, after which the session is marked as failed.
+PDU and varbind counts are kept in the stats dictionary.
+"""
+
+import time
+import netsnmp
+import phase_timing
+import host_health
+
+# Largest response size in bytes we want an agent to return, larger responses risk IP fragmentation
+max_response_size = 1400
+
+# Upper limit and initial value for automatically selected max-repetitions
+max_repetitions_cap = 50
+max_repetitions_initial = 10
+
+# Estimated BER overhead per varbind in a response (sequence, oid and value headers)
+varbind_overhead = 12
+
+# Request statistics of this run, kept with the phase timing
+stats = phase_timing.counters
+
+# max-repetitions learned per device
+learnedRepetitions = {}
+
+# Request timeout in seconds for hosts without known response times, and the limits of learned timeouts
+timeout_initial = 0.4
+timeout_min = 0.1
+timeout_max = 2.0
+
+# netsnmp error number of a request without response
+SNMPERR_TIMEOUT = -24
+
+# HostSessions kept open by resident processes (options.persistent set), indexed by host and SNMP options
+sessions = {}
+
+
+def buildSession(options, host, timeout):
+	"""
+	Returns a netsnmp session for host using the SNMP options of the check scripts and a timeout in seconds.
+	Retries are done by HostSession.request.
+	"""
+	return netsnmp.Session(	Version = int(options.version),
+				RemotePort=int(options.port),
+				DestHost=host,
+				Retries=0,
+				Timeout=int(timeout * 1000000),
+				Community=options.community,
+				UseLongNames=1)
+
+
+class HostSession(object):
+	"""
+	SNMP session of a host, set up once and used for every walk of a run
+	"""
+	def __init__(self, options, host):
+		self.options = options
+		self.host = host
+		self.timeout = None
+		self.prepare()
+
+	def prepare(self):
+		"""
+		Starts a run: resets the retry budget, and adopts the timeout learned for the host
+		"""
+		self.budget = int(self.options.retry_budget)
+		self.failed = False
+		timeout = host_health.timeout(self.options, self.host, 'snmp', timeout_initial, timeout_min, timeout_max)
+		if timeout != self.timeout:
+			self.timeout = timeout
+			self.session = buildSession(self.options, self.host, timeout)
+
+	def timedOut(self):
+		return self.session.ErrorNum == SNMPERR_TIMEOUT or self.session.ErrorStr == 'Timeout'
+
+	def request(self, call):
+		"""
+		Returns call(session), retrying on the same session when the request timed out and the retry budget
+		is not used up. call sends a single PDU, so its response time is learned as a round trip time.
+		A request which is never answered marks the session as failed.
+		"""
+		while True:
+			start = time.time()
+			result = call(self.session)
+			if not self.timedOut():
+				host_health.addSample(self.options, self.host, 'snmp', time.time() - start)
+				return result
+			if self.budget <= 0:
+				self.failed = True
+				return result
+			self.budget -= 1
+			stats['retries'] += 1
+
+	def walk(self, oid):
+		"""
+		Walks the subtree oid and returns the results
+		"""
+		return self.walkColumns([oid])
+
+	def walkColumns(self, columns):
+		"""
+		Walks only the given columns of a table and returns the results. With SNMP version 2 all columns
+		are retrieved in parallel, each GETBULK request carrying one varbind per column.
+		"""
+		if int(self.options.version) > 1:
+			return bulkwalk(self.options, self.host, columns, self)
+		result = []
+		for column in columns:
+			result.extend(snmpwalk(self.options, self.host, column, self))
+		return result
+
+	def walkTables(self, tables):
+		"""
+		Walks the columns of independent tables concurrently, and returns a list with the results of every table.
+		tables is a list of column lists. With SNMP version 2 the columns of all tables share the GETBULK requests,
+		so small tables are complete after the first requests and do not cost separate round trips.
+		"""
+		results = self.walkColumns([column for columns in tables for column in columns])
+		tableOf = {}
+		for i in range(len(tables)):
+			for column in tables[i]: tableOf[column] = i
+		partitioned = [[] for columns in tables]
+		for var in results:
+			partitioned[tableOf[var.tag]].append(var)
+		return partitioned
+
+
+def hostSession(options, host):
+	"""
+	Returns the HostSession of host. Resident processes keep the session for the next runs,
+	otherwise a new session is set up for the run.
+	"""
+	if not getattr(options, 'persistent', False):
+		return HostSession(options, host)
+	key = (host, options.port, options.version, options.community)
+	if key not in sessions:
+		sessions[key] = HostSession(options, host)
+	else:
+		sessions[key].prepare()
+	return sessions[key]
+
+
+def varbindSize(var):
+	"""
+	Estimates the encoded size of a response varbind
+	"""
+	return len(var.tag or '') + len(var.iid or '') + len(var.val or '') + varbind_overhead
+
+
+def inSubtree(var, root):
+	"""
+	Returns True when a varbind returned with long names is part of the subtree named root
+	"""
+	if var.type == 'ENDOFMIBVIEW' or var.tag is None:
+		return False
+	return root in var.tag.split('.')
+
+
+def shortenTag(var):
+	"""
+	Strips the MIB path from the tag of a varbind returned with long names, leaving the object name
+	"""
+	var.tag = var.tag.split('.')[-1]
+	return var
+
+
+def selectRepetitions(options, host, columns=1):
+	"""
+	Returns the max-repetitions to use for host, either the fixed value from the command line,
+	or the value learned from previous responses of this device
+	"""
+	if options.repetitions != 'auto':
+		return max(1, int(options.repetitions))
+	return max(1, learnedRepetitions.get(host, max_repetitions_initial) // columns)
+
+
+def learnRepetitions(host, varbinds, columns=1):
+	"""
+	Adjusts the max-repetitions of host so a response is expected to fit in max_response_size
+	"""
+	if len(varbinds) == 0: return
+	average = sum([varbindSize(var) for var in varbinds]) / float(len(varbinds))
+	fit = int(max_response_size / (average * columns)) * columns
+	learnedRepetitions[host] = max(columns, min(max_repetitions_cap, fit))
+
+
+def bulkwalk(options, host, oids, session=None):
+	"""
+	Walks the subtrees in oids in parallel using GETBULK requests carrying one varbind per subtree,
+	and returns the varbinds found in the subtrees. The walk of a subtree ends at the end of the MIB view,
+	at the first varbind outside the subtree, or when the agent stops responding.
+	Responses which are too big make the request repeat with less repetitions. session is the HostSession to use.
+	"""
+	if session is None: session = hostSession(options, host)
+	result = []
+	seen = set()
+	active = [(oid, netsnmp.Varbind(oid)) for oid in oids]
+	limit = None		# repetitions per subtree after a tooBig response, also caps a fixed --repetitions
+
+	while len(active) > 0:
+		repetitions = selectRepetitions(options, host, len(active))
+		if limit is not None: repetitions = min(repetitions, limit)
+		varlist = netsnmp.VarList(*[netsnmp.Varbind(last.tag, last.iid) for (oid, last) in active])
+		res = session.request(lambda snmp: snmp.getbulk(0, repetitions, varlist))
+		stats['pdus'] += 1
+
+		if session.session.ErrorNum == 1 and repetitions > 1:		# tooBig
+			limit = repetitions // 2
+			learnedRepetitions[host] = limit * len(active)
+			continue
+		if res is None or session.session.ErrorNum != 0 or len(varlist) == 0:
+			break
+
+		stats['varbinds'] += len(varlist)
+		stats['bytes'] += sum([varbindSize(var) for var in varlist])
+		learnRepetitions(host, varlist, len(active))
+
+		# The response holds the repetitions row by row, with one varbind per requested subtree in each row
+		finished = set()
+		for i in range(len(varlist)):
+			column = i % len(active)
+			if column in finished: continue
+			var = varlist[i]
+			if not inSubtree(var, active[column][0]) or (var.tag, var.iid) in seen:
+				finished.add(column)
+				continue
+			seen.add((var.tag, var.iid))
+			result.append(var)
+			active[column] = (active[column][0], var)
+		active = [active[column] for column in range(len(active)) if column not in finished]
+
+	return [shortenTag(var) for var in result]
+
+
+def snmpwalk(options, host, oid, session=None):
+	"""
+	Walks the subtree oid using GETNEXT requests on the HostSession session, used for SNMP version 1 agents.
+	Every request is sent, timed and retried on its own, so a timeout does not repeat the requests done before.
+	"""
+	if session is None: session = hostSession(options, host)
+	result = []
+	seen = set()
+	last = netsnmp.Varbind(oid)
+	while True:
+		varlist = netsnmp.VarList(netsnmp.Varbind(last.tag, last.iid))
+		res = session.request(lambda snmp: snmp.getnext(varlist))
+		stats['pdus'] += 1
+		if res is None or session.session.ErrorNum != 0:
+			break
+		last = varlist[0]
+		if not inSubtree(last, oid) or (last.tag, last.iid) in seen:
+			break
+		seen.add((last.tag, last.iid))
+		stats['varbinds'] += 1
+		stats['bytes'] += varbindSize(last)
+		result.append(last)
+	return [shortenTag(var) for var in result]
+
+
+def walk(options, host, oid):
+	"""
+	Does a snmp walk and returns the results. SNMP version 1 agents are walked with GETNEXT requests.
+	"""
+	return hostSession(options, host).walk(oid)
+
+
+def walkColumns(options, host, columns):
+	"""
+	Walks only the given columns of a table on the session of host and returns the results
+	"""
+	return hostSession(options, host).walkColumns(columns)
+
+
+def formatStatistics():
+	"""
+	Returns a status line with the request statistics of this run, the perfdata is part of the timing line
+	"""
+	return "SNMP statistics: {0} PDUs, {1} varbinds, ~{2} bytes, {3} retries".format(stats['pdus'], stats['varbinds'],
+											stats['bytes'], stats['retries'])
@@ -0,0 +1,69 @@
+# Copyright (c) 2013, Erik Ruiter, SURFsara BV, Amsterdam, The Netherlands
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions
+# and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions
+# and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Tests of the MEP table cache, run with: python -m unittest test_cfm_cache
+"""
+
+import shutil
+import tempfile
+import unittest
+import cfm_cache
+import cfm_drivers
+
+
+class Varbind(object):
+	def __init__(self, tag, iid, val):
+		self.tag = tag
+		self.iid = iid
+		self.val = val
+
+
+class CacheTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_non_ascii_mac(self):
+		"""
+		A 802.1ag MEP table holding MAC address octets >= 0x80 is cached and read back
+		"""
+		driver = cfm_drivers.Dot1agDriver()
+		driver.walkTables = lambda options, host, tables: (
+				[Varbind('dot1agCfmMdName', '1', 'MD1'), Varbind('dot1agCfmMdMdLevel', '1', '5')],
+				[Varbind('dot1agCfmMaNetName', '1.2', 'MA2')],
+				[Varbind('dot1agCfmMepDbRMepState', '1.2.3.4', '4'),
+				 Varbind('dot1agCfmMepDbMacAddress', '1.2.3.4', '\xb0\xa8\x6e\x01\xff\x80'),
+				 Varbind('dot1agCfmMepDbRdi', '1.2.3.4', '2'),
+				 Varbind('dot1agCfmMepDbPortStatusTlv', '1.2.3.4', '2'),
+				 Varbind('dot1agCfmMepDbInterfaceStatusTlv', '1.2.3.4', '1')])
+		fetch = lambda: driver.buildMEPDictionary(None, 'host')
+		cfm_cache.cachedFetch(self.directory, 'host', driver.name, 60, fetch)
+		cached = cfm_cache.cachedFetch(self.directory, 'host', driver.name, 60, None)
+		self.assertEqual(cached['1.2.3.4']['MacAddr'], 'b0:a8:6e:01:ff:80')
+		self.assertEqual(driver.checkMEP_CCM(cached['1.2.3.4']), 0)
+
+
+if __name__ == "__main__":
+	unittest.main()